@@ -0,0 +1,238 @@
+"""
+Resolucion descompuesta en sub-problemas independientes.
+
+Parte el grafo de candidatos persona-partido en componentes conexas: dos
+componentes no comparten personas, asi que la carga maxima y el solapamiento
+(restricciones por persona) no las acoplan. Cada grupo de componentes se
+resuelve con CP-SAT en un pool de procesos y los resultados se fusionan en
+una unica OptimizationResponse.
+
+El termino de equilibrio (max_load - min_load) es global: si pesa en el
+objetivo se resuelve el modelo completo.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from distance_matrix import DistanceMatrix
+from eligibility import build_eligibility
+
+if TYPE_CHECKING:
+    from models import (
+        Distance,
+        Match,
+        OptimizationResponse,
+        Person,
+        PriorAssignment,
+        SolverParameters,
+    )
+    from eligibility import PersonFeatures
+    from solver import CancelToken, Deadline
+
+
+def split_components(mask: np.ndarray) -> list[tuple[list[int], list[int]]]:
+    """Componentes conexas (personas, partidos) del grafo de candidatos.
+
+    Los partidos sin candidatos forman cada uno su propia componente; las
+    personas sin candidatos se descartan.
+    """
+    n_persons, n_matches = mask.shape
+    parent = list(range(n_persons + n_matches))
+
+    def find(node: int) -> int:
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for pi, mi in np.argwhere(mask).tolist():
+        root_p, root_m = find(pi), find(n_persons + mi)
+        if root_p != root_m:
+            parent[root_p] = root_m
+
+    components: dict[int, tuple[list[int], list[int]]] = {}
+    for mi in range(n_matches):
+        components.setdefault(find(n_persons + mi), ([], []))[1].append(mi)
+    for pi in range(n_persons):
+        component = components.get(find(pi))
+        if component is not None:
+            component[0].append(pi)
+    return list(components.values())
+
+
+def _pack_components(
+    components: list[tuple[list[int], list[int]]],
+    mask: np.ndarray,
+    n_groups: int,
+) -> list[tuple[list[int], list[int]]]:
+    """Reparte componentes en n_groups grupos equilibrados por numero de pares."""
+    sizes = [int(mask[np.ix_(ps, ms)].sum()) + len(ms) for ps, ms in components]
+    groups: list[tuple[list[int], list[int]]] = [([], []) for _ in range(n_groups)]
+    loads = [0] * n_groups
+    for ci in sorted(range(len(components)), key=lambda c: -sizes[c]):
+        target = loads.index(min(loads))
+        groups[target][0].extend(components[ci][0])
+        groups[target][1].extend(components[ci][1])
+        loads[target] += sizes[ci]
+    return [(sorted(ps), sorted(ms)) for ps, ms in groups if ms]
+
+
+def _hints_for(
+    hints: list[PriorAssignment] | None, matches: list[Match]
+) -> list[PriorAssignment] | None:
+    """Hints que afectan a los partidos de un grupo."""
+    if hints is None:
+        return None
+    match_ids = {m.id for m in matches}
+    return [h for h in hints if h.match_id in match_ids]
+
+
+def _solve_group(
+    matches: list[Match],
+    persons: list[Person],
+    distances: list[Distance] | DistanceMatrix,
+    parameters: SolverParameters,
+    num_workers: int,
+    hints: list[PriorAssignment] | None,
+    cancel: CancelToken | None,
+    deadline_at: float,
+) -> OptimizationResponse:
+    """Resuelve un grupo de componentes (se ejecuta en un proceso del pool)."""
+    from solver import Deadline, solve_cpsat
+
+    return solve_cpsat(
+        matches,
+        persons,
+        distances,
+        parameters,
+        num_workers=num_workers,
+        hints=hints,
+        cancel=cancel,
+        deadline=Deadline(deadline_at),
+        bounds=False,
+    )
+
+
+def solve_decomposed(
+    matches: list[Match],
+    persons: list[Person],
+    distances: list[Distance] | DistanceMatrix,
+    parameters: SolverParameters,
+    max_processes: int | None = None,  # cores disponibles (None = todos)
+    hints: list[PriorAssignment] | None = None,
+    cancel: CancelToken | None = None,
+    features: PersonFeatures | None = None,
+    deadline: Deadline | None = None,
+) -> OptimizationResponse:
+    """CP-SAT por componentes independientes en paralelo, con fallback global.
+
+    Cada grupo carga sus fases contra el mismo plazo en su proceso; aqui se
+    publican preprocess y solve (de todos los grupos, en paralelo).
+    """
+    from models import OptimizationResponse, SolverMetrics
+    from solver import Deadline, solve_cpsat
+
+    start = mark = time.time()
+    if deadline is None:
+        deadline = Deadline(start + parameters.max_time_seconds)
+    distance_matrix = DistanceMatrix.of(distances)
+    eligibility = build_eligibility(matches, persons, distance_matrix, features)
+    components = split_components(eligibility.mask)
+
+    cores = max_processes or os.cpu_count() or 1
+    n_groups = min(len(components), cores)
+
+    # El equilibrio de carga acopla a todas las personas: modelo global
+    if n_groups <= 1 or parameters.balance_weight > 0:
+        return solve_cpsat(
+            matches,
+            persons,
+            distance_matrix,
+            parameters,
+            num_workers=cores,
+            hints=hints,
+            cancel=cancel,
+            features=features,
+            deadline=deadline,
+        )
+
+    mark = deadline.charge("preprocess", mark)
+    groups = _pack_components(components, eligibility.mask, n_groups)
+    workers_per_group = max(1, cores // len(groups))
+
+    futures = []
+    with ProcessPoolExecutor(max_workers=len(groups)) as pool:
+        for person_ids, match_ids in groups:
+            sub_matches = [matches[mi] for mi in match_ids]
+            sub_persons = [persons[pi] for pi in person_ids]
+            futures.append(
+                pool.submit(
+                    _solve_group,
+                    sub_matches,
+                    sub_persons,
+                    distance_matrix,
+                    parameters,
+                    workers_per_group,
+                    _hints_for(hints, sub_matches),
+                    cancel,
+                    deadline.at,
+                )
+            )
+        results = [f.result() for f in futures]
+    deadline.charge("solve", mark)
+
+    # ── Fusionar resultados ─────────────────────────────────────────────────
+
+    match_order = {m.id: i for i, m in enumerate(matches)}
+    person_order = {p.id: i for i, p in enumerate(persons)}
+    assignments = sorted(
+        (a for r in results for a in r.assignments),
+        key=lambda a: (person_order[a.person_id], match_order[a.match_id]),
+    )
+    unassigned = sorted(
+        (u for r in results for u in r.unassigned),
+        key=lambda u: match_order[u.match_id],
+    )
+
+    statuses = {r.status for r in results}
+    if "cancelled" in statuses:
+        status = "cancelled"
+    elif statuses == {"optimal"}:
+        status = "optimal"
+    elif statuses <= {"optimal", "feasible"}:
+        status = "feasible"
+    else:
+        status = "partial" if assignments else "no_solution"
+
+    new_assignments = [a for a in assignments if a.is_new]
+    total_slots = sum(m.referees_needed + m.scorers_needed for m in matches)
+    covered = total_slots - len(unassigned)
+
+    return OptimizationResponse(
+        status=status,
+        assignments=assignments,
+        metrics=SolverMetrics(
+            total_cost=round(sum(a.travel_cost for a in new_assignments), 2),
+            coverage=round(covered / total_slots * 100, 1) if total_slots else 100,
+            covered_slots=covered,
+            total_slots=total_slots,
+            resolution_time_ms=int((time.time() - start) * 1000),
+            solver_type="cpsat",
+            subproblems=len(groups),
+            time_to_first_solution_ms=max(
+                (r.metrics.time_to_first_solution_ms or 0 for r in results), default=None
+            ),
+            warm_start=any(r.metrics.warm_start for r in results),
+            phase_ms=dict(deadline.phases),
+            degraded=next(
+                (r.metrics.degraded for r in results if r.metrics.degraded), None
+            ),
+        ),
+        unassigned=unassigned,
+    )
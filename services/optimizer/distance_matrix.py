@@ -0,0 +1,110 @@
+"""
+Matriz densa de distancias entre municipios.
+
+Los ids de municipio se internan a enteros y km, coste y coste escalado
+(con y sin penalizacion por no tener coche) se guardan en arrays NumPy
+(N x N) calculados una vez por conjunto de distancias. Personas y sedes
+se codifican a indices de municipio y cada par se consulta por indexado
+de arrays, sin guardar matrices persona x partido.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from models import Distance
+
+# Distancia supuesta cuando el par de municipios no esta en la tabla
+DEFAULT_KM = 35.0
+# Coste fijo dentro del mismo municipio
+SAME_MUNICIPALITY_COST = 3.0
+# Euros por km
+COST_PER_KM = 0.1
+# Sin coche, los desplazamientos de mas de NO_CAR_KM cuestan el doble
+NO_CAR_KM = 15
+
+
+def travel_cost_for_km(km: float) -> float:
+    """Coste de desplazamiento entre municipios distintos (redondeo de Python)."""
+    return round(km * COST_PER_KM, 2)
+
+
+class DistanceMatrix:
+    """Distancias y costes entre municipios indexados por entero."""
+
+    def __init__(self, municipality_ids: list[str], km: np.ndarray) -> None:
+        from solver import COST_SCALE
+
+        self.index = {mid: i for i, mid in enumerate(municipality_ids)}
+        self.km = km
+        # round() de Python una vez por valor distinto (np.round no redondea igual)
+        unique_km, inverse = np.unique(km, return_inverse=True)
+        unique_cost = np.array(
+            [travel_cost_for_km(k) for k in unique_km.tolist()], dtype=np.float64
+        )
+        self.cost = unique_cost[inverse.reshape(km.shape)]
+        np.fill_diagonal(self.cost, SAME_MUNICIPALITY_COST)
+        np.fill_diagonal(self.km, 0.0)
+
+        # Mismo redondeo que int(cost * COST_SCALE) e int(x * 2.0)
+        self.cost_scaled = (self.cost * COST_SCALE).astype(np.int64)
+        self.cost_scaled_no_car = np.where(
+            self.km > NO_CAR_KM,
+            (self.cost_scaled * 2.0).astype(np.int64),
+            self.cost_scaled,
+        )
+
+    @classmethod
+    def of(cls, distances: list[Distance] | DistanceMatrix) -> DistanceMatrix:
+        """Acepta una tabla ya construida (conjunto subido) o la lista de la peticion."""
+        if isinstance(distances, DistanceMatrix):
+            return distances
+        return cls.from_distances(distances)
+
+    @classmethod
+    def from_distances(cls, distances: list[Distance]) -> DistanceMatrix:
+        """Tabla simetrica a partir de la lista de distancias de la peticion."""
+        index: dict[str, int] = {}
+        for d in distances:
+            index.setdefault(d.origin_id, len(index))
+            index.setdefault(d.dest_id, len(index))
+        km = np.full((len(index), len(index)), DEFAULT_KM, dtype=np.float64)
+        if distances:
+            # Ida y vuelta intercaladas por entrada: la ultima entrada de un par
+            # gana en ambos sentidos
+            origins = [index[d.origin_id] for d in distances]
+            dests = [index[d.dest_id] for d in distances]
+            rows = np.array([origins, dests], dtype=np.int64).T.reshape(-1)
+            cols = np.array([dests, origins], dtype=np.int64).T.reshape(-1)
+            values = np.repeat([d.distance_km for d in distances], 2)
+            km[rows, cols] = values
+        return cls(list(index), km)
+
+    def codes(
+        self, origin_ids: list[str], dest_ids: list[str]
+    ) -> tuple[DistanceMatrix, np.ndarray, np.ndarray]:
+        """Tabla y codigos enteros de origenes y destinos.
+
+        Los municipios fuera de la tabla se anaden en una copia (solo
+        coinciden consigo mismos; con cualquier otro se asume DEFAULT_KM).
+        """
+        unknown = [
+            mid for mid in dict.fromkeys([*origin_ids, *dest_ids]) if mid not in self.index
+        ]
+        matrix = self
+        if unknown:
+            n_known = len(self.index)
+            size = n_known + len(unknown)
+            km = np.full((size, size), DEFAULT_KM, dtype=np.float64)
+            km[:n_known, :n_known] = self.km
+            matrix = DistanceMatrix([*self.index, *unknown], km)
+
+        def encode(ids: list[str]) -> np.ndarray:
+            return np.array([matrix.index[mid] for mid in ids], dtype=np.int64).reshape(
+                len(ids)
+            )
+
+        return matrix, encode(origin_ids), encode(dest_ids)
@@ -0,0 +1,70 @@
+"""
+Conjuntos de distancias subidos una vez y referenciados por version.
+
+El cliente sube la lista de distancias con POST /distances y recibe un hash
+de contenido; las peticiones de optimizacion lo indican en distance_set_id
+en lugar de reenviar (y revalidar) decenas de miles de objetos Distance. El
+servicio guarda la DistanceMatrix ya construida en un LRU por version.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from distance_matrix import DistanceMatrix
+
+if TYPE_CHECKING:
+    from models import Distance, DistanceSetInfo
+
+# Conjuntos de distancias que se mantienen en memoria
+DEFAULT_MAX_SETS = 8
+
+
+def distance_set_id(distances: list[Distance]) -> str:
+    """Hash del contenido (en orden: con pares repetidos gana el ultimo)."""
+    payload = json.dumps(
+        [[d.origin_id, d.dest_id, d.distance_km] for d in distances],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class DistanceStore:
+    """LRU de DistanceMatrix por version."""
+
+    def __init__(self, max_sets: int | None = None) -> None:
+        self.max_sets = max_sets or int(
+            os.environ.get("OPTIMIZER_DISTANCE_SETS", DEFAULT_MAX_SETS)
+        )
+        self._sets: OrderedDict[str, tuple[DistanceMatrix, int]] = OrderedDict()
+
+    def put(self, distances: list[Distance]) -> DistanceSetInfo:
+        """Registra un conjunto; si ya existe solo lo marca como reciente."""
+        set_id = distance_set_id(distances)
+        if set_id not in self._sets:
+            self._sets[set_id] = (DistanceMatrix.from_distances(distances), len(distances))
+            while len(self._sets) > self.max_sets:
+                self._sets.popitem(last=False)
+        return self.info(set_id)
+
+    def get(self, set_id: str) -> DistanceMatrix | None:
+        entry = self._sets.get(set_id)
+        if entry is None:
+            return None
+        self._sets.move_to_end(set_id)
+        return entry[0]
+
+    def info(self, set_id: str) -> DistanceSetInfo | None:
+        from models import DistanceSetInfo
+
+        entry = self._sets.get(set_id)
+        if entry is None:
+            return None
+        matrix, pairs = entry
+        return DistanceSetInfo(
+            distance_set_id=set_id, municipalities=len(matrix.index), pairs=pairs
+        )
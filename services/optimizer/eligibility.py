@@ -0,0 +1,424 @@
+"""
+Matriz de elegibilidad persona x partido.
+
+Precalcula en bloque (NumPy) que pares (persona, partido) son factibles y su
+coste de desplazamiento. La consumen el solver CP-SAT y el greedy, que asi no
+repiten los filtros de rol, categoria, disponibilidad e incompatibilidades
+par a par.
+
+Personas y partidos se convierten una vez por peticion en tablas columnares
+(PersonFeatures, MatchFeatures); ninguna fase posterior vuelve a leer los
+modelos pydantic para rol, categoria, fecha, hora, sede o equipos.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from incompatibility import IncompatibilityIndex, normalize_team
+
+if TYPE_CHECKING:
+    from distance_matrix import DistanceMatrix
+    from models import Match, Person
+
+# Codigos numericos de rol para las mascaras vectorizadas
+ROLE_CODES = {"arbitro": 0, "anotador": 1}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+# Dia de disponibilidad: (week_start, dia de la semana); week_start "" = todas
+DayKey = tuple[str, int]
+# Bitmap de un dia: un bit por minuto, empaquetado (little endian)
+MINUTES_PER_DAY = 24 * 60
+DAY_BYTES = MINUTES_PER_DAY // 8
+
+
+@dataclass
+class PersonFeatures:
+    """Datos por persona que no dependen de los partidos, ya parseados.
+
+    Las filas siguen el orden de la lista de personas. El registro de
+    plantillas los mantiene precalculados y los actualiza fila a fila.
+    """
+
+    ids: list[str]
+    role: np.ndarray  # int8 (P,)
+    active: np.ndarray  # bool (P,)
+    rank: np.ndarray  # int8 (P,): CATEGORY_RANK
+    has_car: np.ndarray  # bool (P,)
+    municipality_ids: list[str]
+    incompatible: list[tuple[str, ...]]  # equipos normalizados (normalize_team)
+    # Disponibilidad compilada: columna de cada (semana, dia) en availability
+    availability_days: dict[DayKey, int]
+    availability: np.ndarray  # uint8 (P, D, DAY_BYTES): minutos disponibles
+    has_windows: np.ndarray  # bool (P,): False = siempre disponible
+
+    @classmethod
+    def from_persons(cls, persons: list[Person]) -> PersonFeatures:
+        from solver import CATEGORY_RANK
+
+        n_persons = len(persons)
+        days, availability = _compile_availability(persons)
+        return cls(
+            ids=[p.id for p in persons],
+            role=np.array(
+                [ROLE_CODES.get(p.role, -1) for p in persons], dtype=np.int8
+            ).reshape(n_persons),
+            active=np.array([p.active for p in persons], dtype=bool).reshape(n_persons),
+            rank=np.array(
+                [CATEGORY_RANK.get(p.category or "", 0) for p in persons], dtype=np.int8
+            ).reshape(n_persons),
+            has_car=np.array([p.has_car for p in persons], dtype=bool).reshape(n_persons),
+            municipality_ids=[p.municipality_id for p in persons],
+            incompatible=[
+                tuple(normalize_team(inc.team_name) for inc in p.incompatibilities)
+                for p in persons
+            ],
+            availability_days=days,
+            availability=availability,
+            has_windows=np.array(
+                [bool(p.availabilities) for p in persons], dtype=bool
+            ).reshape(n_persons),
+        )
+
+    def updated(self, rows: dict[int, Person]) -> PersonFeatures:
+        """Copia con las filas indicadas recalculadas (el resto se reutiliza)."""
+        changed = PersonFeatures.from_persons(list(rows.values()))
+        positions = np.array(list(rows), dtype=np.int64)
+        days, (availability, changed_availability) = _merge_days(
+            (self.availability_days, self.availability),
+            (changed.availability_days, changed.availability),
+        )
+        features = PersonFeatures(
+            ids=list(self.ids),
+            role=self.role.copy(),
+            active=self.active.copy(),
+            rank=self.rank.copy(),
+            has_car=self.has_car.copy(),
+            municipality_ids=list(self.municipality_ids),
+            incompatible=list(self.incompatible),
+            availability_days=days,
+            availability=availability.copy(),
+            has_windows=self.has_windows.copy(),
+        )
+        for array in ("role", "active", "rank", "has_car", "has_windows"):
+            getattr(features, array)[positions] = getattr(changed, array)
+        features.availability[positions] = changed_availability
+        for k, pi in enumerate(rows):
+            features.ids[pi] = changed.ids[k]
+            features.municipality_ids[pi] = changed.municipality_ids[k]
+            features.incompatible[pi] = changed.incompatible[k]
+        return features
+
+    def extended(self, persons: list[Person]) -> PersonFeatures:
+        """Copia con personas nuevas anadidas al final."""
+        added = PersonFeatures.from_persons(persons)
+        days, (availability, added_availability) = _merge_days(
+            (self.availability_days, self.availability),
+            (added.availability_days, added.availability),
+        )
+        return PersonFeatures(
+            ids=self.ids + added.ids,
+            role=np.concatenate([self.role, added.role]),
+            active=np.concatenate([self.active, added.active]),
+            rank=np.concatenate([self.rank, added.rank]),
+            has_car=np.concatenate([self.has_car, added.has_car]),
+            municipality_ids=self.municipality_ids + added.municipality_ids,
+            incompatible=self.incompatible + added.incompatible,
+            availability_days=days,
+            availability=np.concatenate([availability, added_availability]),
+            has_windows=np.concatenate([self.has_windows, added.has_windows]),
+        )
+
+    def select(self, indices: list[int]) -> PersonFeatures:
+        """Subconjunto de filas, en el orden indicado."""
+        positions = np.array(indices, dtype=np.int64).reshape(len(indices))
+        return PersonFeatures(
+            ids=[self.ids[i] for i in indices],
+            role=self.role[positions],
+            active=self.active[positions],
+            rank=self.rank[positions],
+            has_car=self.has_car[positions],
+            municipality_ids=[self.municipality_ids[i] for i in indices],
+            incompatible=[self.incompatible[i] for i in indices],
+            availability_days=self.availability_days,
+            availability=self.availability[positions],
+            has_windows=self.has_windows[positions],
+        )
+
+    @cached_property
+    def incompatibility(self) -> IncompatibilityIndex:
+        """Automata de equipos incompatibles (se construye una vez por tabla)."""
+        return IncompatibilityIndex(self.incompatible)
+
+    def available_at(self, week_start: str, day_of_week: int, minute: int) -> np.ndarray:
+        """Disponibilidad (P,) de todas las personas en un minuto concreto.
+
+        Cuentan las franjas de esa semana y las que no fijan semana.
+        """
+        byte, bit = divmod(minute, 8)
+        available = ~self.has_windows
+        for key in ((week_start, day_of_week), ("", day_of_week)):
+            column = self.availability_days.get(key)
+            if column is not None:
+                available |= ((self.availability[:, column, byte] >> bit) & 1).astype(bool)
+        return available
+
+
+def _compile_availability(
+    persons: list[Person],
+) -> tuple[dict[DayKey, int], np.ndarray]:
+    """Bitmaps por minuto de las franjas de disponibilidad de cada persona."""
+    from solver import _time_to_minutes
+
+    days: dict[DayKey, int] = {}
+    rows: list[tuple[int, int, int, int]] = []  # (persona, columna, inicio, fin)
+    for pi, person in enumerate(persons):
+        for avail in person.availabilities:
+            column = days.setdefault((avail.week_start, avail.day_of_week), len(days))
+            start = max(0, _time_to_minutes(avail.start_time))
+            end = min(MINUTES_PER_DAY, _time_to_minutes(avail.end_time))
+            if start < end:
+                rows.append((pi, column, start, end))
+
+    # Solo se expanden a minutos los pares (persona, dia) con franjas
+    cells: dict[tuple[int, int], int] = {}
+    for pi, column, _, _ in rows:
+        cells.setdefault((pi, column), len(cells))
+    minutes = np.zeros((len(cells), MINUTES_PER_DAY), dtype=bool)
+    for pi, column, start, end in rows:
+        minutes[cells[pi, column], start:end] = True
+
+    availability = np.zeros((len(persons), len(days), DAY_BYTES), dtype=np.uint8)
+    if cells:
+        persons_idx, columns = np.array(list(cells), dtype=np.int64).T
+        availability[persons_idx, columns] = np.packbits(minutes, axis=1, bitorder="little")
+    return days, availability
+
+
+def _merge_days(
+    *tables: tuple[dict[DayKey, int], np.ndarray],
+) -> tuple[dict[DayKey, int], list[np.ndarray]]:
+    """Alinea las columnas de dia de varios bitmaps sobre la union de dias."""
+    days: dict[DayKey, int] = {}
+    for table_days, _ in tables:
+        for key in table_days:
+            days.setdefault(key, len(days))
+    aligned = []
+    for table_days, bitmap in tables:
+        if list(table_days) == list(days):
+            aligned.append(bitmap)
+            continue
+        out = np.zeros((bitmap.shape[0], len(days), DAY_BYTES), dtype=np.uint8)
+        out[:, [days[key] for key in table_days]] = bitmap
+        aligned.append(out)
+    return days, aligned
+
+
+@dataclass
+class MatchFeatures:
+    """Datos por partido ya parseados: tabla columnar interna de la peticion.
+
+    Se construye una vez en build_eligibility y la usan todas las fases de
+    los solvers en lugar de volver a leer los modelos pydantic.
+    """
+
+    ids: list[str]
+    day: np.ndarray  # int32 (M,): fecha internada (mismo codigo = mismo dia)
+    weekday: np.ndarray  # int8 (M,): 0=lunes..6=domingo, -1 = fecha invalida
+    week_start: list[str]  # lunes de la semana ("" = fecha invalida)
+    start_minute: np.ndarray  # int32 (M,): minutos desde medianoche
+    min_rank: np.ndarray  # int8 (M,): CATEGORY_RANK minima de arbitro
+    needed: np.ndarray  # int32 (M, 2): plazas por codigo de rol
+    municipality_ids: list[str]
+    teams: list[tuple[str, str]]  # local y visitante normalizados (normalize_team)
+
+    @classmethod
+    def from_matches(cls, matches: list[Match]) -> MatchFeatures:
+        from solver import CATEGORY_RANK, _get_week_start, _time_to_minutes
+
+        n_matches = len(matches)
+        days: dict[str, int] = {}
+        weekdays: list[int] = []
+        for m in matches:
+            try:
+                weekdays.append(date.fromisoformat(m.date).weekday())
+            except (ValueError, TypeError):
+                weekdays.append(-1)
+        return cls(
+            ids=[m.id for m in matches],
+            day=np.array(
+                [days.setdefault(m.date, len(days)) for m in matches], dtype=np.int32
+            ).reshape(n_matches),
+            weekday=np.array(weekdays, dtype=np.int8).reshape(n_matches),
+            week_start=[_get_week_start(m.date) for m in matches],
+            start_minute=np.array(
+                [_time_to_minutes(m.time) for m in matches], dtype=np.int32
+            ).reshape(n_matches),
+            min_rank=np.array(
+                [CATEGORY_RANK.get(m.competition.min_ref_category, 0) for m in matches],
+                dtype=np.int8,
+            ).reshape(n_matches),
+            needed=np.array(
+                [(m.referees_needed, m.scorers_needed) for m in matches], dtype=np.int32
+            ).reshape(n_matches, len(ROLE_CODES)),
+            municipality_ids=[m.venue.municipality_id for m in matches],
+            teams=[
+                (normalize_team(m.home_team), normalize_team(m.away_team))
+                for m in matches
+            ],
+        )
+
+    @property
+    def start_hour(self) -> np.ndarray:
+        """Hora de inicio truncada (solapamiento por horas, como el frontend)."""
+        return self.start_minute // 60
+
+
+@dataclass
+class Eligibility:
+    """Factibilidad (personas x partidos) y costes por par para una peticion.
+
+    Solo la mascara es una matriz por par; coste y distancia se consultan en
+    la tabla de municipios con los codigos de persona y sede (indices con
+    broadcasting de NumPy: escalares, vectores de pares o np.ix_).
+    """
+
+    mask: np.ndarray  # bool (P, M): par factible
+    person_role: np.ndarray  # int8 (P,): codigo de rol
+    has_car: np.ndarray  # bool (P,)
+    matches: MatchFeatures
+    distances: DistanceMatrix  # incluye los municipios desconocidos de la peticion
+    person_muni: np.ndarray  # int64 (P,): codigo de municipio en distances
+    match_muni: np.ndarray  # int64 (M,): codigo del municipio de la sede
+
+    def travel_cost(self, pi, mi) -> np.ndarray:
+        """Coste en euros."""
+        return self.distances.cost[self.person_muni[pi], self.match_muni[mi]]
+
+    def distance_km(self, pi, mi) -> np.ndarray:
+        """Distancia en km."""
+        return self.distances.km[self.person_muni[pi], self.match_muni[mi]]
+
+    def cost_scaled(self, pi, mi) -> np.ndarray:
+        """Coste entero para CP-SAT (doble sin coche y > NO_CAR_KM)."""
+        origin, dest = self.person_muni[pi], self.match_muni[mi]
+        return np.where(
+            self.has_car[pi],
+            self.distances.cost_scaled[origin, dest],
+            self.distances.cost_scaled_no_car[origin, dest],
+        )
+
+    def no_car_penalty(self, pi, mi) -> np.ndarray:
+        """Sin coche y mas de NO_CAR_KM."""
+        from distance_matrix import NO_CAR_KM
+
+        return ~self.has_car[pi] & (self.distance_km(pi, mi) > NO_CAR_KM)
+
+    def candidates(self, mi: int, role: str) -> np.ndarray:
+        """Indices de personas factibles para el partido mi con el rol dado."""
+        column = self.mask[:, mi] & (self.person_role == ROLE_CODES[role])
+        return np.flatnonzero(column)
+
+    def interchangeable_classes(self, exclude: set[int]) -> list[list[int]]:
+        """Grupos (>1) de personas indistinguibles para el modelo.
+
+        Dos personas son intercambiables si tienen el mismo rol, la misma fila
+        de factibilidad y el mismo coste en cada partido factible; municipio y
+        coche determinan la fila de coste, asi que no hace falta calcularla.
+        exclude son personas fijadas por designaciones o hints.
+        """
+        if self.mask.shape[0] < 2:
+            return []
+        rows = np.packbits(self.mask, axis=1)
+        classes: dict[tuple, list[int]] = {}
+        for pi, (role, muni, car) in enumerate(
+            zip(self.person_role.tolist(), self.person_muni.tolist(), self.has_car.tolist())
+        ):
+            if pi not in exclude and self.mask[pi].any():
+                key = (role, muni, car, rows[pi].tobytes())
+                classes.setdefault(key, []).append(pi)
+        return [members for members in classes.values() if len(members) > 1]
+
+
+def build_eligibility(
+    matches: list[Match],
+    persons: list[Person],
+    distances: DistanceMatrix,
+    features: PersonFeatures | None = None,
+) -> Eligibility:
+    """Construye mascara de factibilidad y matrices de coste en bloque.
+
+    features: datos por persona precalculados (registro de plantillas); se
+    recalculan si no se pasan o no corresponden a persons.
+    """
+    if features is None or features.ids != [p.id for p in persons]:
+        features = PersonFeatures.from_persons(persons)
+    match_features = MatchFeatures.from_matches(matches)
+
+    person_role = features.role
+    needs_referee = match_features.needed[:, ROLE_CODES["arbitro"]] > 0
+    needs_scorer = match_features.needed[:, ROLE_CODES["anotador"]] > 0
+
+    is_referee = person_role == ROLE_CODES["arbitro"]
+    is_scorer = person_role == ROLE_CODES["anotador"]
+
+    # Filtro rol: la persona cubre un rol que el partido necesita
+    mask = (is_referee[:, None] & needs_referee[None, :]) | (
+        is_scorer[:, None] & needs_scorer[None, :]
+    )
+    mask &= features.active[:, None]
+
+    # Filtro categoria minima (solo arbitros)
+    mask &= ~is_referee[:, None] | (
+        features.rank[:, None] >= match_features.min_rank[None, :]
+    )
+
+    mask &= _availability_matrix(match_features, features)
+    mask &= ~features.incompatibility.blocked(match_features.teams)
+
+    distances, person_muni, match_muni = distances.codes(
+        features.municipality_ids, match_features.municipality_ids
+    )
+
+    return Eligibility(
+        mask=mask,
+        person_role=person_role,
+        has_car=features.has_car,
+        matches=match_features,
+        distances=distances,
+        person_muni=person_muni,
+        match_muni=match_muni,
+    )
+
+
+# ── Filtros por bloques ─────────────────────────────────────────────────────
+
+
+def _availability_matrix(matches: MatchFeatures, features: PersonFeatures) -> np.ndarray:
+    """Disponibilidad (P, M): una consulta vectorizada por franja (semana, dia, minuto)."""
+    available = np.ones((len(features.ids), len(matches.ids)), dtype=bool)
+    if not features.has_windows.any():
+        return available
+
+    # Agrupar partidos por franja: los de fecha invalida quedan disponibles
+    slot_matches: dict[tuple[str, int, int], list[int]] = {}
+    for mi, (week, dow, minute) in enumerate(
+        zip(matches.week_start, matches.weekday.tolist(), matches.start_minute.tolist())
+    ):
+        if dow < 0:
+            continue
+        if not 0 <= minute < MINUTES_PER_DAY:
+            # Hora fuera del dia: ninguna franja la cubre
+            available[:, mi] = ~features.has_windows
+            continue
+        slot_matches.setdefault((week, dow, minute), []).append(mi)
+
+    for (week, dow, minute), columns in slot_matches.items():
+        available[:, columns] = features.available_at(week, dow, minute)[:, None]
+
+    return available
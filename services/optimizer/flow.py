@@ -0,0 +1,280 @@
+"""
+Solver rapido por flujo de coste minimo.
+
+Sin solapamiento ni equilibrio de carga, la asignacion es un problema de
+transporte: origen → persona (capacidad max_matches_per_person) → plaza
+(partido, rol) con coste de desplazamiento → sumidero (plazas necesarias).
+SimpleMinCostFlow lo resuelve en milisegundos maximizando primero las plazas
+cubiertas y despues minimizando el coste, como las prioridades de CP-SAT.
+
+La solucion de la relajacion se repara: por persona se conservan las
+asignaciones sin solape en orden de inicio y las plazas que quedan libres se
+rellenan con el criterio del greedy. Cobertura y coste de la relajacion son
+ademas cotas para cualquier solucion (CP-SAT las publica con
+parameters.relaxation_bounds).
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+from ortools.graph.python import min_cost_flow
+
+from distance_matrix import DistanceMatrix
+from eligibility import ROLE_CODES, ROLE_NAMES, build_eligibility
+
+if TYPE_CHECKING:
+    from eligibility import Eligibility, PersonFeatures
+    from models import (
+        Distance,
+        Match,
+        OptimizationResponse,
+        Person,
+        SolverParameters,
+    )
+    from solver import CancelToken, Deadline
+
+
+@dataclass
+class Relaxation:
+    """Solucion del problema de transporte (sin solapes ni equilibrio)."""
+
+    pairs: np.ndarray  # int64 (K, 2): (persona, partido) elegidos, nuevos
+    designated: list[tuple[int, int]]  # designaciones fijadas (persona, partido)
+    covered_slots: int  # cota superior de plazas cubiertas
+    cost: float  # coste de las nuevas con esa cobertura (euros, penalizacion sin coche)
+
+
+def solve_relaxation(
+    matches: list[Match],
+    persons: list[Person],
+    eligibility: Eligibility,
+    parameters: SolverParameters,
+) -> Relaxation:
+    """Flujo maximo de coste minimo sobre los pares factibles."""
+    from solver import COST_SCALE
+
+    n_persons = eligibility.mask.shape[0]
+    demand = eligibility.matches.needed.copy()  # (M, 2)
+    capacity = np.full(n_persons, parameters.max_matches_per_person, dtype=np.int64)
+    mask = eligibility.mask.copy()
+
+    # Designaciones existentes factibles (como force_existing en CP-SAT):
+    # ocupan plaza y capacidad y no se re-asignan
+    designated: list[tuple[int, int]] = []
+    if parameters.force_existing:
+        person_idx = {p.id: pi for pi, p in enumerate(persons)}
+        for mi, match in enumerate(matches):
+            for d in match.designations:
+                pi = person_idx.get(d.person_id)
+                if pi is None or not mask[pi, mi]:
+                    continue
+                designated.append((pi, mi))
+                code = eligibility.person_role[pi]
+                demand[mi, code] = max(0, demand[mi, code] - 1)
+                capacity[pi] = max(0, capacity[pi] - 1)
+                mask[pi, mi] = False
+
+    pairs = np.argwhere(mask)
+    fixed_slots = int(eligibility.matches.needed.sum() - demand.sum())
+    total = int(demand.sum())
+    if total == 0 or len(pairs) == 0:
+        return Relaxation(
+            pairs=np.empty((0, 2), dtype=np.int64),
+            designated=designated,
+            covered_slots=fixed_slots,
+            cost=0.0,
+        )
+
+    # Nodos: 0 origen, 1 sumidero, 2.. personas, despues plazas (partido, rol)
+    source, sink = 0, 1
+    person_node = 2 + np.arange(n_persons, dtype=np.int64)
+    slot_base = 2 + n_persons
+    pi, mi = pairs[:, 0], pairs[:, 1]
+    pair_slot = slot_base + mi * len(ROLE_CODES) + eligibility.person_role[pi]
+
+    slots = np.flatnonzero(demand.reshape(-1) > 0)
+    flow = min_cost_flow.SimpleMinCostFlow()
+    flow.add_arcs_with_capacity_and_unit_cost(
+        np.concatenate(
+            [np.full(n_persons, source), person_node[pi], slot_base + slots]
+        ),
+        np.concatenate([person_node, pair_slot, np.full(len(slots), sink)]),
+        np.concatenate(
+            [capacity, np.ones(len(pairs), dtype=np.int64), demand.reshape(-1)[slots]]
+        ),
+        np.concatenate(
+            [
+                np.zeros(n_persons, dtype=np.int64),
+                eligibility.cost_scaled(pi, mi).astype(np.int64),
+                np.zeros(len(slots), dtype=np.int64),
+            ]
+        ),
+    )
+    flow.set_node_supply(source, total)
+    flow.set_node_supply(sink, -total)
+
+    status = flow.solve_max_flow_with_min_cost()
+    if status != flow.OPTIMAL:
+        raise RuntimeError(f"Min cost flow fallo con estado {status}")
+
+    arcs = n_persons + np.arange(len(pairs), dtype=np.int64)
+    chosen = pairs[flow.flows(arcs) > 0]
+    return Relaxation(
+        pairs=chosen,
+        designated=designated,
+        covered_slots=fixed_slots + len(chosen),
+        cost=round(
+            float(eligibility.cost_scaled(chosen[:, 0], chosen[:, 1]).sum()) / COST_SCALE,
+            2,
+        ),
+    )
+
+
+def solve_flow(
+    matches: list[Match],
+    persons: list[Person],
+    distances: list[Distance] | DistanceMatrix,
+    parameters: SolverParameters,
+    cancel: CancelToken | None = None,
+    features: PersonFeatures | None = None,
+    deadline: Deadline | None = None,
+) -> OptimizationResponse:
+    """Relajacion de transporte + reparacion de solapes (heuristico, no optimo).
+
+    deadline: preprocesado, flujo y reparacion se cargan contra el; con el
+    plazo agotado no se resuelve el flujo ni se rellenan mas plazas.
+    """
+    from models import (
+        OptimizationResponse,
+        ProposedAssignment,
+        SolverMetrics,
+        UnassignedSlot,
+    )
+    from solver import Deadline, _find_best, _GreedyState
+
+    start = mark = time.time()
+    if deadline is None:
+        deadline = Deadline(start + parameters.max_time_seconds)
+    distance_matrix = DistanceMatrix.of(distances)
+    eligibility = build_eligibility(matches, persons, distance_matrix, features)
+    total_slots = int(eligibility.matches.needed.sum())
+    mark = deadline.charge("preprocess", mark)
+
+    cancelled = cancel is not None and cancel.is_set()
+    expired = deadline.expired()
+    if cancelled or expired:
+        relaxation = None
+    else:
+        relaxation = solve_relaxation(matches, persons, eligibility, parameters)
+        mark = deadline.charge("solve", mark)
+
+    # ── Reparar solapes ─────────────────────────────────────────────────────
+
+    state = _GreedyState(eligibility.matches, persons)
+    filled = np.zeros_like(eligibility.matches.needed)
+    kept: list[tuple[int, int, bool]] = []  # (persona, partido, es nueva)
+    if relaxation is not None:
+        for pi, mi in relaxation.designated:
+            state.book(pi, mi)
+            filled[mi, eligibility.person_role[pi]] += 1
+            kept.append((pi, mi, False))
+
+        # En orden de inicio: por persona se conserva el maximo de partidos sin
+        # solape (intervalos de igual duracion)
+        starts = eligibility.matches.day.astype(np.int64) * 24 * 60 + (
+            eligibility.matches.start_hour * 60
+        )
+        order = np.argsort(starts[relaxation.pairs[:, 1]], kind="stable")
+        for pi, mi in relaxation.pairs[order].tolist():
+            # _find_best con un pool de una persona: carga, solape y duplicado
+            pool = np.array([pi], dtype=np.int64)
+            if _find_best(mi, pool, eligibility, state, parameters) is None:
+                continue
+            state.book(pi, mi)
+            filled[mi, eligibility.person_role[pi]] += 1
+            kept.append((pi, mi, True))
+
+        # Plazas que la reparacion dejo libres: criterio del greedy
+        missing = eligibility.matches.needed - filled
+        for mi, code in np.argwhere(missing > 0).tolist():
+            expired = expired or deadline.expired()
+            if expired:
+                break
+            pool = eligibility.candidates(mi, ROLE_NAMES[code])
+            for _ in range(int(missing[mi, code])):
+                pi = _find_best(mi, pool, eligibility, state, parameters)
+                if pi is None:
+                    break
+                state.book(pi, mi)
+                filled[mi, code] += 1
+                kept.append((pi, mi, True))
+
+        mark = deadline.charge("repair", mark)
+
+    # ── Respuesta ───────────────────────────────────────────────────────────
+
+    kept.sort(key=lambda k: (k[1], k[0]))
+    assignments = [
+        ProposedAssignment(
+            match_id=matches[mi].id,
+            person_id=persons[pi].id,
+            person_name=persons[pi].name,
+            role=persons[pi].role,
+            travel_cost=float(eligibility.travel_cost(pi, mi)),
+            distance_km=float(eligibility.distance_km(pi, mi)),
+            is_new=is_new,
+        )
+        for pi, mi, is_new in kept
+    ]
+
+    unassigned: list[UnassignedSlot] = []
+    for mi, match in enumerate(matches):
+        for code, role in ROLE_NAMES.items():
+            needed = int(eligibility.matches.needed[mi, code])
+            for slot_idx in range(min(int(filled[mi, code]), needed), needed):
+                unassigned.append(
+                    UnassignedSlot(
+                        match_id=match.id,
+                        match_label=f"{match.home_team} vs {match.away_team}",
+                        role=role,
+                        slot_index=slot_idx,
+                        reason=(
+                            "Optimizacion cancelada"
+                            if cancelled
+                            else "Plazo agotado"
+                            if expired
+                            else "Sin candidatos validos"
+                        ),
+                    )
+                )
+
+    new_assignments = [a for a in assignments if a.is_new]
+    covered = total_slots - len(unassigned)
+    if cancelled:
+        status = "cancelled"
+    elif not unassigned:
+        status = "feasible"
+    else:
+        status = "partial" if new_assignments else "no_solution"
+
+    return OptimizationResponse(
+        status=status,
+        assignments=assignments,
+        metrics=SolverMetrics(
+            total_cost=round(sum(a.travel_cost for a in new_assignments), 2),
+            coverage=round(covered / total_slots * 100, 1) if total_slots else 100,
+            covered_slots=covered,
+            total_slots=total_slots,
+            resolution_time_ms=int((time.time() - start) * 1000),
+            solver_type="flow",
+            bound_covered_slots=relaxation.covered_slots if relaxation else None,
+            bound_cost=relaxation.cost if relaxation else None,
+            phase_ms=dict(deadline.phases),
+            degraded="Plazo agotado antes de completar el flujo" if expired else None,
+        ),
+        unassigned=unassigned,
+    )
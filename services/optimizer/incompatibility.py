@@ -0,0 +1,110 @@
+"""
+Indice de incompatibilidades persona-equipo.
+
+Los nombres de equipo se normalizan una vez (mayusculas sin acentos ni
+puntuacion, como la firma de equipo de scripts/fbm-pdf-to-csv.py) y los de
+las incompatibilidades se compilan en un automata Aho-Corasick: cada nombre
+de equipo de los partidos se recorre una sola vez y devuelve todas las
+personas con algun equipo incompatible contenido en el.
+"""
+
+from __future__ import annotations
+
+import unicodedata
+from collections import deque
+
+import numpy as np
+
+# Alfabeto tras normalizar: la tabla de transiciones es densa (estados x 36)
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+_CODES = {c: i for i, c in enumerate(ALPHABET)}
+
+
+def normalize_team(name: str) -> str:
+    """Solo A-Z (N de N-tilde) y 0-9, mayusculas, sin acentos ni puntuacion."""
+    name = unicodedata.normalize("NFD", name)
+    name = "".join(c for c in name if unicodedata.category(c) != "Mn")
+    return "".join(c for c in name.upper() if c in _CODES)
+
+
+class IncompatibilityIndex:
+    """Automata Aho-Corasick de los equipos incompatibles de cada persona."""
+
+    def __init__(self, person_teams: list[tuple[str, ...]]) -> None:
+        """person_teams: nombres ya normalizados por persona (normalize_team)."""
+        self.n_persons = len(person_teams)
+
+        # Trie de patrones; un nombre vacio tras normalizar no bloquea nada
+        children: list[dict[int, int]] = [{}]
+        owners: list[set[int]] = [set()]
+        for pi, names in enumerate(person_teams):
+            for name in names:
+                if not name:
+                    continue
+                state = 0
+                for ch in name:
+                    code = _CODES[ch]
+                    nxt = children[state].get(code)
+                    if nxt is None:
+                        nxt = len(children)
+                        children[state][code] = nxt
+                        children.append({})
+                        owners.append(set())
+                    state = nxt
+                owners[state].add(pi)
+
+        # Transiciones completas (los enlaces de fallo ya resueltos) y
+        # personas bloqueadas al pasar por cada estado, recorriendo en anchura
+        self.delta = np.zeros((len(children), len(ALPHABET)), dtype=np.int32)
+        fail = [0] * len(children)
+        blocked: list[frozenset[int]] = [frozenset()] * len(children)
+        queue = deque(children[0].values())
+        for code, nxt in children[0].items():
+            self.delta[0, code] = nxt
+        while queue:
+            state = queue.popleft()
+            blocked[state] = frozenset(owners[state]) | blocked[fail[state]]
+            self.delta[state] = self.delta[fail[state]]
+            for code, nxt in children[state].items():
+                fail[nxt] = int(self.delta[fail[state], code])
+                self.delta[state, code] = nxt
+                queue.append(nxt)
+        self.blocked_at = {
+            state: np.array(sorted(persons), dtype=np.int64)
+            for state, persons in enumerate(blocked)
+            if persons
+        }
+
+    def __len__(self) -> int:
+        """Numero de estados del automata (1 = sin incompatibilidades)."""
+        return len(self.delta)
+
+    def persons_in(self, text: str) -> np.ndarray:
+        """Personas con algun equipo incompatible contenido en text (normalizado)."""
+        found: set[int] = set()
+        state = 0
+        delta = self.delta
+        for ch in text:
+            state = delta[state, _CODES[ch]]
+            persons = self.blocked_at.get(int(state))
+            if persons is not None:
+                found.update(persons.tolist())
+        return np.array(sorted(found), dtype=np.int64)
+
+    def blocked(self, teams: list[tuple[str, str]]) -> np.ndarray:
+        """Matriz (P, M) de pares bloqueados; teams: (local, visitante) normalizados."""
+        blocked = np.zeros((self.n_persons, len(teams)), dtype=bool)
+        if len(self) == 1:
+            return blocked
+
+        # Cada nombre distinto se recorre una sola vez
+        columns: dict[str, list[int]] = {}
+        for mi, (home, away) in enumerate(teams):
+            columns.setdefault(home, []).append(mi)
+            if away != home:
+                columns.setdefault(away, []).append(mi)
+        for text, cols in columns.items():
+            persons = self.persons_in(text)
+            if persons.size:
+                blocked[np.ix_(persons, cols)] = True
+        return blocked
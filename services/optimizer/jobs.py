@@ -0,0 +1,307 @@
+"""
+Cola de trabajos de optimizacion sobre un pool de procesos acotado.
+
+Los solves son CPU-bound: ejecutarlos en el event loop de uvicorn bloquea
+todas las peticiones (incluido /health). Cada peticion reserva cores en el
+CpuScheduler, se envia a un ProcessPoolExecutor y se consulta por id;
+/optimize espera el resultado sin bloquear el loop.
+
+Cada ejecucion lleva un token de cancelacion (Event del Manager, visible
+desde el proceso worker): se activa al cancelar el trabajo, al desconectarse
+el cliente o al llegar otra peticion con el mismo supersede_key, y el solver
+detiene la busqueda devolviendo la mejor solucion encontrada.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from queue import Queue
+from typing import TYPE_CHECKING, Any, Callable
+
+from scheduler import CpuScheduler
+
+if TYPE_CHECKING:
+    from multiprocessing.managers import SyncManager
+
+    from distance_matrix import DistanceMatrix
+    from eligibility import PersonFeatures
+    from models import (
+        Distance,
+        JobInfo,
+        OptimizationRequest,
+        OptimizationResponse,
+        ReoptimizationRequest,
+        ReoptimizationResponse,
+    )
+    from solver import CancelToken
+
+# Trabajos terminados que se conservan para consulta
+MAX_FINISHED_JOBS = 200
+
+
+class SolveCancelled(Exception):
+    """El solve se cancelo antes de empezar a ejecutarse."""
+
+
+def run_optimization(
+    request: OptimizationRequest,
+    distances: list[Distance] | DistanceMatrix,
+    features: PersonFeatures | None,
+    num_workers: int,
+    cancel: CancelToken | None = None,
+) -> OptimizationResponse:
+    """Punto de entrada en el proceso worker.
+
+    distances: conjunto subido ya construido o la lista de la peticion.
+    features: datos por persona de la plantilla registrada (None = calcular).
+    """
+    from solver import solve
+
+    return solve(
+        matches=request.matches,
+        persons=request.persons,
+        distances=distances,
+        parameters=request.parameters,
+        hints=request.previous_assignments,
+        num_workers=num_workers,
+        cancel=cancel,
+        features=features,
+    )
+
+
+def run_streaming_optimization(
+    request: OptimizationRequest,
+    distances: list[Distance] | DistanceMatrix,
+    features: PersonFeatures | None,
+    events: Queue,
+    num_workers: int,
+    cancel: CancelToken | None = None,
+) -> None:
+    """Como run_optimization, publicando ("solution" | "result" | "error", json)."""
+    from solver import solve
+
+    try:
+        result = solve(
+            matches=request.matches,
+            persons=request.persons,
+            distances=distances,
+            parameters=request.parameters,
+            hints=request.previous_assignments,
+            num_workers=num_workers,
+            on_solution=lambda event: events.put(("solution", event.model_dump_json())),
+            cancel=cancel,
+            features=features,
+        )
+        events.put(("result", result.model_dump_json()))
+    except Exception as e:
+        events.put(("error", json.dumps({"detail": str(e)})))
+
+
+def run_reoptimization(
+    request: ReoptimizationRequest,
+    distances: list[Distance] | DistanceMatrix,
+    features: PersonFeatures | None,
+    num_workers: int,
+    cancel: CancelToken | None = None,
+) -> ReoptimizationResponse:
+    """Re-optimizacion por vecindario en el proceso worker."""
+    from distance_matrix import DistanceMatrix
+    from reoptimize import reoptimize
+
+    return reoptimize(
+        request,
+        num_workers,
+        cancel,
+        distances=DistanceMatrix.of(distances),
+        features=features,
+    )
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = "queued"  # queued, running, done, failed, cancelled
+    result: OptimizationResponse | None = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    finished: asyncio.Event = field(default_factory=asyncio.Event)
+    cancel: CancelToken | None = None
+    task: asyncio.Task | None = None
+
+    def info(self) -> JobInfo:
+        from models import JobInfo
+
+        return JobInfo(id=self.id, status=self.status, result=self.result, error=self.error)
+
+
+class JobManager:
+    """Registro de trabajos y pool de procesos compartido por la app."""
+
+    def __init__(
+        self, max_workers: int | None = None, scheduler: CpuScheduler | None = None
+    ) -> None:
+        self.scheduler = scheduler or CpuScheduler()
+        self.max_workers = max_workers or int(
+            os.environ.get("OPTIMIZER_MAX_PROCESSES", self.scheduler.total_cores)
+        )
+        self._pool: ProcessPoolExecutor | None = None
+        self._manager: SyncManager | None = None
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._superseding: dict[str, CancelToken] = {}
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    @property
+    def manager(self) -> SyncManager:
+        """Manager para colas/eventos compartidos con los procesos del pool."""
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    def reserve(self, request: OptimizationRequest | ReoptimizationRequest) -> asyncio.Future:
+        """Pide cores al scheduler; lanza SchedulerSaturated si no hay hueco."""
+        desired = self.scheduler.workers_for(
+            len(request.matches), len(request.persons), request.parameters.solver_type
+        )
+        return self.scheduler.request(desired)
+
+    def cancel_token(self, supersede_key: str | None = None) -> CancelToken:
+        """Token de cancelacion nuevo; cancela el anterior con la misma clave."""
+        token = self.manager.Event()
+        if supersede_key is not None:
+            previous = self._superseding.get(supersede_key)
+            if previous is not None:
+                previous.set()
+            self._superseding[supersede_key] = token
+        return token
+
+    async def run(
+        self,
+        ticket: asyncio.Future,
+        fn: Callable[..., Any],
+        *args: Any,
+        cancel: CancelToken | None = None,
+        supersede_key: str | None = None,
+        on_start: Callable[[], None] | None = None,
+    ) -> Any:
+        """Espera los cores de ticket y ejecuta fn(*args, num_workers, cancel) en el pool.
+
+        Sin cancel se crea un token (registrado bajo supersede_key). Si la
+        tarea asyncio se cancela, se activa el token para parar el worker.
+        """
+        if cancel is None:
+            cancel = self.cancel_token(supersede_key)
+        try:
+            try:
+                workers = await ticket
+            except asyncio.CancelledError:
+                self.scheduler.cancel(ticket)
+                raise
+            if cancel.is_set():
+                self.scheduler.release(workers)
+                raise SolveCancelled("Optimizacion cancelada antes de empezar")
+            if on_start is not None:
+                on_start()
+            start = time.time()
+            try:
+                return await asyncio.wrap_future(
+                    self.pool.submit(fn, *args, workers, cancel)
+                )
+            except asyncio.CancelledError:
+                cancel.set()
+                raise
+            finally:
+                self.scheduler.release(workers, time.time() - start)
+        finally:
+            if supersede_key is not None and self._superseding.get(supersede_key) is cancel:
+                del self._superseding[supersede_key]
+
+    def submit(
+        self,
+        request: OptimizationRequest,
+        distances: list[Distance] | DistanceMatrix,
+        features: PersonFeatures | None = None,
+    ) -> Job:
+        ticket = self.reserve(request)
+        job = Job(id=uuid.uuid4().hex, cancel=self.cancel_token(request.supersede_key))
+        self._jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(
+            self._run(job, ticket, request, distances, features)
+        )
+        return job
+
+    def cancel(self, job: Job) -> None:
+        """Cancela un trabajo: si esta en cola no llega a ejecutarse."""
+        if job.finished.is_set():
+            return
+        job.cancel.set()
+        if job.status == "queued" and job.task is not None:
+            job.task.cancel()
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float | None = None) -> bool:
+        """Espera (sin bloquear el loop) a que termine el trabajo; True si termino."""
+        try:
+            await asyncio.wait_for(asyncio.shield(job.finished.wait()), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    async def _run(
+        self,
+        job: Job,
+        ticket: asyncio.Future,
+        request: OptimizationRequest,
+        distances: list[Distance] | DistanceMatrix,
+        features: PersonFeatures | None,
+    ) -> None:
+        def mark_running() -> None:
+            job.status = "running"
+
+        try:
+            job.result = await self.run(
+                ticket,
+                run_optimization,
+                request,
+                distances,
+                features,
+                cancel=job.cancel,
+                supersede_key=request.supersede_key,
+                on_start=mark_running,
+            )
+            job.status = "cancelled" if job.result.status == "cancelled" else "done"
+        except (asyncio.CancelledError, SolveCancelled):
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished.set()
+            self._evict()
+
+    def _evict(self) -> None:
+        finished = [jid for jid, job in self._jobs.items() if job.finished.is_set()]
+        for jid in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[jid]
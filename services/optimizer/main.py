@@ -2,20 +2,84 @@
 Microservicio de optimizacion de designaciones FBM.
 
 Endpoints:
-  POST /optimize — Resuelve el problema de asignacion
-  GET  /health   — Health check
+  POST /optimize   — Resuelve el problema de asignacion (espera el resultado)
+  POST /optimize/stream — Igual, emitiendo soluciones intermedias por SSE
+  POST /reoptimize — Re-optimiza solo el vecindario afectado por cambios
+  POST /distances  — Sube un conjunto de distancias y devuelve su version
+  GET  /distances/{id} — Informacion de un conjunto de distancias subido
+  POST /rosters    — Registra una plantilla de personas (version 1)
+  PATCH /rosters/{id} — Altas, cambios y bajas; crea una version nueva
+  GET  /rosters/{id} — Ultima version de una plantilla
+  POST /jobs       — Encola una optimizacion y devuelve su id
+  GET  /jobs/{id}  — Estado/resultado de un trabajo (long-poll con ?wait=)
+  DELETE /jobs/{id} — Cancela un trabajo en cola o en curso
+  GET  /scheduler  — Cores libres, solves en curso y profundidad de cola
+  GET  /health     — Health check
+
+Los solves se ejecutan en un pool de procesos (jobs.py): el event loop
+nunca queda bloqueado por CP-SAT. Cada solve reserva antes sus cores en el
+CpuScheduler (scheduler.py); si el servicio esta saturado se responde 429.
+
+Un solve se cancela (StopSearch en CP-SAT, corte del bucle greedy) si el
+cliente se desconecta o llega otra peticion con el mismo supersede_key; la
+peticion cancelada recibe la mejor solucion encontrada con status
+"cancelled", o 409 si no habia empezado a ejecutarse.
 """
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import functools
+import json
+from contextlib import asynccontextmanager
+from typing import Any
+
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+
+from distance_matrix import DistanceMatrix
+from distance_store import DistanceStore
+from eligibility import PersonFeatures
+from jobs import (
+    JobManager,
+    SolveCancelled,
+    run_optimization,
+    run_reoptimization,
+    run_streaming_optimization,
+)
+from models import (
+    Distance,
+    DistanceSetInfo,
+    JobInfo,
+    OptimizationRequest,
+    OptimizationResponse,
+    Person,
+    ReoptimizationRequest,
+    ReoptimizationResponse,
+    RosterInfo,
+    RosterPatch,
+)
+from roster import RosterNotFound, RosterRegistry
+from scheduler import SchedulerSaturated
+
+jobs = JobManager()
+distance_sets = DistanceStore()
+rosters = RosterRegistry()
+
+# Cada cuanto se comprueba si el cliente de /optimize sigue conectado
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    jobs.shutdown()
 
-from models import OptimizationRequest, OptimizationResponse
-from solver import solve
 
 app = FastAPI(
     title="FBM Optimizer",
     description="Motor de asignacion de arbitros y anotadores",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -26,20 +90,224 @@ app.add_middleware(
 )
 
 
-@app.get("/health")
-async def health():
-    return {"status": "ok", "solvers": ["greedy-v1", "cpsat-v2"]}
+def _reserve(request: OptimizationRequest | ReoptimizationRequest) -> asyncio.Future:
+    """Reserva cores para la peticion o responde 429 si el servicio esta saturado."""
+    try:
+        return jobs.reserve(request)
+    except SchedulerSaturated as e:
+        raise _too_many_requests(e)
 
 
-@app.post("/optimize", response_model=OptimizationResponse)
-async def optimize(request: OptimizationRequest):
+def _distances(
+    request: OptimizationRequest | ReoptimizationRequest,
+) -> list[Distance] | DistanceMatrix:
+    """Conjunto subido referenciado por la peticion, o su lista de distancias."""
+    if request.distance_set_id is None:
+        return request.distances
+    matrix = distance_sets.get(request.distance_set_id)
+    if matrix is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Conjunto de distancias no encontrado; volver a subirlo",
+        )
+    return matrix
+
+
+def _roster(
+    request: OptimizationRequest | ReoptimizationRequest,
+) -> tuple[OptimizationRequest | ReoptimizationRequest, PersonFeatures | None]:
+    """Sustituye request.persons por la plantilla referenciada (si la hay)."""
+    if request.roster is None:
+        return request, None
     try:
-        result = solve(
-            matches=request.matches,
-            persons=request.persons,
-            distances=request.distances,
-            parameters=request.parameters,
+        persons, features = rosters.resolve(request.roster)
+    except RosterNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return request.model_copy(update={"persons": persons}), features
+
+
+def _close_stream(events: Any, task: asyncio.Task) -> None:
+    """Evento `error` final si el solve no llego a publicar su `result`.
+
+    Sin el, event_source se quedaria esperando en events.get para siempre.
+    """
+    if task.cancelled():
+        detail = "Optimizacion cancelada"
+    elif task.exception() is not None:
+        detail = str(task.exception())
+    else:
+        return
+    events.put(("error", json.dumps({"detail": detail})))
+
+
+def _too_many_requests(error: SchedulerSaturated) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+async def _run_while_connected(
+    http_request: Request,
+    request: OptimizationRequest | ReoptimizationRequest,
+    fn,
+):
+    """Ejecuta fn en el pool y cancela el solve si el cliente se desconecta."""
+    request, features = _roster(request)
+    distances = _distances(request)
+    ticket = _reserve(request)
+    cancel = jobs.cancel_token(request.supersede_key)
+    solve = asyncio.create_task(
+        jobs.run(
+            ticket,
+            fn,
+            request,
+            distances,
+            features,
+            cancel=cancel,
+            supersede_key=request.supersede_key,
         )
-        return result
+    )
+    try:
+        while not solve.done():
+            await asyncio.wait({solve}, timeout=DISCONNECT_POLL_SECONDS)
+            if not solve.done() and await http_request.is_disconnected():
+                cancel.set()
+        return solve.result()
+    except SolveCancelled as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not solve.done():
+            cancel.set()
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "solvers": ["greedy-v1", "cpsat-v2"],
+        "scheduler": jobs.scheduler.stats(),
+    }
+
+
+@app.get("/scheduler")
+async def scheduler_stats():
+    return jobs.scheduler.stats()
+
+
+@app.post("/optimize", response_model=OptimizationResponse)
+async def optimize(request: OptimizationRequest, http_request: Request):
+    return await _run_while_connected(http_request, request, run_optimization)
+
+
+@app.post("/optimize/stream")
+async def optimize_stream(request: OptimizationRequest):
+    """SSE: un evento `solution` por mejora y un `result` final (OptimizationResponse)."""
+    request, features = _roster(request)
+    distances = _distances(request)
+    ticket = _reserve(request)
+    events = jobs.manager.Queue()
+    cancel = jobs.cancel_token(request.supersede_key)
+    task = asyncio.create_task(
+        jobs.run(
+            ticket,
+            run_streaming_optimization,
+            request,
+            distances,
+            features,
+            events,
+            cancel=cancel,
+            supersede_key=request.supersede_key,
+        )
+    )
+    task.add_done_callback(functools.partial(_close_stream, events))
+
+    async def event_source():
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                kind, payload = await loop.run_in_executor(None, events.get)
+                yield f"event: {kind}\ndata: {payload}\n\n"
+                if kind != "solution":
+                    break
+        finally:
+            # Cliente desconectado a mitad del stream: parar el solve
+            if not task.done():
+                cancel.set()
+
+    return StreamingResponse(event_source(), media_type="text/event-stream")
+
+
+@app.post("/reoptimize", response_model=ReoptimizationResponse)
+async def reoptimize_neighbourhood(
+    request: ReoptimizationRequest, http_request: Request
+):
+    return await _run_while_connected(http_request, request, run_reoptimization)
+
+
+@app.post("/distances", response_model=DistanceSetInfo, status_code=201)
+async def upload_distances(distances: list[Distance]):
+    """Sube un conjunto de distancias; distance_set_id es un hash del contenido."""
+    return distance_sets.put(distances)
+
+
+@app.get("/distances/{distance_set_id}", response_model=DistanceSetInfo)
+async def get_distances(distance_set_id: str):
+    info = distance_sets.info(distance_set_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Conjunto de distancias no encontrado")
+    return info
+
+
+@app.post("/rosters", response_model=RosterInfo, status_code=201)
+async def create_roster(persons: list[Person]):
+    return rosters.create(persons).info()
+
+
+@app.patch("/rosters/{roster_id}", response_model=RosterInfo)
+async def patch_roster(roster_id: str, patch: RosterPatch):
+    try:
+        return rosters.patch(roster_id, patch).info()
+    except RosterNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/rosters/{roster_id}", response_model=RosterInfo)
+async def get_roster(roster_id: str):
+    try:
+        return rosters.get(roster_id).info()
+    except RosterNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/jobs", response_model=JobInfo, status_code=202)
+async def create_job(request: OptimizationRequest):
+    request, features = _roster(request)
+    distances = _distances(request)
+    try:
+        return jobs.submit(request, distances, features).info()
+    except SchedulerSaturated as e:
+        raise _too_many_requests(e)
+
+
+@app.get("/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str, wait: float = Query(default=0, ge=0, le=60)):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if wait:
+        await jobs.wait(job, timeout=wait)
+    return job.info()
+
+
+@app.delete("/jobs/{job_id}", response_model=JobInfo)
+async def cancel_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    jobs.cancel(job)
+    await jobs.wait(job, timeout=10)
+    return job.info()
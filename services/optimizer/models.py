@@ -96,14 +96,90 @@ class SolverParameters(BaseModel):
     max_matches_per_person: int = Field(default=3, ge=1, le=10)
     force_existing: bool = True
     max_time_seconds: float = Field(default=30.0, ge=1, le=300)
-    solver_type: str = Field(default="cpsat", pattern="^(cpsat|greedy)$")
+    solver_type: str = Field(
+        default="cpsat", pattern="^(cpsat|greedy|flow|portfolio|auto)$"
+    )
+    # Resolver por componentes independientes en paralelo (solo cpsat y sin
+    # peso de equilibrio; si no, se resuelve el modelo global)
+    decompose: bool = False
+    # portfolio: incluir la relajacion por flujo en la carrera greedy/CP-SAT
+    portfolio_flow: bool = True
+    # cpsat: publicar cotas de la relajacion de transporte (bound_covered_slots,
+    # bound_cost); cuesta un flujo de coste minimo antes de buscar
+    relaxation_bounds: bool = False
+    # weighted: un unico objetivo ponderado; lexicographic: cobertura, luego
+    # coste (fijando la cobertura) y luego equilibrio, por etapas
+    objective_mode: str = Field(
+        default="weighted", pattern="^(weighted|lexicographic)$"
+    )
+    # Parada temprana de CP-SAT (por etapa): gap relativo entre solucion y
+    # cota, y segundos sin mejorar la solucion. Opcional: por defecto solo
+    # para al probar el optimo o agotar el plazo
+    relative_gap_tolerance: float = Field(default=0.0, ge=0, le=1)
+    no_improvement_seconds: Optional[float] = Field(default=None, gt=0)
+
+
+class PriorAssignment(BaseModel):
+    match_id: str
+    person_id: str
+
+
+class RosterReference(BaseModel):
+    """Plantilla registrada con POST /rosters, con cambios solo para esta peticion."""
+
+    roster_id: str
+    version: Optional[int] = None  # None = ultima version
+    overrides: list[Person] = Field(default_factory=list)  # sustituyen o anaden
+    exclude_person_ids: list[str] = Field(default_factory=list)
+
+
+class RosterPatch(BaseModel):
+    upsert: list[Person] = Field(default_factory=list)
+    remove_person_ids: list[str] = Field(default_factory=list)
 
 
 class OptimizationRequest(BaseModel):
     matches: list[Match]
-    persons: list[Person]
-    distances: list[Distance]
+    # Lista completa de personas o referencia a una plantilla registrada
+    persons: list[Person] = Field(default_factory=list)
+    roster: Optional[RosterReference] = None
+    distances: list[Distance] = Field(default_factory=list)
+    # Conjunto subido con POST /distances; si se indica, ignora distances
+    distance_set_id: Optional[str] = None
+    parameters: SolverParameters = Field(default_factory=SolverParameters)
+    # Solucion previa para warm-start; None = usar match.designations
+    previous_assignments: Optional[list[PriorAssignment]] = None
+    # Una peticion nueva con la misma clave cancela la anterior en curso
+    supersede_key: Optional[str] = None
+
+
+class ScheduleDelta(BaseModel):
+    """Cambios sobre la solucion aceptada (matches/persons ya actualizados)."""
+
+    removed_person_ids: list[str] = Field(default_factory=list)
+    added_person_ids: list[str] = Field(default_factory=list)
+    moved_match_ids: list[str] = Field(default_factory=list)
+    availability_changed_person_ids: list[str] = Field(default_factory=list)
+
+
+class NeighbourhoodParameters(BaseModel):
+    radius_km: float = Field(default=20.0, ge=0)
+    time_window_hours: int = Field(default=3, ge=0, le=24)
+
+
+class ReoptimizationRequest(BaseModel):
+    matches: list[Match]
+    persons: list[Person] = Field(default_factory=list)
+    roster: Optional[RosterReference] = None
+    distances: list[Distance] = Field(default_factory=list)
+    distance_set_id: Optional[str] = None
     parameters: SolverParameters = Field(default_factory=SolverParameters)
+    current_assignments: list[PriorAssignment]
+    delta: ScheduleDelta = Field(default_factory=ScheduleDelta)
+    neighbourhood: NeighbourhoodParameters = Field(
+        default_factory=NeighbourhoodParameters
+    )
+    supersede_key: Optional[str] = None
 
 
 # ── Response models ──────────────────────────────────────────────────────────
@@ -127,6 +203,31 @@ class UnassignedSlot(BaseModel):
     reason: str
 
 
+class StageMetrics(BaseModel):
+    """Una etapa del objetivo (weighted o coverage/cost/balance)."""
+
+    name: str
+    status: str
+    objective: Optional[float] = None
+    proven_optimal: bool = False
+    relative_gap: Optional[float] = None
+    time_ms: int
+
+
+class RoutingDecision(BaseModel):
+    """Eleccion de solver_type="auto" y el tamano estimado que la motiva."""
+
+    engine: str  # cpsat, decompose, greedy
+    reason: str
+    candidate_pairs: int
+    variables: int
+    constraints: int
+    overlap_constraints: int
+    predicted_memory_mb: float
+    predicted_build_seconds: float
+    memory_budget_mb: float
+
+
 class SolverMetrics(BaseModel):
     total_cost: float
     coverage: float
@@ -134,10 +235,72 @@ class SolverMetrics(BaseModel):
     total_slots: int
     resolution_time_ms: int
     solver_type: str = "cpsat"
+    subproblems: int = 1
+    time_to_first_solution_ms: Optional[int] = None
+    # Gap relativo alcanzado (ultima etapa) y motivo de parada temprana
+    relative_gap: Optional[float] = None
+    early_stop: Optional[str] = None  # gap, stagnation
+    warm_start: bool = False
+    stages: list[StageMetrics] = Field(default_factory=list)
+    # Personas agrupadas en clases intercambiables (rotura de simetria)
+    interchangeable_persons: int = 0
+    # Relajacion de transporte (sin solapes ni equilibrio): ninguna solucion
+    # cubre mas plazas, y con esa cobertura ninguna cuesta menos (coste con
+    # la penalizacion sin coche del objetivo)
+    bound_covered_slots: Optional[int] = None
+    bound_cost: Optional[float] = None
+    # Motor que produjo la solucion devuelta (solver_type="portfolio")
+    engine: Optional[str] = None
+    routing: Optional[RoutingDecision] = None
+    # Tiempo por fase contra el plazo de la peticion (preprocess, build,
+    # solve, extract, fallback) y motivo si se degrado al greedy
+    phase_ms: dict[str, int] = Field(default_factory=dict)
+    degraded: Optional[str] = None
+
+
+class SolutionEvent(BaseModel):
+    """Solucion intermedia de CP-SAT (diff respecto a la anterior)."""
+
+    objective: float
+    coverage: float
+    covered_slots: int
+    total_cost: float
+    elapsed_ms: int
+    added: list[PriorAssignment]
+    removed: list[PriorAssignment]
 
 
 class OptimizationResponse(BaseModel):
-    status: str  # optimal, feasible, partial, no_solution
+    status: str  # optimal, feasible, partial, no_solution, cancelled
     assignments: list[ProposedAssignment]
     metrics: SolverMetrics
     unassigned: list[UnassignedSlot]
+
+
+class ReoptimizationResponse(BaseModel):
+    status: str
+    added: list[ProposedAssignment]
+    removed: list[PriorAssignment]
+    unassigned: list[UnassignedSlot]
+    metrics: SolverMetrics
+    released_assignments: int
+    frozen_assignments: int
+
+
+class DistanceSetInfo(BaseModel):
+    distance_set_id: str
+    municipalities: int
+    pairs: int
+
+
+class RosterInfo(BaseModel):
+    roster_id: str
+    version: int
+    persons: int
+
+
+class JobInfo(BaseModel):
+    id: str
+    status: str  # queued, running, done, failed, cancelled
+    result: Optional[OptimizationResponse] = None
+    error: Optional[str] = None
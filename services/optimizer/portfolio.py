@@ -0,0 +1,232 @@
+"""
+Portfolio: greedy, flujo y CP-SAT en carrera bajo un unico plazo.
+
+El greedy se resuelve primero (milisegundos) y fija el suelo de calidad;
+CP-SAT arranca en un hilo con los hints de la peticion (o, sin ellos, con la
+solucion del greedy) mientras el hilo principal resuelve la relajacion por
+flujo. CP-SAT recibe el tiempo que queda del
+plazo de la peticion. Se devuelve la mejor solucion segun el objetivo de
+CP-SAT (ponderado o lexicografico) evaluado sobre las tres, con el motor
+ganador en SolverMetrics.engine.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+
+from distance_matrix import DistanceMatrix
+from eligibility import PersonFeatures, build_eligibility
+
+if TYPE_CHECKING:
+    from eligibility import Eligibility
+    from models import (
+        Distance,
+        Match,
+        OptimizationResponse,
+        Person,
+        PriorAssignment,
+        SolutionEvent,
+        SolverParameters,
+    )
+    from solver import CancelToken, Deadline
+
+# Por debajo de este tiempo restante no se lanza CP-SAT
+MIN_CPSAT_SECONDS = 0.5
+
+
+class _EngineCancel:
+    """Token de CP-SAT: el de la peticion o la parada propia del portfolio.
+
+    wait() solo espera la parada propia; el token de la peticion se mira al
+    vencer el timeout (el monitor de CP-SAT sondea cada pocas decimas).
+    """
+
+    def __init__(self, outer: CancelToken | None) -> None:
+        self._outer = outer
+        self._stop = threading.Event()
+
+    def set(self) -> None:
+        self._stop.set()
+
+    def is_set(self) -> bool:
+        return self._stop.is_set() or (self._outer is not None and self._outer.is_set())
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._stop.wait(timeout) or self.is_set()
+
+
+def solve_portfolio(
+    matches: list[Match],
+    persons: list[Person],
+    distances: list[Distance] | DistanceMatrix,
+    parameters: SolverParameters,
+    hints: list[PriorAssignment] | None = None,
+    on_solution: Callable[[SolutionEvent], None] | None = None,
+    num_workers: int | None = None,
+    cancel: CancelToken | None = None,
+    features: PersonFeatures | None = None,
+    deadline: Deadline | None = None,
+) -> OptimizationResponse:
+    """Mejor solucion de greedy, flujo (parameters.portfolio_flow) y CP-SAT.
+
+    hints: arranque de CP-SAT; sin ellos arranca con la solucion del greedy.
+    on_solution y num_workers se pasan a CP-SAT.
+    deadline: plazo comun; las fases de cada motor se publican con su
+    prefijo (greedy.solve, cpsat.build...).
+    """
+    from models import PriorAssignment
+    from solver import Deadline, solve, solve_greedy
+
+    start = time.time()
+    if deadline is None:
+        deadline = Deadline(start + parameters.max_time_seconds)
+    engine_deadlines = {name: Deadline(deadline.at) for name in ("greedy", "flow", "cpsat")}
+    # Distancias y datos por persona se preparan una vez para los tres motores
+    distance_matrix = DistanceMatrix.of(distances)
+    if features is None:
+        features = PersonFeatures.from_persons(persons)
+
+    results: dict[str, OptimizationResponse] = {}
+    results["greedy"] = solve_greedy(
+        matches,
+        persons,
+        distance_matrix,
+        parameters,
+        cancel=cancel,
+        features=features,
+        deadline=engine_deadlines["greedy"],
+    )
+
+    cpsat: Future | None = None
+    cpsat_cancel = _EngineCancel(cancel)
+    executor = ThreadPoolExecutor(max_workers=1)
+    if deadline.remaining() >= MIN_CPSAT_SECONDS and not cpsat_cancel.is_set():
+        floor = results["greedy"].assignments
+        cpsat = executor.submit(
+            solve,
+            matches,
+            persons,
+            distance_matrix,
+            # CP-SAT global en este hilo: decompose llevaria el token de
+            # cancelacion (threading.Event, no serializable) a otros procesos
+            parameters.model_copy(update={"solver_type": "cpsat", "decompose": False}),
+            hints=hints
+            or [PriorAssignment(match_id=a.match_id, person_id=a.person_id) for a in floor]
+            or None,
+            on_solution=on_solution,
+            num_workers=num_workers,
+            cancel=cpsat_cancel,
+            features=features,
+            deadline=engine_deadlines["cpsat"],
+        )
+    try:
+        if parameters.portfolio_flow:
+            from flow import solve_flow
+
+            results["flow"] = solve_flow(
+                matches,
+                persons,
+                distance_matrix,
+                parameters,
+                cancel=cancel,
+                features=features,
+                deadline=engine_deadlines["flow"],
+            )
+        if cpsat is not None:
+            # Si CP-SAT se degrado a greedy no aporta una solucion propia
+            result = cpsat.result()
+            if result.metrics.degraded is None:
+                results["cpsat"] = result
+    except BaseException:
+        # Si el flujo falla, CP-SAT no debe seguir ocupando cores
+        cpsat_cancel.set()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+
+    # ── Elegir ganador ──────────────────────────────────────────────────────
+
+    eligibility = build_eligibility(matches, persons, distance_matrix, features)
+    person_idx = {p.id: pi for pi, p in enumerate(persons)}
+    match_idx = {m.id: mi for mi, m in enumerate(matches)}
+    # En empate gana CP-SAT, despues el flujo
+    ranked = sorted(
+        (name for name in ("cpsat", "flow", "greedy") if name in results),
+        key=lambda name: _objective(
+            results[name], eligibility, person_idx, match_idx, parameters
+        ),
+    )
+    engine = ranked[0]
+    best = results[engine]
+
+    status = best.status
+    if cancel is not None and cancel.is_set():
+        status = "cancelled"
+    # Cotas: las del flujo si ha corrido (CP-SAT solo las calcula a peticion)
+    bounds = results.get("flow", results.get("cpsat", best)).metrics
+    for name, engine_deadline in engine_deadlines.items():
+        for phase, ms in engine_deadline.phases.items():
+            deadline.phases[f"{name}.{phase}"] = ms
+    return best.model_copy(
+        update={
+            "status": status,
+            "metrics": best.metrics.model_copy(
+                update={
+                    "solver_type": "portfolio",
+                    "engine": engine,
+                    "resolution_time_ms": int((time.time() - start) * 1000),
+                    "bound_covered_slots": bounds.bound_covered_slots,
+                    "bound_cost": bounds.bound_cost,
+                    "phase_ms": dict(deadline.phases),
+                }
+            ),
+        }
+    )
+
+
+def _objective(
+    result: OptimizationResponse,
+    eligibility: Eligibility,
+    person_idx: dict[str, int],
+    match_idx: dict[str, int],
+    parameters: SolverParameters,
+) -> tuple[int, ...]:
+    """Objetivo de CP-SAT (_objective_stages) evaluado sobre una solucion.
+
+    Cuenta las variables de CP-SAT: solo pares elegibles, y la carga solo
+    de personas con algun candidato.
+    """
+    from solver import COST_SCALE
+
+    pairs = np.array(
+        [
+            (person_idx[a.person_id], match_idx[a.match_id])
+            for a in result.assignments
+            if a.person_id in person_idx and a.match_id in match_idx
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    pairs = pairs[eligibility.mask[pairs[:, 0], pairs[:, 1]]]
+
+    uncovered = result.metrics.total_slots - result.metrics.covered_slots
+    cost = int(eligibility.cost_scaled(pairs[:, 0], pairs[:, 1]).sum())
+    load = np.bincount(pairs[:, 0], minlength=eligibility.mask.shape[0])
+    load = load[eligibility.mask.any(axis=1)]
+    balance = int(load.max() - load.min()) if load.size else 0
+
+    if parameters.objective_mode == "lexicographic":
+        return (
+            uncovered,
+            cost if parameters.cost_weight > 0 else 0,
+            balance if parameters.balance_weight > 0 else 0,
+        )
+    return (
+        10000 * COST_SCALE * uncovered
+        + int(parameters.cost_weight * 100) * cost
+        + int(parameters.balance_weight * 100 * COST_SCALE) * balance,
+    )
@@ -0,0 +1,257 @@
+"""
+Re-optimizacion incremental por vecindario.
+
+Ante cambios de ultima hora (bajas, altas, partidos movidos, disponibilidades
+nuevas) no se re-resuelve toda la jornada: se liberan solo las asignaciones
+afectadas y se re-optimiza su vecindario (personas cercanas a las sedes
+afectadas y sus asignaciones en la misma franja horaria), congelando el resto
+con la logica de force_existing de solve_cpsat.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from distance_matrix import DistanceMatrix
+from eligibility import PersonFeatures, build_eligibility
+from solver import CancelToken, solve_cpsat
+
+if TYPE_CHECKING:
+    from models import Person, ReoptimizationRequest, ReoptimizationResponse
+
+
+def reoptimize(
+    request: ReoptimizationRequest,
+    num_workers: int = 4,
+    cancel: CancelToken | None = None,
+    distances: DistanceMatrix | None = None,
+    features: PersonFeatures | None = None,
+) -> ReoptimizationResponse:
+    """Re-resuelve el vecindario afectado por request.delta y devuelve el diff.
+
+    distances: conjunto subido resuelto por el servicio (None = request.distances).
+    features: datos precalculados de request.persons (registro de plantillas).
+    """
+    from models import (
+        Designation,
+        PriorAssignment,
+        ReoptimizationResponse,
+        SolverMetrics,
+        UnassignedSlot,
+    )
+
+    start = time.time()
+    delta = request.delta
+    removed_ids = set(delta.removed_person_ids)
+    moved_ids = set(delta.moved_match_ids)
+
+    matches = request.matches
+    kept = [i for i, p in enumerate(request.persons) if p.id not in removed_ids]
+    persons = [request.persons[i] for i in kept]
+    if features is not None:
+        features = features.select(kept)
+    distance_matrix = DistanceMatrix.of(
+        distances if distances is not None else request.distances
+    )
+    eligibility = build_eligibility(matches, persons, distance_matrix, features)
+
+    match_idx = {m.id: i for i, m in enumerate(matches)}
+    person_idx = {p.id: i for i, p in enumerate(persons)}
+
+    # ── Liberar asignaciones afectadas ──────────────────────────────────────
+
+    released: list[PriorAssignment] = []
+    frozen: set[tuple[int, int]] = set()
+    affected: set[int] = {match_idx[mid] for mid in moved_ids if mid in match_idx}
+
+    for a in request.current_assignments:
+        mi = match_idx.get(a.match_id)
+        pi = person_idx.get(a.person_id)
+        if mi is None:
+            released.append(a)
+            continue
+        if pi is None or a.match_id in moved_ids or not eligibility.mask[pi, mi]:
+            released.append(a)
+            affected.add(mi)
+            continue
+        frozen.add((pi, mi))
+
+    # Huecos ya descubiertos que una persona nueva o con cambios de
+    # disponibilidad puede cubrir: tambien son partidos afectados
+    changed_ids = set(delta.added_person_ids) | set(
+        delta.availability_changed_person_ids
+    )
+    changed = [pi for pi, p in enumerate(persons) if p.active and p.id in changed_ids]
+    if changed:
+        needed = eligibility.matches.needed
+        filled = np.zeros_like(needed)
+        for pi, mi in frozen:
+            filled[mi, eligibility.person_role[pi]] += 1
+        for pi in changed:
+            code = eligibility.person_role[pi]
+            gaps = eligibility.mask[pi] & (filled[:, code] < needed[:, code])
+            affected.update(np.flatnonzero(gaps).tolist())
+
+    # ── Vecindario ──────────────────────────────────────────────────────────
+
+    radius = request.neighbourhood.radius_km
+    window = request.neighbourhood.time_window_hours
+    affected_cols = sorted(affected)
+
+    near = (
+        eligibility.mask[:, affected_cols]
+        & (eligibility.distance_km(*np.ix_(range(len(persons)), affected_cols)) <= radius)
+    ).any(axis=1)
+    neighbourhood = {
+        pi
+        for pi, p in enumerate(persons)
+        if p.active and (near[pi] or p.id in changed_ids)
+    }
+
+    # Asignaciones del vecindario en la misma franja: se liberan para
+    # permitir intercambios con los huecos afectados
+    days = eligibility.matches.day.tolist()
+    hours = eligibility.matches.start_hour.tolist()
+    open_matches = set(affected)
+    for pi, mi in sorted(frozen):
+        if pi not in neighbourhood:
+            continue
+        if any(
+            days[mj] == days[mi] and abs(hours[mj] - hours[mi]) <= window
+            for mj in affected_cols
+        ):
+            frozen.discard((pi, mi))
+            released.append(
+                PriorAssignment(match_id=matches[mi].id, person_id=persons[pi].id)
+            )
+            open_matches.add(mi)
+
+    # Partidos donde el vecindario mantiene asignaciones congeladas: entran en
+    # el sub-problema para respetar carga maxima y solapamiento
+    context_matches = {mi for pi, mi in frozen if pi in neighbourhood} - open_matches
+
+    # ── Sub-problema ────────────────────────────────────────────────────────
+
+    frozen_by_match: dict[int, list[int]] = defaultdict(list)
+    for pi, mi in frozen:
+        frozen_by_match[mi].append(pi)
+
+    sub_matches = []
+    for mi in sorted(open_matches | context_matches):
+        match = matches[mi]
+        inside = [pi for pi in frozen_by_match[mi] if pi in neighbourhood]
+        outside = [pi for pi in frozen_by_match[mi] if pi not in neighbourhood]
+        counts_in = _count_roles(inside, persons)
+        counts_out = _count_roles(outside, persons)
+        if mi in open_matches:
+            referees = max(0, match.referees_needed - counts_out["arbitro"])
+            scorers = max(0, match.scorers_needed - counts_out["anotador"])
+        else:
+            referees, scorers = counts_in["arbitro"], counts_in["anotador"]
+        sub_matches.append(
+            match.model_copy(
+                update={
+                    "referees_needed": referees,
+                    "scorers_needed": scorers,
+                    "designations": [
+                        Designation(
+                            id=f"frozen-{persons[pi].id}-{match.id}",
+                            match_id=match.id,
+                            person_id=persons[pi].id,
+                            role=persons[pi].role,
+                            status="frozen",
+                        )
+                        for pi in inside
+                    ],
+                }
+            )
+        )
+
+    sub_persons = [persons[pi] for pi in sorted(neighbourhood)]
+    parameters = request.parameters.model_copy(update={"force_existing": True})
+    result = solve_cpsat(
+        sub_matches,
+        sub_persons,
+        distance_matrix,
+        parameters,
+        num_workers=num_workers,
+        hints=request.current_assignments,
+        cancel=cancel,
+        bounds=False,
+    )
+
+    # ── Diff contra la solucion aceptada ────────────────────────────────────
+
+    # Las designaciones congeladas vuelven con is_new=False; el resto son
+    # los huecos abiertos tal como los ha cubierto el sub-problema
+    placed = [a for a in result.assignments if a.is_new]
+    current = {(a.person_id, a.match_id) for a in request.current_assignments}
+    added = [a for a in placed if (a.person_id, a.match_id) not in current]
+    final = {(persons[pi].id, matches[mi].id) for pi, mi in frozen} | {
+        (a.person_id, a.match_id) for a in placed
+    }
+    removed = [a for a in released if (a.person_id, a.match_id) not in final]
+
+    final_counts: dict[tuple[str, str], int] = defaultdict(int)
+    for pi, mi in frozen:
+        final_counts[matches[mi].id, persons[pi].role] += 1
+    for a in placed:
+        final_counts[a.match_id, a.role] += 1
+
+    unassigned: list[UnassignedSlot] = []
+    covered = 0
+    for mi, match in enumerate(matches):
+        for role, needed in [
+            ("arbitro", match.referees_needed),
+            ("anotador", match.scorers_needed),
+        ]:
+            count = final_counts.get((match.id, role), 0)
+            covered += min(count, needed)
+            for slot_idx in range(count, needed):
+                unassigned.append(
+                    UnassignedSlot(
+                        match_id=match.id,
+                        match_label=f"{match.home_team} vs {match.away_team}",
+                        role=role,
+                        slot_index=slot_idx,
+                        reason=(
+                            "Sin candidatos en el vecindario"
+                            if mi in open_matches
+                            else "Sin cubrir en el plan actual"
+                        ),
+                    )
+                )
+
+    total_slots = sum(m.referees_needed + m.scorers_needed for m in matches)
+
+    return ReoptimizationResponse(
+        status=result.status,
+        added=added,
+        removed=removed,
+        unassigned=unassigned,
+        metrics=SolverMetrics(
+            total_cost=round(sum(a.travel_cost for a in added), 2),
+            coverage=round(covered / total_slots * 100, 1) if total_slots else 100,
+            covered_slots=covered,
+            total_slots=total_slots,
+            resolution_time_ms=int((time.time() - start) * 1000),
+            solver_type="cpsat",
+            time_to_first_solution_ms=result.metrics.time_to_first_solution_ms,
+            warm_start=result.metrics.warm_start,
+            stages=result.metrics.stages,
+        ),
+        released_assignments=len(released),
+        frozen_assignments=len(frozen),
+    )
+
+
+def _count_roles(person_indices: list[int], persons: list[Person]) -> dict[str, int]:
+    """Cuenta arbitros y anotadores entre las personas indicadas."""
+    counts = {"arbitro": 0, "anotador": 0}
+    for pi in person_indices:
+        counts[persons[pi].role] += 1
+    return counts
@@ -0,0 +1,152 @@
+"""
+Registro de plantillas (personas) con versiones.
+
+El cliente sube la plantilla una vez (POST /rosters) y despues solo envia
+cambios (PATCH /rosters/{id}); cada cambio crea una version nueva. Cada
+version guarda los datos por persona ya parseados (PersonFeatures), que se
+actualizan solo en las filas modificadas. Las peticiones de optimizacion
+referencian roster_id + version con overrides opcionales en lugar de
+reenviar y revalidar todas las personas con sus disponibilidades.
+"""
+
+from __future__ import annotations
+
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from eligibility import PersonFeatures
+
+if TYPE_CHECKING:
+    from models import Person, RosterInfo, RosterPatch, RosterReference
+
+# Versiones que se conservan por plantilla (peticiones en cola pueden usar
+# una version anterior a la ultima)
+DEFAULT_MAX_VERSIONS = 4
+# Plantillas en memoria
+DEFAULT_MAX_ROSTERS = 16
+
+
+class RosterNotFound(Exception):
+    """La plantilla o la version pedida no existe (o se ha expulsado)."""
+
+
+@dataclass(frozen=True)
+class RosterSnapshot:
+    """Version inmutable de una plantilla."""
+
+    roster_id: str
+    version: int
+    persons: list[Person]
+    features: PersonFeatures
+    position: dict[str, int]
+
+    def __post_init__(self) -> None:
+        # El automata de incompatibilidades se compila una vez por version y
+        # viaja ya construido con features a los procesos del pool
+        self.features.incompatibility
+
+    @classmethod
+    def build(cls, roster_id: str, version: int, persons: list[Person]) -> RosterSnapshot:
+        return cls(
+            roster_id=roster_id,
+            version=version,
+            persons=list(persons),
+            features=PersonFeatures.from_persons(persons),
+            position={p.id: i for i, p in enumerate(persons)},
+        )
+
+    def patched(
+        self, version: int, upsert: list[Person], remove_ids: list[str]
+    ) -> RosterSnapshot:
+        """Aplica altas/cambios/bajas recalculando solo las filas afectadas."""
+        persons = list(self.persons)
+        features = self.features
+        changed = {
+            self.position[p.id]: p for p in upsert if p.id in self.position
+        }
+        added = [p for p in upsert if p.id not in self.position]
+        if changed:
+            for pi, person in changed.items():
+                persons[pi] = person
+            features = features.updated(changed)
+        if added:
+            persons.extend(added)
+            features = features.extended(added)
+        remove = set(remove_ids)
+        if remove:
+            kept = [i for i, p in enumerate(persons) if p.id not in remove]
+            persons = [persons[i] for i in kept]
+            features = features.select(kept)
+        return RosterSnapshot(
+            roster_id=self.roster_id,
+            version=version,
+            persons=persons,
+            features=features,
+            position={p.id: i for i, p in enumerate(persons)},
+        )
+
+    def info(self) -> RosterInfo:
+        from models import RosterInfo
+
+        return RosterInfo(
+            roster_id=self.roster_id, version=self.version, persons=len(self.persons)
+        )
+
+
+class RosterRegistry:
+    """Plantillas por id, con las ultimas versiones de cada una."""
+
+    def __init__(
+        self, max_rosters: int | None = None, max_versions: int | None = None
+    ) -> None:
+        self.max_rosters = max_rosters or int(
+            os.environ.get("OPTIMIZER_MAX_ROSTERS", DEFAULT_MAX_ROSTERS)
+        )
+        self.max_versions = max_versions or int(
+            os.environ.get("OPTIMIZER_ROSTER_VERSIONS", DEFAULT_MAX_VERSIONS)
+        )
+        self._rosters: OrderedDict[str, OrderedDict[int, RosterSnapshot]] = OrderedDict()
+
+    def create(self, persons: list[Person]) -> RosterSnapshot:
+        snapshot = RosterSnapshot.build(uuid.uuid4().hex, 1, persons)
+        self._rosters[snapshot.roster_id] = OrderedDict({1: snapshot})
+        while len(self._rosters) > self.max_rosters:
+            self._rosters.popitem(last=False)
+        return snapshot
+
+    def patch(self, roster_id: str, patch: RosterPatch) -> RosterSnapshot:
+        latest = self.get(roster_id)
+        snapshot = latest.patched(
+            latest.version + 1, patch.upsert, patch.remove_person_ids
+        )
+        versions = self._rosters[roster_id]
+        versions[snapshot.version] = snapshot
+        while len(versions) > self.max_versions:
+            versions.popitem(last=False)
+        return snapshot
+
+    def get(self, roster_id: str, version: int | None = None) -> RosterSnapshot:
+        versions = self._rosters.get(roster_id)
+        if versions is None:
+            raise RosterNotFound(f"Plantilla {roster_id} no encontrada")
+        self._rosters.move_to_end(roster_id)
+        if version is None:
+            return next(reversed(versions.values()))
+        snapshot = versions.get(version)
+        if snapshot is None:
+            raise RosterNotFound(
+                f"Version {version} de la plantilla {roster_id} no disponible"
+            )
+        return snapshot
+
+    def resolve(self, reference: RosterReference) -> tuple[list[Person], PersonFeatures]:
+        """Personas y datos precalculados de la version pedida con sus overrides."""
+        snapshot = self.get(reference.roster_id, reference.version)
+        if reference.overrides or reference.exclude_person_ids:
+            snapshot = snapshot.patched(
+                snapshot.version, reference.overrides, reference.exclude_person_ids
+            )
+        return snapshot.persons, snapshot.features
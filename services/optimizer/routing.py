@@ -0,0 +1,223 @@
+"""
+Enrutado automatico por tamano del modelo (solver_type="auto").
+
+Antes de construir nada se estima el modelo CP-SAT a partir de la matriz de
+elegibilidad: variables, restricciones y literales (pares candidatos,
+cliques de solape por persona, cobertura y carga). Un modelo lineal
+calibrado sobre esos conteos predice memoria y tiempo de construccion, y la
+peticion se envia a CP-SAT, a la descomposicion por componentes o al greedy
+segun el presupuesto de memoria del contenedor y el plazo de la peticion.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable
+
+from distance_matrix import DistanceMatrix
+from eligibility import PersonFeatures, build_eligibility
+
+if TYPE_CHECKING:
+    from eligibility import Eligibility
+    from models import (
+        Distance,
+        Match,
+        OptimizationResponse,
+        Person,
+        PriorAssignment,
+        RoutingDecision,
+        SolutionEvent,
+        SolverParameters,
+    )
+    from solver import CancelToken, Deadline
+
+# Calibrado con solve_cpsat (ortools 9.11, CPython 3.11, 1 worker) sobre
+# instancias de 2e4 a 2.3e6 literales: memoria pico del proceso (error
+# < 20%) y tiempo hasta el primer CpSolver.solve, por literal del modelo
+MEMORY_BASE_MB = 130.0
+MEMORY_MB_PER_LITERAL = 0.0005
+BUILD_SECONDS_PER_LITERAL = 6.5e-6
+
+# Memoria disponible para un solve (por proceso del pool)
+MEMORY_BUDGET_MB = float(os.environ.get("OPTIMIZER_MEMORY_BUDGET_MB", 2048))
+# Fraccion maxima de max_time_seconds que puede consumir la construccion
+BUILD_TIME_SHARE = 0.5
+
+
+@dataclass
+class ModelEstimate:
+    """Tamano previsto del modelo CP-SAT global."""
+
+    pairs: int  # variables x (persona, partido)
+    variables: int
+    constraints: int
+    literals: int  # terminos en todas las restricciones
+    overlap_constraints: int  # AddAtMostOne por persona y clique
+
+    @property
+    def memory_mb(self) -> float:
+        return MEMORY_BASE_MB + MEMORY_MB_PER_LITERAL * self.literals
+
+    @property
+    def build_seconds(self) -> float:
+        return BUILD_SECONDS_PER_LITERAL * self.literals
+
+    def fits(self, parameters: SolverParameters, memory_budget_mb: float) -> bool:
+        return (
+            self.memory_mb <= memory_budget_mb
+            and self.build_seconds <= BUILD_TIME_SHARE * parameters.max_time_seconds
+        )
+
+
+def estimate_model(
+    eligibility: Eligibility,
+    component: tuple[list[int], list[int]] | None = None,
+) -> ModelEstimate:
+    """Cuenta lo que construiria solve_cpsat sin crear el modelo.
+
+    component: (personas, partidos) de split_components; None = global.
+    """
+    from solver import _precompute_overlap_cliques
+
+    if component is None:
+        mask = eligibility.mask
+        n_matches = mask.shape[1]
+    else:
+        mask = eligibility.mask[component[0]]
+        n_matches = len(component[1])
+    per_person = mask.sum(axis=1)
+    pairs = int(per_person.sum())
+    loaded = int((per_person > 0).sum())
+
+    # Cobertura: una restriccion por (partido, rol) con sus candidatos + slack
+    constraints = 2 * n_matches
+    literals = pairs + 2 * n_matches
+    # Solape: AddAtMostOne por persona con mas de un candidato en la clique
+    overlap = 0
+    for clique in _precompute_overlap_cliques(eligibility.matches):
+        counts = mask[:, clique].sum(axis=1)
+        several = counts > 1
+        overlap += int(several.sum())
+        literals += int(counts[several].sum())
+    constraints += overlap
+    # Carga: limite y definicion de load por persona; max/min de las cargas.
+    # La rotura de simetria (a lo sumo una restriccion por persona) no se cuenta
+    constraints += 2 * loaded + 2
+    literals += 2 * pairs + 3 * loaded
+
+    return ModelEstimate(
+        pairs=pairs,
+        variables=pairs + 2 * n_matches + loaded + 2,
+        constraints=constraints,
+        literals=literals,
+        overlap_constraints=overlap,
+    )
+
+
+def route(
+    eligibility: Eligibility,
+    parameters: SolverParameters,
+    cores: int,
+    memory_budget_mb: float | None = None,
+) -> RoutingDecision:
+    """Elige cpsat, decompose o greedy para la peticion.
+
+    cores: procesos con los que se ejecutaria la descomposicion.
+    """
+    from decompose import _pack_components, split_components
+    from models import RoutingDecision
+
+    budget = MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+    estimate = estimate_model(eligibility)
+
+    def decision(engine: str, reason: str) -> RoutingDecision:
+        return RoutingDecision(
+            engine=engine,
+            reason=reason,
+            candidate_pairs=estimate.pairs,
+            variables=estimate.variables,
+            constraints=estimate.constraints,
+            overlap_constraints=estimate.overlap_constraints,
+            predicted_memory_mb=round(estimate.memory_mb, 1),
+            predicted_build_seconds=round(estimate.build_seconds, 2),
+            memory_budget_mb=budget,
+        )
+
+    if estimate.fits(parameters, budget):
+        return decision("cpsat", "El modelo global cabe en memoria y plazo")
+
+    # Grupos de componentes independientes, construidos en paralelo en un
+    # proceso cada uno (el equilibrio de carga es global: modelo completo)
+    if parameters.balance_weight == 0:
+        components = split_components(eligibility.mask)
+        n_groups = min(len(components), cores)
+        if n_groups > 1:
+            groups = [
+                estimate_model(eligibility, group)
+                for group in _pack_components(components, eligibility.mask, n_groups)
+            ]
+            memory = sum(g.memory_mb for g in groups)
+            build = max(g.build_seconds for g in groups)
+            if (
+                memory <= budget
+                and build <= BUILD_TIME_SHARE * parameters.max_time_seconds
+            ):
+                return decision(
+                    "decompose",
+                    f"{len(groups)} grupos de componentes caben en memoria y plazo",
+                )
+
+    return decision("greedy", "Modelo demasiado grande para memoria o plazo")
+
+
+def solve_auto(
+    matches: list[Match],
+    persons: list[Person],
+    distances: list[Distance] | DistanceMatrix,
+    parameters: SolverParameters,
+    hints: list[PriorAssignment] | None = None,
+    on_solution: Callable[[SolutionEvent], None] | None = None,
+    num_workers: int | None = None,
+    cancel: CancelToken | None = None,
+    features: PersonFeatures | None = None,
+    deadline: Deadline | None = None,
+) -> OptimizationResponse:
+    """Enruta con route() y resuelve; la decision va en metrics.routing.
+
+    La estimacion se carga como fase "routing" del plazo.
+    """
+    from solver import Deadline, solve
+
+    mark = time.time()
+    if deadline is None:
+        deadline = Deadline(mark + parameters.max_time_seconds)
+    distance_matrix = DistanceMatrix.of(distances)
+    if features is None:
+        features = PersonFeatures.from_persons(persons)
+    eligibility = build_eligibility(matches, persons, distance_matrix, features)
+    # Mismos procesos que usaria solve_decomposed
+    decision = route(eligibility, parameters, num_workers or os.cpu_count() or 1)
+    deadline.charge("routing", mark)
+
+    result = solve(
+        matches,
+        persons,
+        distance_matrix,
+        parameters.model_copy(
+            update={
+                "solver_type": "greedy" if decision.engine == "greedy" else "cpsat",
+                "decompose": decision.engine == "decompose",
+            }
+        ),
+        hints=hints,
+        on_solution=on_solution,
+        num_workers=num_workers,
+        cancel=cancel,
+        features=features,
+        deadline=deadline,
+    )
+    result.metrics.routing = decision
+    result.metrics.phase_ms = dict(deadline.phases)
+    return result
@@ -0,0 +1,117 @@
+"""
+Presupuesto global de CPU para los solves concurrentes.
+
+Cada solve reserva un numero de workers CP-SAT segun el tamano de la
+instancia y los cores libres; cuando no quedan cores la peticion espera en
+una cola FIFO acotada y, si la cola esta llena, se rechaza con 429 y
+Retry-After. Todo el estado vive en el event loop: no necesita locks.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+from collections import deque
+
+# Umbrales (personas x partidos) para asignar workers CP-SAT
+WORKER_TIERS = [
+    (20_000, 1),
+    (200_000, 2),
+    (1_000_000, 4),
+]
+MAX_WORKERS_PER_SOLVE = 8
+
+
+class SchedulerSaturated(Exception):
+    """No quedan cores libres y la cola de espera esta llena."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Optimizador saturado, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class CpuScheduler:
+    """Reparte los cores del host entre los solves en curso."""
+
+    def __init__(self, total_cores: int | None = None, max_queue: int | None = None) -> None:
+        self.total_cores = total_cores or int(
+            os.environ.get("OPTIMIZER_CPU_CORES", os.cpu_count() or 1)
+        )
+        self.max_queue = (
+            max_queue
+            if max_queue is not None
+            else int(os.environ.get("OPTIMIZER_MAX_QUEUE", 8))
+        )
+        self.available = self.total_cores
+        self.running = 0
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+        self._avg_solve_seconds = 10.0
+
+    def workers_for(self, n_matches: int, n_persons: int, solver_type: str) -> int:
+        """Workers deseados segun el tamano de la instancia."""
+        if solver_type in ("greedy", "flow"):
+            return 1
+        size = n_matches * n_persons
+        desired = next(
+            (workers for limit, workers in WORKER_TIERS if size < limit),
+            MAX_WORKERS_PER_SOLVE,
+        )
+        return min(desired, self.total_cores)
+
+    def request(self, desired: int) -> asyncio.Future:
+        """Reserva cores: el future resuelve con los workers concedidos.
+
+        Lanza SchedulerSaturated si hay que esperar y la cola esta llena.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if not self._waiters and self.available > 0:
+            future.set_result(self._grant(desired))
+        elif len(self._waiters) >= self.max_queue:
+            raise SchedulerSaturated(self.retry_after())
+        else:
+            self._waiters.append((desired, future))
+        return future
+
+    def cancel(self, future: asyncio.Future) -> None:
+        """Abandona una reserva (en cola o ya concedida).
+
+        Al cancelar la tarea asyncio el future en cola ya llega cancelado:
+        se saca de la cola antes de mirar si esta resuelto.
+        """
+        self._waiters = deque((d, f) for d, f in self._waiters if f is not future)
+        if future.done():
+            if not future.cancelled():
+                self.release(future.result())
+            return
+        future.cancel()
+
+    def release(self, workers: int, elapsed_seconds: float | None = None) -> None:
+        self.available += workers
+        self.running -= 1
+        if elapsed_seconds is not None:
+            self._avg_solve_seconds = 0.8 * self._avg_solve_seconds + 0.2 * elapsed_seconds
+        while self._waiters and self.available > 0:
+            desired, future = self._waiters.popleft()
+            if not future.cancelled():
+                future.set_result(self._grant(desired))
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que se libere un hueco en la cola."""
+        rounds = math.ceil((len(self._waiters) + 1) / self.total_cores)
+        return max(1, math.ceil(self._avg_solve_seconds * rounds))
+
+    def stats(self) -> dict:
+        return {
+            "total_cores": self.total_cores,
+            "available_cores": self.available,
+            "running": self.running,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+        }
+
+    def _grant(self, desired: int) -> int:
+        workers = max(1, min(desired, self.available))
+        self.available -= workers
+        self.running += 1
+        return workers
@@ -7,19 +7,35 @@ minimizando coste de desplazamiento y equilibrando carga.
 
 from __future__ import annotations
 
+import heapq
+import threading
 import time
+from collections import defaultdict
 from datetime import date, timedelta
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, Protocol
 
+import numpy as np
 from ortools.sat.python import cp_model
 
+from distance_matrix import DistanceMatrix
+from eligibility import (
+    ROLE_CODES,
+    ROLE_NAMES,
+    Eligibility,
+    MatchFeatures,
+    PersonFeatures,
+    build_eligibility,
+)
+
 if TYPE_CHECKING:
     from models import (
         Distance,
         Match,
         OptimizationResponse,
         Person,
+        PriorAssignment,
         ProposedAssignment,
+        SolutionEvent,
         SolverMetrics,
         SolverParameters,
         UnassignedSlot,
@@ -36,26 +52,17 @@ CATEGORY_RANK = {
 # Escala para convertir floats a enteros (CP-SAT solo acepta enteros)
 COST_SCALE = 100
 
+# Duracion considerada de un partido a efectos de solapamiento
+OVERLAP_MINUTES = 120
 
-def build_distance_lookup(distances: list[Distance]) -> dict[tuple[str, str], float]:
-    """Construye lookup bidireccional de distancias."""
-    lookup: dict[tuple[str, str], float] = {}
-    for d in distances:
-        lookup[(d.origin_id, d.dest_id)] = d.distance_km
-        lookup[(d.dest_id, d.origin_id)] = d.distance_km
-    return lookup
-
+# Reparto de max_time_seconds entre las etapas del objetivo lexicografico
+STAGE_TIME_SHARES = {"coverage": 0.3, "cost": 0.5, "balance": 0.2}
 
-def get_travel_cost(
-    person_muni: str,
-    venue_muni: str,
-    dist_lookup: dict[tuple[str, str], float],
-) -> tuple[float, float]:
-    """Calcula coste y distancia de desplazamiento."""
-    if person_muni == venue_muni:
-        return 3.0, 0.0
-    km = dist_lookup.get((person_muni, venue_muni), 35.0)
-    return round(km * 0.1, 2), km
+# Plazo extremo a extremo: tiempo reservado tras la busqueda para extraer y
+# serializar la respuesta (o recurrir al greedy), y minimo de busqueda para
+# que CP-SAT compense
+RESPONSE_RESERVE_SECONDS = 0.3
+MIN_SEARCH_SECONDS = 0.5
 
 
 # ── Helpers ─────────────────────────────────────────────────────────────────
@@ -71,62 +78,299 @@ def _get_week_start(date_str: str) -> str:
         return ""
 
 
-def _is_person_available(person: Person, match: Match) -> bool:
-    """Comprueba si una persona esta disponible para un partido."""
-    if not person.availabilities:
-        return True  # Sin datos de disponibilidad = disponible (demo)
-
-    match_date_str = match.date
-    match_time = match.time
-    match_week = _get_week_start(match_date_str)
-
-    try:
-        match_d = date.fromisoformat(match_date_str)
-        match_dow = match_d.weekday()  # 0=lunes ... 6=domingo
-        # Convertir a dayOfWeek JS (0=dom, 1=lun ... 6=sab)
-        js_dow = (match_dow + 1) % 7
-        if js_dow == 0:
-            js_dow = 7  # Usar 7 para domingo si el frontend usa 5=viernes,6=sabado
-        # El frontend usa: 5=viernes, 6=sabado — dayOfWeek del ISO
-        # En mock-data: dayOfWeek 5=sabado(viernes?), 6=domingo(sabado?)
-        # Usar el weekday de Python: 0=lun..6=dom, y el frontend guarda 5=sab, 6=dom
-        # Python: sabado=5, domingo=6 — coincide con el frontend
-    except (ValueError, TypeError):
-        return True
-
-    match_hour = int(match_time.split(":")[0])
-
-    for avail in person.availabilities:
-        # Filtrar por semana si week_start esta definido
-        if avail.week_start and match_week and avail.week_start != match_week:
-            continue
-
-        if avail.day_of_week != match_dow:
-            continue
-
-        avail_start = int(avail.start_time.split(":")[0])
-        avail_end = int(avail.end_time.split(":")[0])
-        if avail_start <= match_hour < avail_end:
-            return True
-
-    return False
+def _time_to_minutes(time_str: str) -> int:
+    """Minutos desde medianoche para una hora HH:MM (o HH)."""
+    hours, _, minutes = time_str.partition(":")
+    return int(hours) * 60 + int(minutes[:2] or 0)
+
+
+def _precompute_overlap_cliques(
+    matches: MatchFeatures,
+) -> list[list[int]]:
+    """Agrupa partidos que solapan (<2h diferencia, mismo dia) en cliques maximales.
+
+    Cada partido ocupa el intervalo [hora, hora + 2h). Se recorren los partidos
+    de cada dia ordenados por inicio y se emite el conjunto activo justo antes
+    de que termine alguno de sus intervalos: en un grafo de intervalos esos
+    conjuntos son exactamente los cliques maximales, y todo par solapado esta
+    contenido en al menos uno.
+    """
+    by_date: dict[int, list[tuple[int, int]]] = defaultdict(list)
+    for mi, (day, hour) in enumerate(
+        zip(matches.day.tolist(), matches.start_hour.tolist())
+    ):
+        by_date[day].append((hour * 60, mi))
+
+    cliques: list[list[int]] = []
+    for day_matches in by_date.values():
+        day_matches.sort()
+        ends: list[tuple[int, int]] = []  # heap (fin, partido) de activos
+        active: set[int] = set()
+        grown = False
+        for start_min, mi in day_matches:
+            if ends and ends[0][0] <= start_min:
+                if grown and len(active) > 1:
+                    cliques.append(sorted(active))
+                while ends and ends[0][0] <= start_min:
+                    active.discard(heapq.heappop(ends)[1])
+                grown = False
+            heapq.heappush(ends, (start_min + OVERLAP_MINUTES, mi))
+            active.add(mi)
+            grown = True
+        if grown and len(active) > 1:
+            cliques.append(sorted(active))
+    return cliques
+
+
+class CancelToken(Protocol):
+    """Evento de cancelacion (threading.Event o proxy de multiprocessing)."""
+
+    def is_set(self) -> bool: ...
+
+    def wait(self, timeout: float | None = None) -> bool: ...
+
+
+class Deadline:
+    """Plazo de la peticion (epoch de time.time()) compartido por sus fases.
+
+    Cada fase se carga al terminar con charge(); los solvers anidados
+    (portfolio, auto, fallback greedy) reciben el mismo plazo.
+    """
+
+    def __init__(self, at: float) -> None:
+        self.at = at
+        self.phases: dict[str, int] = {}
+
+    @classmethod
+    def after(cls, seconds: float) -> Deadline:
+        return cls(time.time() + seconds)
+
+    def remaining(self) -> float:
+        return self.at - time.time()
+
+    def expired(self) -> bool:
+        return time.time() >= self.at
+
+    def charge(self, phase: str, since: float) -> float:
+        """Suma a phase el tiempo desde since; devuelve el instante actual."""
+        now = time.time()
+        self.phases[phase] = self.phases.get(phase, 0) + int((now - since) * 1000)
+        return now
+
+
+class _SearchMonitor:
+    """Hilo que detiene la busqueda CP-SAT al cancelar o al estancarse.
+
+    El estancamiento (tracker.stagnant) no depende de que llegue ninguna
+    solucion, por eso se vigila aqui y no en el callback.
+    """
+
+    POLL_SECONDS = 0.1
+
+    def __init__(
+        self,
+        solver: cp_model.CpSolver,
+        cancel: CancelToken | None,
+        tracker: _SolutionTracker | None = None,
+    ) -> None:
+        self._solver = solver
+        self._cancel = cancel
+        self._tracker = tracker
+        self._finished = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> _SearchMonitor:
+        watch_stagnation = (
+            self._tracker is not None and self._tracker.no_improvement_seconds is not None
+        )
+        if self._cancel is not None or watch_stagnation:
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._finished.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _watch(self) -> None:
+        while not self._finished.is_set():
+            if self._cancel is not None:
+                if self._cancel.wait(self.POLL_SECONDS):
+                    self._solver.stop_search()
+                    return
+            elif self._finished.wait(self.POLL_SECONDS):
+                return
+            # Una parada por etapa: la siguiente etapa reinicia el tracker
+            if self._tracker is not None and self._tracker.stagnant():
+                self._tracker.early_stop = "stagnation"
+                self._solver.stop_search()
+
+
+class _SolutionTracker(cp_model.CpSolverSolutionCallback):
+    """Registra cuando aparece la primera solucion factible.
+
+    Con un callback de soluciones y varios workers, ortools 9.11 no siempre
+    termina al probar la optimalidad y agota max_time_seconds: el tracker
+    corta la busqueda en cuanto la cota alcanza a la mejor solucion, o queda
+    a menos de relative_gap_tolerance de ella.
+    """
+
+    def __init__(
+        self,
+        start: float,
+        solver: cp_model.CpSolver,
+        stream: _SolutionStream | None = None,
+        relative_gap_tolerance: float = 0.0,
+        no_improvement_seconds: float | None = None,
+    ) -> None:
+        super().__init__()
+        self._start = start
+        self._solver = solver
+        self._stream = stream
+        self.relative_gap_tolerance = relative_gap_tolerance
+        self.no_improvement_seconds = no_improvement_seconds
+        self.first_solution_ms: int | None = None
+        self.best_objective: float | None = None
+        self.improved_at: float | None = None
+        self.early_stop: str | None = None  # gap, stagnation
+        solver.best_bound_callback = self._on_bound
+
+    def new_stage(self) -> None:
+        """Olvida el mejor objetivo: cada etapa minimiza una expresion distinta."""
+        self.best_objective = None
+        self.improved_at = None
+
+    def stagnant(self) -> bool:
+        """Sin mejora en no_improvement_seconds desde la ultima solucion."""
+        improved_at = self.improved_at
+        return (
+            self.no_improvement_seconds is not None
+            and improved_at is not None
+            and time.time() - improved_at >= self.no_improvement_seconds
+        )
+
+    def on_solution_callback(self) -> None:
+        if self.first_solution_ms is None:
+            self.first_solution_ms = int((time.time() - self._start) * 1000)
+        self.best_objective = self.objective_value
+        self.improved_at = time.time()
+        if self._stream is not None:
+            self._stream.publish(self)
+        self._check_gap(self.objective_value, self.best_objective_bound, self.stop_search)
+
+    def _on_bound(self, bound: float) -> None:
+        if self.best_objective is not None:
+            self._check_gap(self.best_objective, bound, self._solver.stop_search)
+
+    def _check_gap(self, objective: float, bound: float, stop: Callable[[], None]) -> None:
+        if bound >= objective:
+            stop()
+        elif relative_gap(objective, bound) <= self.relative_gap_tolerance:
+            self.early_stop = "gap"
+            stop()
+
+
+def relative_gap(objective: float, bound: float) -> float:
+    """Gap relativo de una minimizacion, como lo define CP-SAT."""
+    return abs(objective - bound) / max(1.0, abs(objective))
+
+
+class _SolutionStream:
+    """Convierte cada solucion mejorada en un SolutionEvent con el diff."""
+
+    def __init__(
+        self,
+        start: float,
+        matches: list[Match],
+        persons: list[Person],
+        x: dict[tuple[int, int], cp_model.IntVar],
+        slack_vars: list[cp_model.IntVar],
+        travel_cost: Callable[[int, int], np.ndarray],
+        existing: set[tuple[int, int]],
+        emit: Callable[[SolutionEvent], None],
+    ) -> None:
+        self._start = start
+        self._matches = matches
+        self._persons = persons
+        self._keys = list(x)
+        self._var_indices = np.array([v.index for v in x.values()], dtype=np.int64)
+        self._slack_indices = np.array([v.index for v in slack_vars], dtype=np.int64)
+        self._travel_cost = travel_cost
+        self._existing = existing
+        self._emit = emit
+        self._total_slots = sum(m.referees_needed + m.scorers_needed for m in matches)
+        self._previous: set[tuple[int, int]] = set()
+
+    def publish(self, callback: cp_model.CpSolverSolutionCallback) -> None:
+        from models import PriorAssignment, SolutionEvent
+
+        values = np.asarray(callback.response_proto.solution, dtype=np.int64)
+        chosen = {
+            self._keys[k]
+            for k in np.flatnonzero(values[self._var_indices]).tolist()
+        }
+        covered = self._total_slots - int(values[self._slack_indices].sum())
+
+        def as_prior(pairs: set[tuple[int, int]]) -> list[PriorAssignment]:
+            return [
+                PriorAssignment(
+                    match_id=self._matches[mi].id, person_id=self._persons[pi].id
+                )
+                for pi, mi in sorted(pairs)
+            ]
 
+        event = SolutionEvent(
+            objective=callback.objective_value,
+            coverage=(
+                round(covered / self._total_slots * 100, 1) if self._total_slots else 100
+            ),
+            covered_slots=covered,
+            total_cost=round(
+                sum(
+                    float(self._travel_cost(pi, mi))
+                    for pi, mi in chosen
+                    if (pi, mi) not in self._existing
+                ),
+                2,
+            ),
+            elapsed_ms=int((time.time() - self._start) * 1000),
+            added=as_prior(chosen - self._previous),
+            removed=as_prior(self._previous - chosen),
+        )
+        self._previous = chosen
+        self._emit(event)
+
+
+def _objective_stages(
+    parameters: SolverParameters,
+    coverage: cp_model.LinearExprT,
+    cost: cp_model.LinearExprT,
+    balance: cp_model.LinearExprT,
+) -> list[tuple[str, cp_model.LinearExprT, float]]:
+    """Etapas (nombre, expresion a minimizar, fraccion de tiempo) del solve.
+
+    weighted: una etapa con la suma ponderada (big-M para la cobertura).
+    lexicographic: cobertura, coste y equilibrio por separado; las etapas
+    con peso 0 se omiten.
+    """
+    if parameters.objective_mode == "lexicographic":
+        stages = [("coverage", coverage, STAGE_TIME_SHARES["coverage"])]
+        if parameters.cost_weight > 0:
+            stages.append(("cost", cost, STAGE_TIME_SHARES["cost"]))
+        if parameters.balance_weight > 0:
+            stages.append(("balance", balance, STAGE_TIME_SHARES["balance"]))
+        return stages
 
-def _precompute_overlapping_pairs(
-    matches: list[Match],
-) -> list[tuple[int, int]]:
-    """Devuelve pares de indices de partidos que solapan temporalmente (<2h diferencia, mismo dia)."""
-    pairs: list[tuple[int, int]] = []
-    n = len(matches)
-    for i in range(n):
-        for j in range(i + 1, n):
-            if matches[i].date != matches[j].date:
-                continue
-            h1 = int(matches[i].time.split(":")[0])
-            h2 = int(matches[j].time.split(":")[0])
-            if abs(h1 - h2) < 2:
-                pairs.append((i, j))
-    return pairs
+    coverage_penalty = 10000 * COST_SCALE
+    cost_weight_scaled = int(parameters.cost_weight * 100)
+    balance_weight_scaled = int(parameters.balance_weight * 100 * COST_SCALE)
+    weighted = (
+        coverage_penalty * coverage
+        + cost_weight_scaled * cost
+        + balance_weight_scaled * balance
+    )
+    return [("weighted", weighted, 1.0)]
 
 
 # ── Dispatcher ──────────────────────────────────────────────────────────────
@@ -135,13 +379,105 @@ def _precompute_overlapping_pairs(
 def solve(
     matches: list[Match],
     persons: list[Person],
-    distances: list[Distance],
+    distances: list[Distance] | DistanceMatrix,
     parameters: SolverParameters,
+    hints: list[PriorAssignment] | None = None,
+    on_solution: Callable[[SolutionEvent], None] | None = None,
+    num_workers: int | None = None,
+    cancel: CancelToken | None = None,
+    features: PersonFeatures | None = None,
+    deadline: Deadline | None = None,
 ) -> OptimizationResponse:
-    """Dispatcher: elige solver segun parameters.solver_type."""
+    """Dispatcher: elige solver segun parameters.solver_type.
+
+    on_solution solo lo emite CP-SAT sobre el modelo global (tambien dentro
+    del portfolio).
+    num_workers: cores concedidos por el scheduler (None = 4 para CP-SAT y
+    todos los cores para la descomposicion).
+    cancel: token compartido para abortar el solve desde fuera.
+    features: datos por persona precalculados por el registro de plantillas.
+    deadline: plazo extremo a extremo (None = max_time_seconds desde ahora).
+    """
+    if deadline is None:
+        deadline = Deadline.after(parameters.max_time_seconds)
     if parameters.solver_type == "greedy":
-        return solve_greedy(matches, persons, distances, parameters)
-    return solve_cpsat(matches, persons, distances, parameters)
+        return solve_greedy(
+            matches,
+            persons,
+            distances,
+            parameters,
+            cancel=cancel,
+            features=features,
+            deadline=deadline,
+        )
+    if parameters.solver_type == "flow":
+        from flow import solve_flow
+
+        return solve_flow(
+            matches,
+            persons,
+            distances,
+            parameters,
+            cancel=cancel,
+            features=features,
+            deadline=deadline,
+        )
+    if parameters.solver_type == "auto":
+        from routing import solve_auto
+
+        return solve_auto(
+            matches,
+            persons,
+            distances,
+            parameters,
+            hints=hints,
+            on_solution=on_solution,
+            num_workers=num_workers,
+            cancel=cancel,
+            features=features,
+            deadline=deadline,
+        )
+    if parameters.solver_type == "portfolio":
+        from portfolio import solve_portfolio
+
+        return solve_portfolio(
+            matches,
+            persons,
+            distances,
+            parameters,
+            hints=hints,
+            on_solution=on_solution,
+            num_workers=num_workers,
+            cancel=cancel,
+            features=features,
+            deadline=deadline,
+        )
+    if parameters.decompose:
+        from decompose import solve_decomposed
+
+        return solve_decomposed(
+            matches,
+            persons,
+            distances,
+            parameters,
+            max_processes=num_workers,
+            hints=hints,
+            cancel=cancel,
+            features=features,
+            deadline=deadline,
+        )
+    return solve_cpsat(
+        matches,
+        persons,
+        distances,
+        parameters,
+        num_workers=num_workers or 4,
+        hints=hints,
+        on_solution=on_solution,
+        cancel=cancel,
+        features=features,
+        deadline=deadline,
+    )
 
 
 # ── CP-SAT Solver ───────────────────────────────────────────────────────────
@@ -150,19 +486,44 @@ def solve(
 def solve_cpsat(
     matches: list[Match],
     persons: list[Person],
-    distances: list[Distance],
+    distances: list[Distance] | DistanceMatrix,
     parameters: SolverParameters,
+    num_workers: int = 4,
+    hints: list[PriorAssignment] | None = None,
+    on_solution: Callable[[SolutionEvent], None] | None = None,
+    cancel: CancelToken | None = None,
+    features: PersonFeatures | None = None,
+    deadline: Deadline | None = None,
+    bounds: bool = True,
 ) -> OptimizationResponse:
-    """Solver optimo con OR-Tools CP-SAT."""
+    """Solver optimo con OR-Tools CP-SAT.
+
+    hints: solucion previa para arrancar en caliente (None = designaciones).
+    on_solution: recibe cada solucion mejorada mientras CP-SAT sigue buscando.
+    cancel: al activarse se detiene la busqueda (StopSearch) y se devuelve la
+    mejor solucion encontrada con status "cancelled".
+    deadline: preprocesado, construccion, busqueda y extraccion se cargan
+    contra el; si no queda tiempo para buscar, o la busqueda no encuentra
+    solucion, se devuelve el greedy calculado antes de construir el modelo
+    (metrics.degraded).
+    bounds: permitir las cotas de parameters.relaxation_bounds (los
+    sub-problemas de decompose y reoptimize no las usan).
+    """
+    from flow import solve_relaxation
     from models import (
         OptimizationResponse,
         ProposedAssignment,
         SolverMetrics,
+        StageMetrics,
         UnassignedSlot,
     )
 
-    start = time.time()
-    dist_lookup = build_distance_lookup(distances)
+    start = mark = time.time()
+    if deadline is None:
+        deadline = Deadline(start + parameters.max_time_seconds)
+    distance_matrix = DistanceMatrix.of(distances)
+    if features is None:
+        features = PersonFeatures.from_persons(persons)
     model = cp_model.CpModel()
 
     # ── Pre-filtrado: determinar pares (persona, partido) factibles ─────────
@@ -171,94 +532,124 @@ def solve_cpsat(
     match_idx = {m.id: i for i, m in enumerate(matches)}
     person_idx = {p.id: i for i, p in enumerate(persons)}
 
-    # Variables de decision: x[pi, mi] = 1 si persona pi asignada a partido mi
-    x: dict[tuple[int, int], cp_model.IntVar] = {}
-    cost_lookup: dict[tuple[int, int], int] = {}  # coste escalado a entero
+    eligibility = build_eligibility(matches, persons, distance_matrix, features)
 
-    for pi, person in enumerate(persons):
-        if not person.active:
-            continue
-        for mi, match in enumerate(matches):
-            # Filtro rol
-            role_needed = (
-                (person.role == "arbitro" and match.referees_needed > 0)
-                or (person.role == "anotador" and match.scorers_needed > 0)
-            )
-            if not role_needed:
-                continue
+    def degrade(reason: str) -> OptimizationResponse:
+        """Suelo greedy con el plazo agotado o sin solucion de CP-SAT."""
+        result = floor
+        result.metrics.resolution_time_ms = int((time.time() - start) * 1000)
+        result.metrics.phase_ms = dict(deadline.phases)
+        result.metrics.degraded = reason
+        result.metrics.bound_covered_slots = bound_covered_slots
+        result.metrics.bound_cost = bound_cost
+        return result
 
-            # Filtro categoria minima (solo arbitros)
-            if person.role == "arbitro" and match.competition.min_ref_category:
-                if CATEGORY_RANK.get(person.category or "", 0) < CATEGORY_RANK.get(
-                    match.competition.min_ref_category, 0
-                ):
-                    continue
+    # Sin tiempo para construir el modelo: prevision calibrada de routing
+    from routing import estimate_model
 
-            # Filtro disponibilidad
-            if not _is_person_available(person, match):
-                continue
+    mark = deadline.charge("preprocess", mark)
 
-            # Filtro incompatibilidades
-            incompatible = False
-            for inc in person.incompatibilities:
-                if (
-                    inc.team_name.lower() in match.home_team.lower()
-                    or inc.team_name.lower() in match.away_team.lower()
-                ):
-                    incompatible = True
-                    break
-            if incompatible:
-                continue
+    # Suelo greedy antes de construir y buscar (milisegundos): es la respuesta
+    # si CP-SAT no llega a tiempo, y calculado al final el plazo ya lo cortaria.
+    # Plazo propio: sus fases no se mezclan con las de CP-SAT
+    floor = solve_greedy(
+        matches,
+        persons,
+        distance_matrix,
+        parameters,
+        cancel=cancel,
+        features=features,
+        deadline=Deadline(deadline.at),
+    )
+    mark = deadline.charge("fallback", mark)
+
+    # Cotas de la relajacion de transporte, solo informativas y a peticion:
+    # se calculan antes de buscar para que salgan del presupuesto de busqueda
+    # y no alarguen la respuesta; sin ellas si no queda plazo o el flujo falla
+    bound_covered_slots: int | None = None
+    bound_cost: float | None = None
+    if (
+        bounds
+        and parameters.relaxation_bounds
+        and not deadline.expired()
+        and not (cancel is not None and cancel.is_set())
+    ):
+        try:
+            relaxation = solve_relaxation(matches, persons, eligibility, parameters)
+            bound_covered_slots, bound_cost = relaxation.covered_slots, relaxation.cost
+        except RuntimeError:
+            pass
+        mark = deadline.charge("bound", mark)
+
+    build_seconds = estimate_model(eligibility).build_seconds
+    if build_seconds + MIN_SEARCH_SECONDS > deadline.remaining():
+        return degrade(f"Construir el modelo (~{build_seconds:.1f} s) no cabe en el plazo")
 
-            # Crear variable
-            x[pi, mi] = model.new_bool_var(f"x_{pi}_{mi}")
+    # Variables de decision: x[pi, mi] = 1 si persona pi asignada a partido mi
+    x: dict[tuple[int, int], cp_model.IntVar] = {}
+    cost_lookup: dict[tuple[int, int], int] = {}  # coste escalado a entero
 
-            # Precalcular coste
-            cost, km = get_travel_cost(
-                person.municipality_id, match.venue.municipality_id, dist_lookup
-            )
-            cost_scaled = int(cost * COST_SCALE)
-            if not person.has_car and km > 15:
-                cost_scaled = int(cost_scaled * 2.0)
-            cost_lookup[pi, mi] = cost_scaled
+    # Indices de adyacencia, construidos una sola vez: las restricciones
+    # recorren solo las variables creadas en lugar de personas x partidos
+    match_role_vars: dict[tuple[int, int], list[cp_model.IntVar]] = defaultdict(list)
+    person_vars: dict[int, dict[int, cp_model.IntVar]] = defaultdict(dict)
+
+    pairs = np.argwhere(eligibility.mask)
+    pair_costs = eligibility.cost_scaled(pairs[:, 0], pairs[:, 1]).tolist()
+    for (pi, mi), cost in zip(pairs.tolist(), pair_costs):
+        var = model.new_bool_var(f"x_{pi}_{mi}")
+        x[pi, mi] = var
+        cost_lookup[pi, mi] = cost
+        match_role_vars[mi, int(eligibility.person_role[pi])].append(var)
+        person_vars[pi][mi] = var
+    # Indices en la solucion del proto, en el orden de pairs
+    var_indices = np.array([v.index for v in x.values()], dtype=np.int64)
 
     # ── Restricciones ───────────────────────────────────────────────────────
 
     # 1. Cobertura SOFT con variables slack
     slack_vars: list[cp_model.IntVar] = []
+    slack_by_slot: dict[tuple[int, int], cp_model.IntVar] = {}
+    slot_needed: dict[tuple[int, int], int] = {}
 
-    for mi, match in enumerate(matches):
-        for role, needed in [
-            ("arbitro", match.referees_needed),
-            ("anotador", match.scorers_needed),
-        ]:
-            role_vars = [
-                x[pi, mi]
-                for pi, p in enumerate(persons)
-                if (pi, mi) in x and p.role == role
-            ]
+    for mi, match_needed in enumerate(eligibility.matches.needed.tolist()):
+        for role, code in ROLE_CODES.items():
+            needed = match_needed[code]
+            role_vars = match_role_vars.get((mi, code), [])
 
             slack = model.new_int_var(0, needed, f"slack_{mi}_{role}")
             slack_vars.append(slack)
+            slack_by_slot[mi, code] = slack
+            slot_needed[mi, code] = needed
 
             if role_vars:
-                model.add(sum(role_vars) + slack == needed)
+                model.add(cp_model.LinearExpr.sum(role_vars) + slack == needed)
             else:
                 # Ningun candidato posible → slack = needed
                 model.add(slack == needed)
+    slack_indices = np.array([v.index for v in slack_vars], dtype=np.int64)
 
     # 2. No solapamiento temporal
-    overlapping = _precompute_overlapping_pairs(matches)
-    for pi in range(len(persons)):
-        for mi1, mi2 in overlapping:
-            if (pi, mi1) in x and (pi, mi2) in x:
-                model.add(x[pi, mi1] + x[pi, mi2] <= 1)
+    #    Un AddAtMostOne por persona y clique de partidos solapados
+    cliques_of: dict[int, list[int]] = defaultdict(list)
+    for ci, clique in enumerate(_precompute_overlap_cliques(eligibility.matches)):
+        for mi in clique:
+            cliques_of[mi].append(ci)
+    for vars_by_match in person_vars.values():
+        per_clique: dict[int, list[cp_model.IntVar]] = defaultdict(list)
+        for mi, var in vars_by_match.items():
+            for ci in cliques_of.get(mi, ()):
+                per_clique[ci].append(var)
+        for clique_vars in per_clique.values():
+            if len(clique_vars) > 1:
+                model.add_at_most_one(clique_vars)
 
     # 3. Carga maxima por persona
-    for pi in range(len(persons)):
-        person_vars = [x[pi, mi] for mi in range(len(matches)) if (pi, mi) in x]
-        if person_vars:
-            model.add(sum(person_vars) <= parameters.max_matches_per_person)
+    for pi, vars_by_match in person_vars.items():
+        model.add(
+            cp_model.LinearExpr.sum(list(vars_by_match.values()))
+            <= parameters.max_matches_per_person
+        )
 
     # 4. Forzar designaciones existentes
     if parameters.force_existing:
@@ -273,15 +664,17 @@ def solve_cpsat(
     # Variables de carga por persona activa
     active_persons = [pi for pi, p in enumerate(persons) if p.active]
     load_vars: list[cp_model.IntVar] = []
+    load_by_person: dict[int, cp_model.IntVar] = {}
 
     for pi in active_persons:
-        person_vars = [x[pi, mi] for mi in range(len(matches)) if (pi, mi) in x]
-        if person_vars:
+        vars_by_match = person_vars.get(pi)
+        if vars_by_match:
             load = model.new_int_var(
                 0, parameters.max_matches_per_person, f"load_{pi}"
             )
-            model.add(load == sum(person_vars))
+            model.add(load == cp_model.LinearExpr.sum(list(vars_by_match.values())))
             load_vars.append(load)
+            load_by_person[pi] = load
 
     max_load = model.new_int_var(0, parameters.max_matches_per_person, "max_load")
     min_load = model.new_int_var(0, parameters.max_matches_per_person, "min_load")
@@ -296,85 +689,221 @@ def solve_cpsat(
     # ── Funcion objetivo ────────────────────────────────────────────────────
 
     # Prioridad 1: maximizar cobertura (minimizar slack)
-    coverage_penalty = 10000 * COST_SCALE
-    coverage_term = coverage_penalty * sum(slack_vars)
-
+    coverage_expr = cp_model.LinearExpr.sum(slack_vars)
     # Prioridad 2: minimizar coste de desplazamiento
-    cost_weight_scaled = int(parameters.cost_weight * 100)
-    cost_term = cost_weight_scaled * sum(
-        cost_lookup[pi, mi] * x[pi, mi] for (pi, mi) in x
+    cost_expr = cp_model.LinearExpr.weighted_sum(
+        list(x.values()), list(cost_lookup.values())
     )
-
     # Prioridad 3: equilibrar carga
-    balance_weight_scaled = int(parameters.balance_weight * 100 * COST_SCALE)
-    balance_term = balance_weight_scaled * (max_load - min_load)
+    balance_expr = max_load - min_load
+
+    stages = _objective_stages(parameters, coverage_expr, cost_expr, balance_expr)
+
+    # ── Warm-start ──────────────────────────────────────────────────────────
 
-    model.minimize(coverage_term + cost_term + balance_term)
+    # Solucion previa como hint; por defecto, las designaciones del partido
+    if hints is None:
+        hinted_ids = {(d.person_id, m.id) for m in matches for d in m.designations}
+    else:
+        hinted_ids = {(h.person_id, h.match_id) for h in hints}
+
+    hinted: set[tuple[int, int]] = set()
+    slot_hinted: dict[tuple[int, int], int] = defaultdict(int)
+    for person_id, match_id in hinted_ids:
+        pi, mi = person_idx.get(person_id), match_idx.get(match_id)
+        if pi is None or mi is None or (pi, mi) not in x:
+            continue
+        slot = (mi, int(eligibility.person_role[pi]))
+        if slot_hinted[slot] < slot_needed[slot]:
+            hinted.add((pi, mi))
+            slot_hinted[slot] += 1
+
+    if hinted:
+        for key, var in x.items():
+            model.add_hint(var, 1 if key in hinted else 0)
+        for slot, slack in slack_by_slot.items():
+            model.add_hint(slack, slot_needed[slot] - slot_hinted.get(slot, 0))
+        hinted_load: dict[int, int] = defaultdict(int)
+        for pi, _ in hinted:
+            hinted_load[pi] += 1
+        for pi, load in load_by_person.items():
+            model.add_hint(load, hinted_load.get(pi, 0))
+
+    # ── Simetria ────────────────────────────────────────────────────────────
+
+    # Personas intercambiables: cualquier permutacion de sus asignaciones es
+    # una solucion equivalente. Ordenar sus cargas (load_k >= load_k+1) deja
+    # un unico representante; las personas con designaciones o hints quedan
+    # fuera para no invalidar force_existing ni el warm-start
+    pinned = {person_idx[pid] for pid, _ in hinted_ids if pid in person_idx} | {
+        person_idx[d.person_id]
+        for m in matches
+        for d in m.designations
+        if d.person_id in person_idx
+    }
+    symmetry_classes = eligibility.interchangeable_classes(pinned)
+    for members in symmetry_classes:
+        loads = [load_by_person[pi] for pi in members if pi in load_by_person]
+        for heavier, lighter in zip(loads, loads[1:]):
+            model.add(heavier >= lighter)
 
     # ── Resolver ────────────────────────────────────────────────────────────
 
+    mark = deadline.charge("build", mark)
+    remaining_time = deadline.remaining() - RESPONSE_RESERVE_SECONDS
+    if remaining_time < MIN_SEARCH_SECONDS:
+        return degrade("Sin tiempo de busqueda tras construir el modelo")
+
     solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = parameters.max_time_seconds
-    solver.parameters.num_workers = 4
+    solver.parameters.max_time_in_seconds = remaining_time
+    solver.parameters.num_workers = num_workers
+
+    stream = None
+    if on_solution is not None:
+        existing = (
+            {
+                (person_idx[d.person_id], mi)
+                for mi, m in enumerate(matches)
+                for d in m.designations
+                if d.person_id in person_idx
+            }
+            if parameters.force_existing
+            else set()
+        )
+        stream = _SolutionStream(
+            start,
+            matches,
+            persons,
+            x,
+            slack_vars,
+            eligibility.travel_cost,
+            existing,
+            on_solution,
+        )
+    tracker = _SolutionTracker(
+        start,
+        solver,
+        stream,
+        relative_gap_tolerance=parameters.relative_gap_tolerance,
+        no_improvement_seconds=parameters.no_improvement_seconds,
+    )
 
-    status = solver.solve(model)
+    # Cada etapa minimiza su objetivo, fija el nivel alcanzado y pasa su
+    # solucion como hint a la siguiente; el tiempo no usado se reparte
+    status = cp_model.UNKNOWN
+    solution: np.ndarray | None = None
+    stage_metrics: list[StageMetrics] = []
+    with _SearchMonitor(solver, cancel, tracker):
+        for k, (name, expr, share) in enumerate(stages):
+            if cancel is not None and cancel.is_set():
+                break
+            model.minimize(expr)
+            shares_left = sum(s for _, _, s in stages[k:])
+            solver.parameters.max_time_in_seconds = max(
+                0.1, remaining_time * share / shares_left
+            )
+            stage_start = time.time()
+            tracker.new_stage()
+            stage_status = solver.solve(model, tracker)
+            remaining_time -= time.time() - stage_start
+
+            found = stage_status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+            stage_metrics.append(
+                StageMetrics(
+                    name=name,
+                    status=solver.status_name(stage_status).lower(),
+                    objective=solver.objective_value if found else None,
+                    proven_optimal=stage_status == cp_model.OPTIMAL,
+                    relative_gap=(
+                        round(
+                            relative_gap(solver.objective_value, solver.best_objective_bound),
+                            6,
+                        )
+                        if found
+                        else None
+                    ),
+                    time_ms=int((time.time() - stage_start) * 1000),
+                )
+            )
+            if not found:
+                if solution is None:
+                    status = stage_status
+                break
+            solution = np.asarray(solver.response_proto.solution, dtype=np.int64)
+            status = (
+                cp_model.OPTIMAL
+                if all(s.proven_optimal for s in stage_metrics)
+                else cp_model.FEASIBLE
+            )
+            if k + 1 < len(stages):
+                model.add(expr <= round(solver.objective_value))
+                model.clear_hints()
+                model.proto.solution_hint.vars.extend(range(len(solution)))
+                model.proto.solution_hint.values.extend(solution.tolist())
+
+    mark = deadline.charge("solve", mark)
+    if not (cancel is not None and cancel.is_set()):
+        if solution is None:
+            return degrade("CP-SAT no encontro solucion en el plazo")
+        # Busqueda cortada (plazo, gap o estancamiento): la cobertura manda en
+        # el objetivo y el greedy puede cubrir mas plazas que la mejor hallada
+        if status != cp_model.OPTIMAL:
+            covered = int(eligibility.matches.needed.sum() - solution[slack_indices].sum())
+            if floor.metrics.covered_slots > covered:
+                result = degrade(
+                    f"CP-SAT cubre {covered} plazas en el plazo y el greedy "
+                    f"{floor.metrics.covered_slots}"
+                )
+                result.metrics.early_stop = tracker.early_stop
+                return result
 
     # ── Extraer solucion ────────────────────────────────────────────────────
 
     assignments: list[ProposedAssignment] = []
     unassigned: list[UnassignedSlot] = []
 
-    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-        for (pi, mi), var in x.items():
-            if solver.value(var) == 1:
-                person = persons[pi]
-                match = matches[mi]
-                cost, km = get_travel_cost(
-                    person.municipality_id,
-                    match.venue.municipality_id,
-                    dist_lookup,
+    if solution is not None:
+        # Lectura en bloque: pares elegidos, coste y km solo de esos pares
+        chosen = pairs[np.flatnonzero(solution[var_indices])]
+        chosen_pi, chosen_mi = chosen[:, 0], chosen[:, 1]
+        costs = eligibility.travel_cost(chosen_pi, chosen_mi).tolist()
+        kms = eligibility.distance_km(chosen_pi, chosen_mi).tolist()
+        designated = (
+            {(d.person_id, mi) for mi, m in enumerate(matches) for d in m.designations}
+            if parameters.force_existing
+            else set()
+        )
+        for pi, mi, cost, km in zip(chosen_pi.tolist(), chosen_mi.tolist(), costs, kms):
+            person = persons[pi]
+            assignments.append(
+                ProposedAssignment(
+                    match_id=matches[mi].id,
+                    person_id=person.id,
+                    person_name=person.name,
+                    role=person.role,
+                    travel_cost=cost,
+                    distance_km=km,
+                    is_new=(person.id, mi) not in designated,
                 )
-                # Determinar si es nueva o existente
-                is_existing = False
-                if parameters.force_existing:
-                    for d in match.designations:
-                        if d.person_id == person.id:
-                            is_existing = True
-                            break
+            )
 
-                assignments.append(
-                    ProposedAssignment(
+        # Slots sin cubrir: el slack de cada (partido, rol) es lo que falta
+        slack_values = solution[slack_indices].tolist()
+        for (mi, code), missing in zip(slack_by_slot, slack_values):
+            if not missing:
+                continue
+            match = matches[mi]
+            needed = slot_needed[mi, code]
+            for slot_idx in range(needed - missing, needed):
+                unassigned.append(
+                    UnassignedSlot(
                         match_id=match.id,
-                        person_id=person.id,
-                        person_name=person.name,
-                        role=person.role,
-                        travel_cost=cost,
-                        distance_km=km,
-                        is_new=not is_existing,
+                        match_label=f"{match.home_team} vs {match.away_team}",
+                        role=ROLE_NAMES[code],
+                        slot_index=slot_idx,
+                        reason="Sin candidatos factibles",
                     )
                 )
-
-        # Detectar slots sin cubrir
-        for mi, match in enumerate(matches):
-            for role, needed in [
-                ("arbitro", match.referees_needed),
-                ("anotador", match.scorers_needed),
-            ]:
-                assigned_count = sum(
-                    1
-                    for a in assignments
-                    if a.match_id == match.id and a.role == role
-                )
-                for slot_idx in range(assigned_count, needed):
-                    unassigned.append(
-                        UnassignedSlot(
-                            match_id=match.id,
-                            match_label=f"{match.home_team} vs {match.away_team}",
-                            role=role,
-                            slot_index=slot_idx,
-                            reason="Sin candidatos factibles",
-                        )
-                    )
     else:
         # No se encontro solucion — reportar todos los slots
         for mi, match in enumerate(matches):
@@ -393,6 +922,7 @@ def solve_cpsat(
                         )
                     )
 
+    deadline.charge("extract", mark)
     elapsed_ms = int((time.time() - start) * 1000)
     new_assignments = [a for a in assignments if a.is_new]
     total_slots = sum(m.referees_needed + m.scorers_needed for m in matches)
@@ -404,6 +934,8 @@ def solve_cpsat(
         cp_model.INFEASIBLE: "no_solution",
         cp_model.MODEL_INVALID: "no_solution",
     }.get(status, "partial" if assignments else "no_solution")
+    if cancel is not None and cancel.is_set():
+        status_str = "cancelled"
 
     return OptimizationResponse(
         status=status_str,
@@ -415,6 +947,15 @@ def solve_cpsat(
             total_slots=total_slots,
             resolution_time_ms=elapsed_ms,
             solver_type="cpsat",
+            time_to_first_solution_ms=tracker.first_solution_ms,
+            relative_gap=stage_metrics[-1].relative_gap if stage_metrics else None,
+            early_stop=tracker.early_stop,
+            warm_start=bool(hinted),
+            stages=stage_metrics,
+            interchangeable_persons=sum(len(c) for c in symmetry_classes),
+            bound_covered_slots=bound_covered_slots,
+            bound_cost=bound_cost,
+            phase_ms=dict(deadline.phases),
         ),
         unassigned=unassigned,
     )
@@ -426,10 +967,16 @@ def solve_cpsat(
 def solve_greedy(
     matches: list[Match],
     persons: list[Person],
-    distances: list[Distance],
+    distances: list[Distance] | DistanceMatrix,
     parameters: SolverParameters,
+    cancel: CancelToken | None = None,
+    features: PersonFeatures | None = None,
+    deadline: Deadline | None = None,
 ) -> OptimizationResponse:
-    """Solver greedy heuristico — rapido, no optimo."""
+    """Solver greedy heuristico — rapido, no optimo.
+
+    Si el plazo se agota a mitad, las plazas pendientes quedan sin asignar.
+    """
     from models import (
         OptimizationResponse,
         ProposedAssignment,
@@ -437,24 +984,30 @@ def solve_greedy(
         UnassignedSlot,
     )
 
-    start = time.time()
-    dist_lookup = build_distance_lookup(distances)
+    start = mark = time.time()
+    if deadline is None:
+        deadline = Deadline(start + parameters.max_time_seconds)
+    distance_matrix = DistanceMatrix.of(distances)
+    eligibility = build_eligibility(matches, persons, distance_matrix, features)
+    state = _GreedyState(eligibility.matches, persons)
+    mark = deadline.charge("preprocess", mark)
 
     assignments: list[ProposedAssignment] = []
     unassigned: list[UnassignedSlot] = []
-    person_load: dict[str, int] = {p.id: 0 for p in persons}
-    assigned_times: dict[str, list[tuple[str, int]]] = {p.id: [] for p in persons}
 
     # Cargar designaciones existentes
     if parameters.force_existing:
-        for match in matches:
+        person_idx: dict[str, int] = {}
+        for pi, p in enumerate(persons):
+            person_idx.setdefault(p.id, pi)
+        for mi, match in enumerate(matches):
             for d in match.designations:
-                person = next((p for p in persons if p.id == d.person_id), None)
-                if not person:
+                pi = person_idx.get(d.person_id)
+                if pi is None:
                     continue
-                cost, km = get_travel_cost(
-                    person.municipality_id, match.venue.municipality_id, dist_lookup
-                )
+                person = persons[pi]
+                cost = float(eligibility.travel_cost(pi, mi))
+                km = float(eligibility.distance_km(pi, mi))
                 assignments.append(
                     ProposedAssignment(
                         match_id=match.id,
@@ -466,24 +1019,23 @@ def solve_greedy(
                         is_new=False,
                     )
                 )
-                person_load[person.id] = person_load.get(person.id, 0) + 1
-                match_hour = int(match.time.split(":")[0])
-                assigned_times.setdefault(person.id, []).append(
-                    (match.date, match_hour)
-                )
+                state.book(pi, mi)
 
     # Ordenar partidos: menos asignaciones primero, mayor categoria primero
-    sorted_matches = sorted(
-        matches,
-        key=lambda m: (
-            len(m.designations),
-            -CATEGORY_RANK.get(m.competition.min_ref_category, 0),
-        ),
+    min_rank = eligibility.matches.min_rank.tolist()
+    sorted_indices = sorted(
+        range(len(matches)),
+        key=lambda i: (len(matches[i].designations), -min_rank[i]),
     )
 
-    for match in sorted_matches:
+    cancelled = expired = False
+    for position, mi in enumerate(sorted_indices):
+        if position % 16 == 0:
+            if cancel is not None and not cancelled:
+                cancelled = cancel.is_set()
+            expired = expired or deadline.expired()
+        match = matches[mi]
         existing = list(match.designations)
-        venue_muni = match.venue.municipality_id
 
         for role, needed_total in [
             ("arbitro", match.referees_needed),
@@ -493,37 +1045,26 @@ def solve_greedy(
             needed = needed_total - (
                 len(existing_role) if parameters.force_existing else 0
             )
+            pool = eligibility.candidates(mi, role) if needed > 0 else None
 
             for slot_idx in range(needed):
-                candidate = _find_best(
-                    match,
-                    role,
-                    venue_muni,
-                    persons,
-                    person_load,
-                    assigned_times,
-                    assignments,
-                    dist_lookup,
-                    parameters,
+                pi = None if cancelled or expired else _find_best(
+                    mi, pool, eligibility, state, parameters
                 )
-                if candidate:
-                    p, cost, km = candidate
+                if pi is not None:
+                    p = persons[pi]
                     assignments.append(
                         ProposedAssignment(
                             match_id=match.id,
                             person_id=p.id,
                             person_name=p.name,
                             role=role,
-                            travel_cost=cost,
-                            distance_km=km,
+                            travel_cost=float(eligibility.travel_cost(pi, mi)),
+                            distance_km=float(eligibility.distance_km(pi, mi)),
                             is_new=True,
                         )
                     )
-                    person_load[p.id] = person_load.get(p.id, 0) + 1
-                    match_hour = int(match.time.split(":")[0])
-                    assigned_times.setdefault(p.id, []).append(
-                        (match.date, match_hour)
-                    )
+                    state.book(pi, mi)
                 else:
                     actual_idx = (
                         len(existing_role) + slot_idx
@@ -536,10 +1077,17 @@ def solve_greedy(
                             match_label=f"{match.home_team} vs {match.away_team}",
                             role=role,
                             slot_index=actual_idx,
-                            reason="Sin candidatos validos",
+                            reason=(
+                                "Optimizacion cancelada"
+                                if cancelled
+                                else "Plazo agotado"
+                                if expired
+                                else "Sin candidatos validos"
+                            ),
                         )
                     )
 
+    deadline.charge("solve", mark)
     elapsed_ms = int((time.time() - start) * 1000)
     new_assignments = [a for a in assignments if a.is_new]
     total_slots = sum(m.referees_needed + m.scorers_needed for m in matches)
@@ -550,6 +1098,8 @@ def solve_greedy(
         if not unassigned
         else ("partial" if new_assignments else "no_solution")
     )
+    if cancelled:
+        status = "cancelled"
 
     return OptimizationResponse(
         status=status,
@@ -561,73 +1111,76 @@ def solve_greedy(
             total_slots=total_slots,
             resolution_time_ms=elapsed_ms,
             solver_type="greedy",
+            phase_ms=dict(deadline.phases),
+            degraded="Plazo agotado durante la asignacion" if expired else None,
         ),
         unassigned=unassigned,
     )
 
 
-def _find_best(
-    match: Match,
-    role: str,
-    venue_muni: str,
-    persons: list[Person],
-    person_load: dict[str, int],
-    assigned_times: dict[str, list[tuple[str, int]]],
-    current_assignments: list[ProposedAssignment],
-    dist_lookup: dict[tuple[str, str], float],
-    parameters: SolverParameters,
-) -> tuple[Person, float, float] | None:
-    """Encuentra el mejor candidato para un slot (greedy)."""
-    match_hour = int(match.time.split(":")[0])
-    max_load = max(1, max(person_load.values(), default=1))
-    candidates = []
-
-    for p in persons:
-        if p.role != role or not p.active:
-            continue
-        if any(
-            a.match_id == match.id and a.person_id == p.id
-            for a in current_assignments
-        ):
-            continue
-        if person_load.get(p.id, 0) >= parameters.max_matches_per_person:
-            continue
+class _GreedyState:
+    """Estado incremental del greedy con comprobaciones O(1) por candidato.
 
-        # Disponibilidad
-        if not _is_person_available(p, match):
-            continue
+    Carga y ocupacion se indexan por id de persona (no por posicion) para
+    mantener la semantica original si una persona aparece repetida.
+    """
 
-        # Solapamiento temporal
-        times = assigned_times.get(p.id, [])
-        if any(d == match.date and abs(h - match_hour) < 2 for d, h in times):
-            continue
+    def __init__(self, matches: MatchFeatures, persons: list[Person]) -> None:
+        id_slots: dict[str, int] = {}
+        self.slot_of = np.array(
+            [id_slots.setdefault(p.id, len(id_slots)) for p in persons],
+            dtype=np.int64,
+        ).reshape(len(persons))
+        self.load = np.zeros(len(id_slots), dtype=np.int64)
+        self.max_load = 0
 
-        # Categoria minima
-        if role == "arbitro" and match.competition.min_ref_category:
-            if CATEGORY_RANK.get(p.category or "", 0) < CATEGORY_RANK.get(
-                match.competition.min_ref_category, 0
-            ):
-                continue
+        # Ocupacion (persona, dia, hora + 1): un partido a la hora h choca con
+        # los asignados a h-1, h y h+1 del mismo dia
+        self.match_day = matches.day.tolist()
+        self.match_hour = matches.start_hour.tolist()
+        n_days = max(self.match_day, default=-1) + 1
+        n_hours = max(self.match_hour, default=0) + 3
+        self.occupied = np.zeros((len(id_slots), n_days, n_hours), dtype=bool)
 
-        # Incompatibilidades
-        if any(
-            match.home_team.lower().find(inc.team_name.lower()) >= 0
-            or match.away_team.lower().find(inc.team_name.lower()) >= 0
-            for inc in p.incompatibilities
-        ):
-            continue
+        # Personas ya asignadas a cada partido (por id de partido)
+        self.assigned: dict[str, set[int]] = defaultdict(set)
+        self.match_ids = matches.ids
+
+    def book(self, pi: int, mi: int) -> None:
+        slot = self.slot_of[pi]
+        self.load[slot] += 1
+        self.max_load = max(self.max_load, int(self.load[slot]))
+        self.occupied[slot, self.match_day[mi], self.match_hour[mi] + 1] = True
+        self.assigned[self.match_ids[mi]].add(int(slot))
 
-        cost, km = get_travel_cost(p.municipality_id, venue_muni, dist_lookup)
-        norm_cost = cost / 10
-        if not p.has_car and km > 15:
-            norm_cost *= 2.0
-        norm_load = person_load.get(p.id, 0) / max_load
-        score = parameters.cost_weight * norm_cost + parameters.balance_weight * norm_load
-        candidates.append((p, cost, km, score))
 
-    if not candidates:
+def _find_best(
+    mi: int,
+    pool: np.ndarray,
+    eligibility: Eligibility,
+    state: _GreedyState,
+    parameters: SolverParameters,
+) -> int | None:
+    """Mejor candidato del pool para un slot: argmin vectorizado del score."""
+    # Rol, actividad, categoria, disponibilidad e incompatibilidades ya
+    # vienen filtrados en la matriz de elegibilidad
+    slots = state.slot_of[pool]
+    hour = state.match_hour[mi] + 1
+    free = (state.load[slots] < parameters.max_matches_per_person) & ~state.occupied[
+        slots, state.match_day[mi], hour - 1 : hour + 2
+    ].any(axis=1)
+    taken = state.assigned.get(state.match_ids[mi])
+    if taken:
+        free &= ~np.isin(slots, list(taken))
+    candidates = pool[free]
+    if candidates.size == 0:
         return None
 
-    candidates.sort(key=lambda c: c[3])
-    best = candidates[0]
-    return best[0], best[1], best[2]
+    norm_cost = eligibility.travel_cost(candidates, mi) / 10
+    norm_cost = np.where(
+        eligibility.no_car_penalty(candidates, mi), norm_cost * 2.0, norm_cost
+    )
+    norm_load = state.load[slots[free]] / max(1, state.max_load)
+    score = parameters.cost_weight * norm_cost + parameters.balance_weight * norm_load
+    # argmin devuelve el primer minimo: mismo desempate que el sort estable
+    return int(candidates[np.argmin(score)])
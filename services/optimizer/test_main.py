@@ -0,0 +1,282 @@
+"""Tests para los endpoints del microservicio."""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from distance_store import DistanceStore
+from jobs import JobManager
+from main import _close_stream, app, jobs
+from scheduler import CpuScheduler, SchedulerSaturated
+from test_solver import (
+    default_params,
+    make_dense_instance,
+    make_distance,
+    make_match,
+    make_person,
+    make_venue,
+)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def optimization_payload(n_matches: int = 1, **params) -> dict:
+    matches = [
+        make_match(f"m-{i}", time=f"{9 + (i % 12)}:00", referees_needed=1, scorers_needed=1)
+        for i in range(n_matches)
+    ]
+    persons = [make_person("ref-1", "Ref 1", "arbitro"), make_person("sco-1", "Scorer 1", "anotador")]
+    return {
+        "matches": [m.model_dump(mode="json") for m in matches],
+        "persons": [p.model_dump(mode="json") for p in persons],
+        "distances": [],
+        "parameters": default_params(**params).model_dump(mode="json"),
+    }
+
+
+def slow_payload(**params) -> dict:
+    """Instancia que CP-SAT no cierra en max_time_seconds (para cancelarla)."""
+    matches, persons = make_dense_instance(300)
+    return {
+        "matches": [m.model_dump(mode="json") for m in matches],
+        "persons": [p.model_dump(mode="json") for p in persons],
+        "distances": [],
+        "parameters": default_params(max_time_seconds=30, **params).model_dump(mode="json"),
+    }
+
+
+class TestOptimizeEndpoint:
+    def test_optimize_returns_solution(self, client):
+        response = client.post("/optimize", json=optimization_payload())
+
+        assert response.status_code == 200
+        assert response.json()["metrics"]["coverage"] == 100.0
+
+
+class TestJobs:
+    def test_job_lifecycle(self, client):
+        created = client.post("/jobs", json=optimization_payload())
+        assert created.status_code == 202
+        job_id = created.json()["id"]
+
+        info = client.get(f"/jobs/{job_id}", params={"wait": 30}).json()
+
+        assert info["status"] == "done"
+        assert info["result"]["metrics"]["covered_slots"] == 2
+
+    def test_unknown_job(self, client):
+        assert client.get("/jobs/nope").status_code == 404
+
+    def test_delete_cancels_running_job(self, client):
+        job_id = client.post("/jobs", json=slow_payload()).json()["id"]
+        time.sleep(3)
+
+        start = time.time()
+        info = client.delete(f"/jobs/{job_id}").json()
+
+        assert info["status"] == "cancelled"
+        assert time.time() - start < 10
+
+    def test_newer_request_supersedes_older(self, client):
+        payload = {**slow_payload(), "supersede_key": "planner-1"}
+        first = client.post("/jobs", json=payload).json()["id"]
+        newer = {**optimization_payload(), "supersede_key": "planner-1"}
+        second = client.post("/jobs", json=newer).json()["id"]
+
+        assert client.get(f"/jobs/{first}", params={"wait": 30}).json()["status"] == "cancelled"
+        assert client.get(f"/jobs/{second}", params={"wait": 30}).json()["status"] == "done"
+
+    def test_health_not_blocked_by_running_solve(self, client):
+        payload = optimization_payload(n_matches=120, max_time_seconds=3)
+        job_id = client.post("/jobs", json=payload).json()["id"]
+
+        start = time.time()
+        assert client.get("/health").status_code == 200
+        assert time.time() - start < 1.0
+
+        info = client.get(f"/jobs/{job_id}", params={"wait": 30}).json()
+        assert info["status"] == "done"
+
+
+class TestStreaming:
+    def test_stream_emits_solutions_then_result(self, client):
+        payload = optimization_payload(n_matches=6)
+
+        with client.stream("POST", "/optimize/stream", json=payload) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = [
+                (block.split("\n")[0].removeprefix("event: "), block.split("\n")[1])
+                for block in response.read().decode().strip().split("\n\n")
+            ]
+
+        kinds = [kind for kind, _ in events]
+        assert kinds[-1] == "result"
+        assert set(kinds[:-1]) == {"solution"}
+        result = json.loads(events[-1][1].removeprefix("data: "))
+        assert result["metrics"]["solver_type"] == "cpsat"
+
+    def test_cancelled_solve_closes_stream(self):
+        async def scenario():
+            task = asyncio.create_task(asyncio.sleep(10))
+            await asyncio.sleep(0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return task
+
+        events: queue.Queue = queue.Queue()
+        _close_stream(events, asyncio.run(scenario()))
+
+        kind, payload = events.get_nowait()
+        assert kind == "error"
+        assert json.loads(payload)["detail"] == "Optimizacion cancelada"
+
+
+class TestDistanceSets:
+    def _payload(self) -> dict:
+        payload = optimization_payload(n_matches=3)
+        for i, match in enumerate(payload["matches"]):
+            match["venue"] = make_venue(f"muni-{i + 2:03d}").model_dump(mode="json")
+        payload["distances"] = [
+            make_distance("muni-001", f"muni-{i:03d}", 12.5 * i).model_dump(mode="json")
+            for i in range(2, 5)
+        ]
+        return payload
+
+    def test_optimize_by_distance_set_id(self, client):
+        payload = self._payload()
+        uploaded = client.post("/distances", json=payload["distances"])
+        assert uploaded.status_code == 201
+        info = uploaded.json()
+        assert info["municipalities"] == 4
+        assert client.post("/distances", json=payload["distances"]).json() == info
+
+        inline = client.post("/optimize", json=payload).json()
+        by_id = client.post(
+            "/optimize",
+            json={**payload, "distances": [], "distance_set_id": info["distance_set_id"]},
+        ).json()
+
+        assert by_id["metrics"]["total_cost"] == inline["metrics"]["total_cost"] > 0
+        assert by_id["assignments"] == inline["assignments"]
+
+    def test_unknown_distance_set(self, client):
+        payload = {**optimization_payload(), "distance_set_id": "nope"}
+
+        assert client.post("/optimize", json=payload).status_code == 404
+        assert client.get("/distances/nope").status_code == 404
+
+    def test_lru_eviction(self):
+        store = DistanceStore(max_sets=2)
+        sets = [[make_distance("muni-001", "muni-002", km)] for km in (10.0, 20.0, 30.0)]
+        first, second = store.put(sets[0]), store.put(sets[1])
+        store.get(first.distance_set_id)
+
+        store.put(sets[2])
+
+        assert store.get(first.distance_set_id) is not None
+        assert store.get(second.distance_set_id) is None
+
+
+class TestRosters:
+    def test_optimize_by_roster_version(self, client):
+        payload = optimization_payload()
+        roster = client.post("/rosters", json=payload["persons"]).json()
+        assert (roster["version"], roster["persons"]) == (1, 2)
+        by_roster = {**payload, "persons": [], "roster": {"roster_id": roster["roster_id"]}}
+
+        first = client.post("/optimize", json=by_roster).json()
+        assert first["metrics"]["coverage"] == 100.0
+
+        # Baja del anotador: version 2 sin cobertura de anotador
+        scorer = payload["persons"][1]
+        patched = client.patch(
+            f"/rosters/{roster['roster_id']}",
+            json={"upsert": [{**scorer, "active": False}]},
+        ).json()
+        assert patched["version"] == 2
+        second = client.post("/optimize", json=by_roster).json()
+        assert second["metrics"]["covered_slots"] == 1
+
+        # La version 1 sigue disponible y los overrides solo afectan a la peticion
+        pinned = {"roster_id": roster["roster_id"], "version": 1, "exclude_person_ids": ["ref-1"]}
+        third = client.post("/optimize", json={**by_roster, "roster": pinned}).json()
+        assert {a["person_id"] for a in third["assignments"]} == {"sco-1"}
+
+    def test_unknown_roster(self, client):
+        payload = {**optimization_payload(), "roster": {"roster_id": "nope"}}
+
+        assert client.post("/optimize", json=payload).status_code == 404
+        assert client.patch("/rosters/nope", json={}).status_code == 404
+
+
+class TestScheduler:
+    def test_workers_scale_with_instance_size(self):
+        scheduler = CpuScheduler(total_cores=16)
+
+        assert scheduler.workers_for(10, 50, "cpsat") == 1
+        assert scheduler.workers_for(300, 770, "cpsat") == 4
+        assert scheduler.workers_for(2000, 770, "cpsat") == 8
+        assert scheduler.workers_for(2000, 770, "greedy") == 1
+
+    def test_queue_then_reject(self):
+        async def scenario():
+            scheduler = CpuScheduler(total_cores=2, max_queue=1)
+            first = scheduler.request(2)
+            assert first.result() == 2
+
+            queued = scheduler.request(1)
+            assert not queued.done()
+            assert scheduler.stats()["queue_depth"] == 1
+            with pytest.raises(SchedulerSaturated) as excinfo:
+                scheduler.request(1)
+            assert excinfo.value.retry_after >= 1
+
+            scheduler.release(2, elapsed_seconds=1.0)
+            assert queued.result() == 1
+            assert scheduler.stats()["available_cores"] == 1
+
+        asyncio.run(scenario())
+
+    def test_cancelled_queued_job_frees_queue(self):
+        async def scenario():
+            scheduler = CpuScheduler(total_cores=1, max_queue=1)
+            manager = JobManager(scheduler=scheduler)
+            busy = scheduler.request(1)
+            ticket = scheduler.request(1)
+            task = asyncio.create_task(
+                manager.run(ticket, print, cancel=threading.Event())
+            )
+            await asyncio.sleep(0)
+
+            # Como DELETE /jobs/{id}: la tarea se cancela mientras espera cores
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert scheduler.stats()["queue_depth"] == 0
+
+            again = scheduler.request(1)
+            assert not again.done()
+            scheduler.release(busy.result())
+            assert again.result() == 1
+
+        asyncio.run(scenario())
+
+    def test_saturated_returns_429(self, client, monkeypatch):
+        monkeypatch.setattr(jobs.scheduler, "available", 0)
+        monkeypatch.setattr(jobs.scheduler, "max_queue", 0)
+
+        response = client.post("/optimize", json=optimization_payload())
+
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        assert client.get("/scheduler").json()["queue_depth"] == 0
@@ -1,7 +1,10 @@
 """Tests para el solver CP-SAT y greedy."""
 
+import datetime
+import threading
 import time
 
+import numpy as np
 import pytest
 
 from models import (
@@ -10,12 +13,38 @@ from models import (
     Designation,
     Distance,
     Match,
+    NeighbourhoodParameters,
     Person,
     Incompatibility,
+    PriorAssignment,
+    ReoptimizationRequest,
+    ScheduleDelta,
     SolverParameters,
     Venue,
 )
-from solver import solve
+from decompose import solve_decomposed, split_components
+from distance_matrix import (
+    DEFAULT_KM,
+    SAME_MUNICIPALITY_COST,
+    DistanceMatrix,
+    travel_cost_for_km,
+)
+from eligibility import MatchFeatures, PersonFeatures, build_eligibility
+from incompatibility import normalize_team
+from portfolio import solve_portfolio
+from reoptimize import reoptimize
+from routing import estimate_model
+from solver import (
+    CATEGORY_RANK,
+    COST_SCALE,
+    Deadline,
+    _get_week_start,
+    _SolutionTracker,
+    _precompute_overlap_cliques,
+    _time_to_minutes,
+    relative_gap,
+    solve,
+)
 
 
 # ── Helpers ─────────────────────────────────────────────────────────────────
@@ -112,6 +141,178 @@ def default_params(**kwargs) -> SolverParameters:
     return SolverParameters(**defaults)
 
 
+def distance_lookup(distances: list[Distance]) -> dict[tuple[str, str], float]:
+    """Referencia escalar: lookup bidireccional (la ultima entrada gana)."""
+    lookup: dict[tuple[str, str], float] = {}
+    for d in distances:
+        lookup[(d.origin_id, d.dest_id)] = d.distance_km
+        lookup[(d.dest_id, d.origin_id)] = d.distance_km
+    return lookup
+
+
+def reference_travel_cost(
+    origin: str, dest: str, lookup: dict[tuple[str, str], float]
+) -> tuple[float, float]:
+    """Referencia escalar de coste y km que DistanceMatrix calcula en bloque."""
+    if origin == dest:
+        return SAME_MUNICIPALITY_COST, 0.0
+    km = lookup.get((origin, dest), DEFAULT_KM)
+    return travel_cost_for_km(km), km
+
+
+def make_dense_day(n_matches: int) -> list[Match]:
+    """Partidos cada media hora en dos dias: muchos solapes."""
+    times = [f"{h:02d}:{m:02d}" for h in range(9, 21) for m in (0, 30)]
+    return [
+        make_match(
+            f"m-{i}",
+            date=["2026-03-07", "2026-03-07", "2026-03-08"][i % 3],
+            time=times[(i * 7) % len(times)],
+        )
+        for i in range(n_matches)
+    ]
+
+def make_dense_instance(n_matches: int = 120):
+    """Jornada densa con 40 arbitros (no caben todos los partidos)."""
+    matches = make_dense_day(n_matches)
+    persons = [
+        make_person(f"ref-{i}", f"Ref {i}", "arbitro", muni_id=f"muni-{i % 15:03d}")
+        for i in range(40)
+    ]
+    return matches, persons
+
+def make_mixed_instance(n_matches: int, n_persons: int):
+    """Dos dias con categorias, disponibilidades, incompatibilidades y coche variados."""
+    times = ["09:00", "10:30", "11:00", "12:15", "13:00", "17:00", "19:00"]
+    categories = ["provincial", "autonomico", "nacional"]
+    matches = [
+        make_match(
+            f"m-{i}",
+            date=["2026-03-07", "2026-03-08"][i % 2],
+            time=times[i % len(times)],
+            venue=make_venue(f"muni-{i % 20:03d}"),
+            competition=make_competition(min_ref_category=categories[i % 3]),
+            home_team=f"CB Equipo {i % 40}",
+            away_team=f"AD Club {i % 30}",
+        )
+        for i in range(n_matches)
+    ]
+    persons = []
+    for i in range(n_persons):
+        pid = f"p-{i}"
+        availabilities = (
+            [
+                Availability(
+                    person_id=pid, day_of_week=5, start_time="09:00", end_time="14:00"
+                ),
+                Availability(
+                    person_id=pid,
+                    day_of_week=6,
+                    start_time="16:00",
+                    end_time="21:00",
+                    week_start="2026-03-02",
+                ),
+            ]
+            if i % 3
+            else []
+        )
+        incompatibilities = (
+            [Incompatibility(person_id=pid, team_name=f"equipo {i % 40}")]
+            if i % 4 == 0
+            else []
+        )
+        person = make_person(
+            pid,
+            f"Persona {i}",
+            "arbitro" if i % 3 else "anotador",
+            category=categories[i % 3],
+            muni_id=f"muni-{i % 20:03d}",
+            active=i % 17 != 0,
+            availabilities=availabilities,
+            incompatibilities=incompatibilities,
+        )
+        person.has_car = i % 5 != 0
+        persons.append(person)
+    distances = [
+        make_distance(f"muni-{i:03d}", f"muni-{j:03d}", 5.0 + i + j)
+        for i in range(20)
+        for j in range(i + 1, 20)
+    ]
+    return matches, persons, distances
+
+def make_crossed_instance():
+    """Dos partidos y dos arbitros: elegir partido a partido sale mas caro.
+
+    El mas cercano al primer partido es el unico razonable para el segundo.
+    """
+    matches = [
+        make_match(
+            f"m-{i}",
+            time=f"{9 + 2 * i}:00",
+            venue=make_venue(f"muni-00{i + 2}"),
+            referees_needed=1,
+            scorers_needed=0,
+        )
+        for i in range(2)
+    ]
+    persons = [
+        make_person("ref-a", "A", muni_id="muni-001"),
+        make_person("ref-b", "B", muni_id="muni-004"),
+    ]
+    distances = [
+        make_distance("muni-001", "muni-002", 10.0),
+        make_distance("muni-001", "muni-003", 30.0),
+        make_distance("muni-004", "muni-002", 12.0),
+        make_distance("muni-004", "muni-003", 90.0),
+    ]
+    return matches, persons, distances
+
+def make_two_days():
+    """Sabado y domingo con arbitros disjuntos: dos componentes."""
+    sat = [
+        Availability(person_id="", day_of_week=5, start_time="08:00", end_time="22:00")
+    ]
+    sun = [
+        Availability(person_id="", day_of_week=6, start_time="08:00", end_time="22:00")
+    ]
+    matches = [
+        make_match(
+            f"m-{d}-{i}",
+            date=date,
+            time=f"{9 + 2 * i}:00",
+            referees_needed=1,
+            scorers_needed=0,
+        )
+        for d, date in enumerate(["2026-03-07", "2026-03-08"])
+        for i in range(4)
+    ]
+    persons = [
+        make_person(f"ref-sat-{i}", f"Sab {i}", availabilities=sat) for i in range(3)
+    ] + [
+        make_person(f"ref-sun-{i}", f"Dom {i}", availabilities=sun) for i in range(3)
+    ]
+    return matches, persons
+
+
+def reference_is_available(person: Person, match: Match) -> bool:
+    """Referencia escalar de la disponibilidad que build_eligibility vectoriza."""
+    if not person.availabilities:
+        return True  # Sin datos de disponibilidad = disponible
+    try:
+        match_dow = datetime.date.fromisoformat(match.date).weekday()  # 0=lunes
+    except (ValueError, TypeError):
+        return True
+    match_week = _get_week_start(match.date)
+    match_minute = _time_to_minutes(match.time)
+    return any(
+        not (avail.week_start and match_week and avail.week_start != match_week)
+        and avail.day_of_week == match_dow
+        and _time_to_minutes(avail.start_time)
+        <= match_minute
+        < _time_to_minutes(avail.end_time)
+        for avail in person.availabilities
+    )
+
 # ── Tests ───────────────────────────────────────────────────────────────────
 
 
@@ -148,6 +349,27 @@ class TestNoPersons:
         assert result.status in ("no_solution", "partial", "optimal", "feasible")
         assert result.metrics.coverage < 100.0 or len(result.unassigned) > 0
 
+    def test_partial_slots_and_existing(self):
+        match = make_match(
+            referees_needed=3,
+            scorers_needed=1,
+            designations=[
+                Designation(id="d-1", match_id="match-1", person_id="ref-1", role="arbitro", status="c")
+            ],
+        )
+        refs = [make_person("ref-1", "Ref 1", "arbitro"), make_person("ref-2", "Ref 2", "arbitro")]
+
+        result = solve([match], refs, [], default_params(force_existing=True))
+
+        assert {(a.person_id, a.is_new) for a in result.assignments} == {
+            ("ref-1", False),
+            ("ref-2", True),
+        }
+        assert [(u.role, u.slot_index) for u in result.unassigned] == [
+            ("arbitro", 2),
+            ("anotador", 0),
+        ]
+
 
 class TestIncompatibility:
     """Persona incompatible excluida, otra asignada."""
@@ -182,6 +404,32 @@ class TestIncompatibility:
         assert len(ref_assignments) == 1
         assert ref_assignments[0].person_id == "ref-2"
 
+    def test_accent_and_punctuation_insensitive(self):
+        matches = [
+            make_match("m-1", home_team="C.B. ÁVILA", away_team="AD Leganés"),
+            make_match("m-2", home_team="Baloncesto Coslada 2018", away_team="CB Getafe"),
+            make_match("m-3", home_team="Real Canoe", away_team="Estudiantes"),
+        ]
+        persons = [
+            make_person(
+                f"ref-{i}",
+                f"Ref {i}",
+                "arbitro",
+                incompatibilities=[Incompatibility(person_id=f"ref-{i}", team_name=name)],
+            )
+            for i, name in enumerate(["cb avila", "Leganes", "coslada 2018", "Canoé", "..."])
+        ]
+
+        eligibility = build_eligibility(matches, persons, DistanceMatrix.from_distances([]))
+
+        assert (~eligibility.mask).tolist() == [
+            [True, False, False],
+            [True, False, False],
+            [False, True, False],
+            [False, False, True],
+            [False, False, False],
+        ]
+
 
 class TestCategoryMinimum:
     """Persona con categoria insuficiente excluida."""
@@ -407,3 +655,873 @@ class TestDispatch:
 
         assert result.metrics.solver_type == "greedy"
         assert len(result.assignments) == 2
+
+
+class TestGreedy:
+    """Greedy indexado: restricciones por persona sobre una jornada densa."""
+
+    def test_constraints_on_dense_day(self):
+        matches, persons = make_dense_instance(300)
+        params = default_params(solver_type="greedy", max_matches_per_person=3)
+
+        start = time.time()
+        result = solve(matches, persons, [], params)
+        elapsed = time.time() - start
+
+        by_match = {m.id: m for m in matches}
+        by_person: dict[str, list] = {}
+        for a in result.assignments:
+            by_person.setdefault(a.person_id, []).append(by_match[a.match_id])
+        assert result.metrics.covered_slots == len(result.assignments) > 0
+        for assigned in by_person.values():
+            assert len(assigned) <= 3
+            assert len({m.id for m in assigned}) == len(assigned)
+            for day in {m.date for m in assigned}:
+                hours = sorted(int(m.time.split(":")[0]) for m in assigned if m.date == day)
+                assert all(b - a >= 2 for a, b in zip(hours, hours[1:]))
+        assert elapsed < 2, f"Greedy took {elapsed:.1f}s"
+
+
+class TestFlow:
+    """Relajacion de transporte por flujo de coste minimo + reparacion."""
+
+    def test_repaired_solution_respects_constraints(self):
+        matches, persons = make_dense_instance(300)
+        params = default_params(solver_type="flow", max_matches_per_person=3)
+
+        result = solve(matches, persons, [], params)
+
+        assert result.metrics.solver_type == "flow"
+        by_match = {m.id: m for m in matches}
+        by_person: dict[str, list] = {}
+        for a in result.assignments:
+            by_person.setdefault(a.person_id, []).append(by_match[a.match_id])
+        for assigned in by_person.values():
+            assert len(assigned) <= 3
+            assert len({m.id for m in assigned}) == len(assigned)
+            for day in {m.date for m in assigned}:
+                hours = sorted(int(m.time.split(":")[0]) for m in assigned if m.date == day)
+                assert all(b - a >= 2 for a, b in zip(hours, hours[1:]))
+        assert 0 < result.metrics.covered_slots <= result.metrics.bound_covered_slots
+
+    def test_cheaper_than_greedy(self):
+        # Sin solapes el flujo es optimo; el greedy elige partido a partido
+        matches, persons, distances = make_crossed_instance()
+        params = dict(balance_weight=0.0, max_matches_per_person=1)
+
+        flow = solve(matches, persons, distances, default_params(**params, solver_type="flow"))
+        greedy = solve(matches, persons, distances, default_params(**params, solver_type="greedy"))
+        cpsat = solve(matches, persons, distances, default_params(**params))
+        bounded = solve(
+            matches, persons, distances, default_params(**params, relaxation_bounds=True)
+        )
+
+        assert flow.metrics.covered_slots == greedy.metrics.covered_slots == 2
+        assert flow.metrics.total_cost == cpsat.metrics.total_cost < greedy.metrics.total_cost
+        # Las cotas de CP-SAT son opcionales: sin pedirlas no se resuelve el flujo
+        assert cpsat.metrics.bound_covered_slots is None
+        assert "bound" not in cpsat.metrics.phase_ms
+        assert bounded.metrics.bound_covered_slots == 2
+        assert bounded.metrics.bound_cost == flow.metrics.bound_cost == flow.metrics.total_cost
+
+    def test_failed_relaxation_leaves_cpsat_without_bounds(self, monkeypatch):
+        import flow
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("Min cost flow fallo")
+
+        monkeypatch.setattr(flow, "solve_relaxation", fail)
+        matches, persons, distances = make_crossed_instance()
+
+        params = default_params(balance_weight=0.0, relaxation_bounds=True)
+
+        result = solve(matches, persons, distances, params)
+
+        assert result.status == "optimal"
+        assert "bound" in result.metrics.phase_ms
+        assert result.metrics.bound_covered_slots is None
+        assert result.metrics.bound_cost is None
+
+
+class TestPortfolio:
+    """Carrera greedy/flujo/CP-SAT: mejor solucion y motor ganador."""
+
+    def test_best_engine_wins(self):
+        matches, persons, distances = make_crossed_instance()
+        params = default_params(
+            solver_type="portfolio", balance_weight=0.0, max_matches_per_person=1
+        )
+
+        result = solve(matches, persons, distances, params)
+        greedy = solve(
+            matches, persons, distances, params.model_copy(update={"solver_type": "greedy"})
+        )
+
+        assert result.metrics.solver_type == "portfolio"
+        assert result.metrics.engine == "cpsat"  # gana los empates con el flujo
+        assert result.metrics.total_cost == result.metrics.bound_cost
+        assert result.metrics.total_cost < greedy.metrics.total_cost
+
+    def test_greedy_floor_without_time(self, monkeypatch):
+        import portfolio
+
+        monkeypatch.setattr(portfolio, "MIN_CPSAT_SECONDS", 1000)
+        matches, persons, distances = make_crossed_instance()
+        params = default_params(
+            solver_type="portfolio",
+            balance_weight=0.0,
+            max_matches_per_person=1,
+            portfolio_flow=False,
+        )
+
+        result = solve(matches, persons, distances, params)
+
+        assert result.metrics.engine == "greedy"
+        assert result.metrics.covered_slots == 2
+
+    def test_ignores_decompose(self):
+        matches, persons = make_two_days()
+        params = default_params(solver_type="portfolio", decompose=True, balance_weight=0.0)
+
+        result = solve(matches, persons, [], params, num_workers=4)
+
+        assert result.metrics.solver_type == "portfolio"
+        assert result.metrics.coverage == 100.0
+
+    def test_caller_hints_start_cpsat(self, monkeypatch):
+        import solver
+
+        seen = []
+        real_solve = solver.solve
+
+        def spy(*args, hints=None, **kwargs):
+            seen.append(hints)
+            return real_solve(*args, hints=hints, **kwargs)
+
+        monkeypatch.setattr(solver, "solve", spy)
+        matches, persons, distances = make_crossed_instance()
+        hints = [PriorAssignment(match_id="m-0", person_id="ref-b")]
+        params = default_params(solver_type="portfolio", max_matches_per_person=1)
+
+        solve_portfolio(matches, persons, distances, params, hints=hints)
+
+        assert seen == [hints]
+
+    def test_flow_failure_stops_cpsat(self, monkeypatch):
+        import flow
+        import solver
+
+        statuses = []
+        real_solve = solver.solve
+
+        def spy(*args, **kwargs):
+            result = real_solve(*args, **kwargs)
+            statuses.append(result.status)
+            return result
+
+        def fail(*args, **kwargs):
+            time.sleep(0.5)  # CP-SAT ya esta buscando
+            raise RuntimeError("Min cost flow fallo")
+
+        monkeypatch.setattr(solver, "solve", spy)
+        monkeypatch.setattr(flow, "solve_flow", fail)
+        matches, persons = make_dense_instance(300)
+        params = default_params(solver_type="portfolio", max_time_seconds=20)
+
+        start = time.time()
+        with pytest.raises(RuntimeError):
+            solve_portfolio(matches, persons, [], params)
+        elapsed = time.time() - start
+
+        # CP-SAT se detuvo y termino antes de propagar el error
+        assert statuses == ["cancelled"]
+        assert elapsed < 5, f"CP-SAT siguio {elapsed:.1f}s tras fallar el flujo"
+
+
+class TestEligibility:
+    """Matriz de elegibilidad vectorizada equivalente al filtrado par a par."""
+
+    def test_matches_pairwise_filters(self):
+        matches, persons, distances = make_mixed_instance(60, 45)
+        dist_lookup = distance_lookup(distances)
+        eligibility = build_eligibility(matches, persons, DistanceMatrix.from_distances(distances))
+
+        for pi, person in enumerate(persons):
+            for mi, match in enumerate(matches):
+                needed = (
+                    match.referees_needed if person.role == "arbitro" else match.scorers_needed
+                )
+                expected = (
+                    person.active
+                    and needed > 0
+                    and (
+                        person.role != "arbitro"
+                        or CATEGORY_RANK[person.category]
+                        >= CATEGORY_RANK[match.competition.min_ref_category]
+                    )
+                    and reference_is_available(person, match)
+                    and not any(
+                        normalize_team(inc.team_name) in normalize_team(match.home_team)
+                        or normalize_team(inc.team_name) in normalize_team(match.away_team)
+                        for inc in person.incompatibilities
+                    )
+                )
+                assert eligibility.mask[pi, mi] == expected, (person.id, match.id)
+
+                cost, km = reference_travel_cost(
+                    person.municipality_id, match.venue.municipality_id, dist_lookup
+                )
+                assert eligibility.travel_cost(pi, mi) == cost
+                assert eligibility.distance_km(pi, mi) == km
+                scaled = int(cost * COST_SCALE)
+                if not person.has_car and km > 15:
+                    scaled = int(scaled * 2.0)
+                assert eligibility.cost_scaled(pi, mi) == scaled
+
+    def test_build_time_large_instance(self):
+        matches, persons, distances = make_mixed_instance(400, 770)
+
+        start = time.time()
+        eligibility = build_eligibility(matches, persons, DistanceMatrix.from_distances(distances))
+        elapsed = time.time() - start
+
+        assert eligibility.mask.shape == (770, 400)
+        assert elapsed < 1.0, f"Elegibilidad tardo {elapsed:.2f}s (>1s)"
+
+    def test_incremental_features_match_rebuild(self):
+        matches, persons, distances = make_mixed_instance(40, 30)
+        matrix = DistanceMatrix.from_distances(distances)
+        features = PersonFeatures.from_persons(persons)
+
+        changed = persons[4].model_copy(
+            update={
+                "category": "nacional",
+                "availabilities": [
+                    Availability(person_id=persons[4].id, day_of_week=6, start_time="09:00", end_time="12:00")
+                ],
+            }
+        )
+        added = make_person("p-new", "Nueva", "anotador", muni_id="muni-003")
+        updated = persons[:4] + [changed] + persons[5:]
+        final = [p for p in updated if p.id != "p-7"] + [added]
+        incremental = (
+            features.updated({4: changed})
+            .extended([added])
+            .select([i for i in range(len(updated) + 1) if i != 7])
+        )
+
+        expected = build_eligibility(matches, final, matrix)
+        result = build_eligibility(matches, final, matrix, incremental)
+
+        assert incremental.ids == [p.id for p in final]
+        assert (result.mask == expected.mask).all()
+        pairs = np.ix_(range(len(final)), range(len(matches)))
+        assert (result.cost_scaled(*pairs) == expected.cost_scaled(*pairs)).all()
+        # La copia no modifica los datos de la version anterior
+        assert features.rank[4] == CATEGORY_RANK[persons[4].category]
+        assert incremental.rank[4] == CATEGORY_RANK["nacional"]
+
+    def test_minute_granularity(self):
+        # 2026-03-07 es sabado (day_of_week=5)
+        matches = [
+            make_match(f"m-{t}", date="2026-03-07", time=t)
+            for t in ("09:15", "10:30", "11:15", "11:30")
+        ]
+        window = Availability(person_id="ref-1", day_of_week=5, start_time="09:30", end_time="11:30")
+        other_week = Availability(
+            person_id="ref-1", day_of_week=5, start_time="09:00", end_time="10:00", week_start="2026-03-09"
+        )
+        person = make_person("ref-1", "Ref 1", "arbitro", availabilities=[window, other_week])
+
+        eligibility = build_eligibility(matches, [person], DistanceMatrix.from_distances([]))
+
+        assert eligibility.mask[0].tolist() == [False, True, True, False]
+        assert [reference_is_available(person, m) for m in matches] == [False, True, True, False]
+
+    def test_match_features(self):
+        matches = [
+            make_match("m-1", date="2026-03-07", time="09:15", home_team="CB Ávila"),
+            make_match("m-2", date="2026-03-08", time="18:30", scorers_needed=0),
+            make_match("m-3", date="sin fecha", time="10:00"),
+        ]
+
+        table = MatchFeatures.from_matches(matches)
+
+        assert table.day.tolist() == [0, 1, 2]
+        assert table.weekday.tolist() == [5, 6, -1]
+        assert table.week_start == ["2026-03-02", "2026-03-02", ""]
+        assert table.start_minute.tolist() == [555, 1110, 600]
+        assert table.start_hour.tolist() == [9, 18, 10]
+        assert table.needed[1].tolist() == [2, 0]
+        assert table.teams[0][0] == "CBAVILA"
+
+    def test_interchangeable_classes(self):
+        matches = [make_match(f"m-{i}", time=f"{9 + 2 * i}:00") for i in range(3)]
+        persons = [
+            make_person("ref-a", "Ref A", "arbitro"),
+            make_person("ref-b", "Ref B", "arbitro"),
+            make_person("ref-c", "Ref C", "arbitro"),
+            make_person("ref-far", "Ref Far", "arbitro", muni_id="muni-002"),
+            make_person("sco-a", "Scorer A", "anotador"),
+            make_person("sco-b", "Scorer B", "anotador"),
+        ]
+        distance_matrix = DistanceMatrix.from_distances([make_distance("muni-001", "muni-002", 50.0)])
+        eligibility = build_eligibility(matches, persons, distance_matrix)
+
+        assert sorted(eligibility.interchangeable_classes(set())) == [[0, 1, 2], [4, 5]]
+        assert sorted(eligibility.interchangeable_classes({1, 5})) == [[0, 2]]
+
+
+class TestDistanceMatrix:
+    """Tabla densa equivalente a la referencia escalar (reference_travel_cost)."""
+
+    def test_matches_scalar_lookup(self):
+        distances = [
+            make_distance(f"muni-{i:03d}", f"muni-{j:03d}", 0.05 * (i * 31 + j * 7) + 0.005)
+            for i in range(12)
+            for j in range(i + 1, 12)
+            if (i + j) % 5
+        ]
+        # Par repetido en sentido inverso: gana la ultima entrada
+        distances.append(make_distance("muni-003", "muni-001", 99.0))
+        dist_lookup = distance_lookup(distances)
+        matrix = DistanceMatrix.from_distances(distances)
+        munis = [f"muni-{i:03d}" for i in range(12)] + ["muni-new", "muni-other"]
+
+        table, origin, dest = matrix.codes(munis, munis)
+        cost, km = table.cost[np.ix_(origin, dest)], table.km[np.ix_(origin, dest)]
+
+        for oi, origin in enumerate(munis):
+            for di, dest in enumerate(munis):
+                assert (cost[oi, di], km[oi, di]) == reference_travel_cost(origin, dest, dist_lookup)
+
+    def test_no_car_cost_scaled(self):
+        matrix = DistanceMatrix.from_distances(
+            [make_distance("muni-001", "muni-002", 10.0), make_distance("muni-001", "muni-003", 40.0)]
+        )
+
+        table, origin, dest = matrix.codes(["muni-001"], ["muni-001", "muni-002", "muni-003", "muni-x"])
+        pairs = np.ix_(origin, dest)
+        scaled, no_car = table.cost_scaled[pairs], table.cost_scaled_no_car[pairs]
+
+        assert scaled.tolist() == [[300, 100, 400, 350]]
+        assert no_car.tolist() == [[300, 100, 800, 700]]
+
+
+class TestOverlapCliques:
+    """Cliques por barrido equivalentes a los pares solapados (<2h, mismo dia)."""
+
+    def test_cliques_cover_exactly_overlapping_pairs(self):
+        matches = make_dense_day(90)
+        cliques = _precompute_overlap_cliques(MatchFeatures.from_matches(matches))
+
+        covered = {
+            (a, b) for clique in cliques for a in clique for b in clique if a < b
+        }
+        expected = {
+            (i, j)
+            for i in range(len(matches))
+            for j in range(i + 1, len(matches))
+            if matches[i].date == matches[j].date
+            and abs(
+                int(matches[i].time.split(":")[0]) - int(matches[j].time.split(":")[0])
+            )
+            < 2
+        }
+        assert covered == expected
+
+    def test_dense_saturday_constraint_count(self):
+        matches = make_dense_day(300)
+        cliques = _precompute_overlap_cliques(MatchFeatures.from_matches(matches))
+
+        pairs = sum(len(c) * (len(c) - 1) // 2 for c in cliques)
+        # 12 horas distintas por dia → como mucho 11 cliques por dia
+        assert len(cliques) <= 22
+        assert pairs > 20 * len(cliques)
+
+        start = time.time()
+        persons = [
+            make_person(f"ref-{i}", f"Ref {i}", "arbitro", muni_id=f"muni-{i % 15:03d}")
+            for i in range(60)
+        ]
+        result = solve(matches, persons, [], default_params(max_time_seconds=5))
+        elapsed = time.time() - start
+
+        # Construccion + 5s de busqueda: el modelo ya no es cuadratico
+        assert elapsed < 15, f"Solver tardo {elapsed:.1f}s (>15s)"
+        assert result.metrics.total_slots == 900
+
+
+class TestDecomposition:
+    """Componentes independientes resueltas en paralelo y fusionadas."""
+
+    def test_split_by_disjoint_days(self):
+        matches, persons = make_two_days()
+        eligibility = build_eligibility(matches, persons, DistanceMatrix.from_distances([]))
+
+        components = split_components(eligibility.mask)
+
+        assert len(components) == 2
+        assert sorted(len(ps) for ps, _ in components) == [3, 3]
+
+    def test_decomposed_matches_global(self):
+        matches, persons = make_two_days()
+        params = default_params(balance_weight=0.0, decompose=True)
+
+        decomposed = solve_decomposed(matches, persons, [], params, max_processes=2)
+        monolithic = solve(matches, persons, [], default_params(balance_weight=0.0))
+
+        assert decomposed.metrics.subproblems == 2
+        assert decomposed.metrics.coverage == monolithic.metrics.coverage == 100.0
+        assert decomposed.metrics.total_cost == monolithic.metrics.total_cost
+
+    def test_balance_falls_back_to_global_model(self):
+        matches, persons = make_two_days()
+
+        result = solve_decomposed(
+            matches, persons, [], default_params(decompose=True), max_processes=2
+        )
+
+        assert result.metrics.subproblems == 1
+        assert result.metrics.coverage == 100.0
+
+
+class TestRouting:
+    """solver_type='auto': estimacion del modelo y eleccion de motor."""
+
+    def test_estimate_counts_model(self):
+        matches, persons = make_two_days()
+        eligibility = build_eligibility(matches, persons, DistanceMatrix.from_distances([]))
+
+        estimate = estimate_model(eligibility)
+
+        # 8 partidos x 3 candidatos; 2 slots y sin solapes (cada 2 horas)
+        assert estimate.pairs == 24
+        assert estimate.variables == 24 + 16 + 6 + 2
+        assert estimate.overlap_constraints == 0
+        assert estimate.constraints == 16 + 2 * 6 + 2
+
+    def test_routes_by_size(self, monkeypatch):
+        import routing
+
+        matches, persons = make_two_days()
+        params = default_params(solver_type="auto", balance_weight=0.0)
+
+        small = solve(matches, persons, [], params, num_workers=2)
+        assert small.metrics.routing.engine == "cpsat"
+        assert small.metrics.solver_type == "cpsat"
+        assert small.metrics.coverage == 100.0
+
+        # Construir el modelo global se come el plazo; cada dia cabe en su proceso
+        literals = estimate_model(
+            build_eligibility(matches, persons, DistanceMatrix.from_distances([]))
+        ).literals
+        monkeypatch.setattr(routing, "BUILD_SECONDS_PER_LITERAL", 8.0 / literals)
+        split = solve(matches, persons, [], params, num_workers=2)
+        assert split.metrics.routing.engine == "decompose"
+        assert split.metrics.subproblems == 2
+        # La descomposicion carga sus fases en el plazo de la peticion
+        assert {"routing", "preprocess", "solve"} <= set(split.metrics.phase_ms)
+
+        monkeypatch.setattr(routing, "MEMORY_BUDGET_MB", 1.0)
+        tiny = solve(matches, persons, [], params, num_workers=2)
+        assert tiny.metrics.routing.engine == "greedy"
+        assert tiny.metrics.routing.predicted_memory_mb > 1.0
+        assert tiny.metrics.solver_type == "greedy"
+
+
+class TestWarmStart:
+    """Hints desde una solucion previa o desde las designaciones."""
+
+    def test_previous_solution_as_hint(self):
+        matches = [
+            make_match(f"m-{i}", time=f"{9 + 2 * i}:00", venue=make_venue(f"muni-{i % 3:03d}"))
+            for i in range(5)
+        ]
+        persons = [
+            make_person(f"ref-{i}", f"Ref {i}", "arbitro", muni_id=f"muni-{i % 3:03d}")
+            for i in range(6)
+        ] + [
+            make_person(f"sco-{i}", f"Scorer {i}", "anotador", muni_id=f"muni-{i % 3:03d}")
+            for i in range(3)
+        ]
+        cold = solve(matches, persons, [], default_params())
+        previous = [
+            PriorAssignment(match_id=a.match_id, person_id=a.person_id)
+            for a in cold.assignments
+        ]
+
+        warm = solve(matches, persons, [], default_params(), hints=previous)
+
+        assert not cold.metrics.warm_start
+        assert warm.metrics.warm_start
+        assert warm.metrics.time_to_first_solution_ms is not None
+        assert warm.metrics.coverage == cold.metrics.coverage
+        assert warm.metrics.total_cost == cold.metrics.total_cost
+
+    def test_designations_are_default_hint(self):
+        designation = Designation(
+            id="d-1", match_id="match-1", person_id="ref-1", role="arbitro", status="pending"
+        )
+        match = make_match(referees_needed=1, scorers_needed=0, designations=[designation])
+        ref = make_person("ref-1", "Ref 1", "arbitro")
+
+        result = solve([match], [ref], [], default_params())
+
+        assert result.metrics.warm_start
+        assert [a.person_id for a in result.assignments] == ["ref-1"]
+
+
+class TestReoptimize:
+    """Re-optimizacion del vecindario tras una baja de ultima hora."""
+
+    def _plan(self):
+        matches = [
+            make_match(f"m-{i}", time=f"{9 + 3 * i}:00", referees_needed=1, scorers_needed=0)
+            for i in range(3)
+        ]
+        persons = [make_person(f"ref-{i}", f"Ref {i}", "arbitro") for i in range(4)]
+        current = [
+            PriorAssignment(match_id=f"m-{i}", person_id=f"ref-{i}") for i in range(3)
+        ]
+        return matches, persons, current
+
+    def test_dropout_replaced_and_rest_frozen(self):
+        matches, persons, current = self._plan()
+        request = ReoptimizationRequest(
+            matches=matches,
+            persons=persons,
+            distances=[],
+            parameters=default_params(),
+            current_assignments=current,
+            delta=ScheduleDelta(removed_person_ids=["ref-1"]),
+            neighbourhood=NeighbourhoodParameters(time_window_hours=0),
+        )
+
+        result = reoptimize(request)
+
+        assert [(a.match_id, a.person_id) for a in result.added] == [("m-1", "ref-3")]
+        assert [(a.match_id, a.person_id) for a in result.removed] == [("m-1", "ref-1")]
+        assert result.frozen_assignments == 2
+        assert result.metrics.coverage == 100.0
+
+    def test_no_candidates_reports_slot(self):
+        matches, persons, current = self._plan()
+        persons = persons[:3]
+        request = ReoptimizationRequest(
+            matches=matches,
+            persons=persons,
+            distances=[],
+            parameters=default_params(max_matches_per_person=1),
+            current_assignments=current,
+            delta=ScheduleDelta(removed_person_ids=["ref-2"]),
+            neighbourhood=NeighbourhoodParameters(time_window_hours=0),
+        )
+
+        result = reoptimize(request)
+
+        assert result.added == []
+        assert [u.match_id for u in result.unassigned] == ["m-2"]
+
+    def test_added_person_fills_open_slot(self):
+        matches = [make_match("m-0", referees_needed=2, scorers_needed=0)]
+        persons = [make_person(f"ref-{i}", f"Ref {i}", "arbitro") for i in range(2)]
+        request = ReoptimizationRequest(
+            matches=matches,
+            persons=persons,
+            distances=[],
+            parameters=default_params(),
+            current_assignments=[PriorAssignment(match_id="m-0", person_id="ref-0")],
+            delta=ScheduleDelta(added_person_ids=["ref-1"]),
+        )
+
+        result = reoptimize(request)
+
+        assert [(a.match_id, a.person_id) for a in result.added] == [("m-0", "ref-1")]
+        assert result.unassigned == []
+        assert result.metrics.coverage == 100.0
+
+        # Sin altas el hueco no se re-optimiza pero se sigue informando
+        request = request.model_copy(update={"delta": ScheduleDelta()})
+        result = reoptimize(request)
+
+        assert result.added == []
+        assert [u.reason for u in result.unassigned] == ["Sin cubrir en el plan actual"]
+        assert result.metrics.coverage == 50.0
+
+
+class TestSolutionStream:
+    """Cada solucion intermedia trae el diff respecto a la anterior."""
+
+    def test_diffs_replay_to_final_solution(self):
+        matches = [
+            make_match(f"m-{i}", time=f"{9 + 2 * i}:00", venue=make_venue(f"muni-{i % 4:03d}"))
+            for i in range(6)
+        ]
+        persons = [
+            make_person(f"ref-{i}", f"Ref {i}", "arbitro", muni_id=f"muni-{i % 4:03d}")
+            for i in range(8)
+        ] + [
+            make_person(f"sco-{i}", f"Scorer {i}", "anotador", muni_id=f"muni-{i % 4:03d}")
+            for i in range(4)
+        ]
+        distances = [
+            make_distance(f"muni-{i:03d}", f"muni-{j:03d}", 10.0 * (i + j))
+            for i in range(4)
+            for j in range(i + 1, 4)
+        ]
+        events = []
+
+        result = solve(matches, persons, distances, default_params(), on_solution=events.append)
+
+        assert events
+        replayed: set[tuple[str, str]] = set()
+        for event in events:
+            replayed -= {(a.person_id, a.match_id) for a in event.removed}
+            replayed |= {(a.person_id, a.match_id) for a in event.added}
+        assert replayed == {(a.person_id, a.match_id) for a in result.assignments}
+        assert events[-1].total_cost == result.metrics.total_cost
+        assert events[-1].coverage == result.metrics.coverage
+
+
+class TestCancellation:
+    """Un token de cancelacion activo detiene CP-SAT y el greedy."""
+
+    def test_cancelled_before_start(self):
+        matches, persons = make_dense_instance()
+        cancel = threading.Event()
+        cancel.set()
+
+        for solver_type in ("cpsat", "greedy"):
+            result = solve(matches, persons, [], default_params(solver_type=solver_type), cancel=cancel)
+            assert result.status == "cancelled"
+            assert result.metrics.covered_slots == 0
+
+        greedy = solve(matches, persons, [], default_params(solver_type="greedy"), cancel=cancel)
+        assert {u.reason for u in greedy.unassigned} == {"Optimizacion cancelada"}
+
+    def test_stop_search_mid_flight(self):
+        matches, persons = make_dense_instance(300)
+        cancel = threading.Event()
+        threading.Timer(2.0, cancel.set).start()
+
+        start = time.time()
+        result = solve(matches, persons, [], default_params(max_time_seconds=60), cancel=cancel)
+        elapsed = time.time() - start
+
+        assert result.status == "cancelled"
+        assert elapsed < 10, f"La cancelacion tardo {elapsed:.1f}s"
+
+
+class TestDeadline:
+    """Plazo extremo a extremo: fases, tiempo total y degradacion al greedy."""
+
+    def test_phases_within_deadline(self):
+        matches, persons = make_dense_instance(300)
+
+        start = time.time()
+        result = solve(matches, persons, [], default_params(max_time_seconds=2))
+        elapsed = time.time() - start
+
+        assert elapsed < 2.5, f"El solve tardo {elapsed:.1f}s con plazo de 2s"
+        phases = result.metrics.phase_ms
+        assert {"preprocess", "build", "solve"} <= set(phases)
+        assert sum(phases.values()) <= result.metrics.resolution_time_ms + 5
+        greedy = solve(matches, persons, [], default_params(solver_type="greedy"))
+        assert result.metrics.covered_slots >= greedy.metrics.covered_slots
+
+    def test_no_time_to_build_falls_back_to_greedy(self, monkeypatch):
+        import routing
+
+        monkeypatch.setattr(routing, "BUILD_SECONDS_PER_LITERAL", 1.0)
+        matches, persons = make_dense_instance()
+
+        result = solve(matches, persons, [], default_params())
+
+        assert result.metrics.solver_type == "greedy"
+        assert result.metrics.degraded.startswith("Construir el modelo")
+        assert "build" not in result.metrics.phase_ms
+        assert result.metrics.phase_ms.keys() >= {"preprocess", "fallback"}
+        assert result.metrics.covered_slots > 0
+
+    def test_expired_greedy_leaves_slots_open(self):
+        matches, persons = make_dense_instance()
+        params = default_params(solver_type="greedy")
+
+        result = solve(matches, persons, [], params, deadline=Deadline(time.time() - 1))
+
+        assert result.metrics.covered_slots == 0
+        assert result.metrics.degraded is not None
+        assert {u.reason for u in result.unassigned} == {"Plazo agotado"}
+
+    def test_search_timeout_returns_greedy_floor(self, monkeypatch):
+        import solver
+
+        # El modelo cabe y se construye, pero la busqueda apenas tiene tiempo
+        monkeypatch.setattr(solver, "MIN_SEARCH_SECONDS", 0.01)
+        matches, persons, distances = make_mixed_instance(200, 400)
+        greedy = solve(matches, persons, distances, default_params(solver_type="greedy"))
+
+        start = time.time()
+        result = solve(matches, persons, distances, default_params(), deadline=Deadline.after(1.5))
+        elapsed = time.time() - start
+
+        assert elapsed < 2.5
+        assert "build" in result.metrics.phase_ms
+        assert result.metrics.covered_slots >= greedy.metrics.covered_slots > 0
+
+    def test_expired_flow_and_fallback_respect_deadline(self):
+        matches, persons = make_dense_instance()
+
+        for solver_type in ("flow", "cpsat"):  # cpsat: degrada al greedy
+            params = default_params(solver_type=solver_type)
+            result = solve(matches, persons, [], params, deadline=Deadline(time.time() - 1))
+
+            assert result.metrics.covered_slots == 0, solver_type
+            assert result.metrics.degraded is not None
+            assert {u.reason for u in result.unassigned} == {"Plazo agotado"}
+
+
+class TestEarlyStop:
+    """Parada temprana de CP-SAT por gap relativo y por estancamiento."""
+
+    def test_relative_gap(self):
+        assert relative_gap(100, 90) == pytest.approx(0.1)
+        assert relative_gap(0.5, 0) == pytest.approx(0.5)  # denominador minimo 1
+        assert relative_gap(100, 100) == 0
+
+    def test_tracker_stops_within_gap_tolerance(self):
+        from ortools.sat.python import cp_model
+
+        stops: list[bool] = []
+        tracker = _SolutionTracker(
+            time.time(), cp_model.CpSolver(), relative_gap_tolerance=0.05
+        )
+
+        tracker._check_gap(100, 90, lambda: stops.append(True))
+        assert not stops and tracker.early_stop is None
+        tracker._check_gap(100, 96, lambda: stops.append(True))
+        assert stops and tracker.early_stop == "gap"
+
+    def test_tracker_stagnation_resets_per_stage(self):
+        from ortools.sat.python import cp_model
+
+        tracker = _SolutionTracker(
+            time.time(), cp_model.CpSolver(), no_improvement_seconds=1
+        )
+        assert not tracker.stagnant()  # sin solucion no hay estancamiento
+        tracker.improved_at = time.time() - 2
+        assert tracker.stagnant()
+        tracker.new_stage()
+        assert not tracker.stagnant()
+
+    def test_early_stop_is_opt_in(self):
+        params = default_params()
+
+        assert params.relative_gap_tolerance == 0.0
+        assert params.no_improvement_seconds is None
+
+    def test_stagnation_stops_hinted_search(self):
+        matches, persons = make_dense_instance(200)
+        greedy = solve(matches, persons, [], default_params(solver_type="greedy"))
+        hints = [
+            PriorAssignment(match_id=a.match_id, person_id=a.person_id)
+            for a in greedy.assignments
+        ]
+        params = default_params(max_time_seconds=20, no_improvement_seconds=1)
+
+        start = time.time()
+        result = solve(matches, persons, [], params, hints=hints)
+        elapsed = time.time() - start
+
+        assert elapsed < 12, f"El solve tardo {elapsed:.1f}s con ventana de 1s"
+        assert result.metrics.early_stop == "stagnation" or result.status == "optimal"
+        assert result.metrics.covered_slots >= greedy.metrics.covered_slots
+
+
+class TestLexicographic:
+    """Objetivo por etapas: cobertura, coste con cobertura fija, equilibrio."""
+
+    def test_stages_match_weighted_solution(self):
+        matches = [
+            make_match(f"m-{i}", time=f"{9 + 2 * (i % 5)}:00", venue=make_venue(f"muni-{i % 4:03d}"))
+            for i in range(10)
+        ]
+        persons = [
+            make_person(f"ref-{i}", f"Ref {i}", "arbitro", muni_id=f"muni-{i % 4:03d}")
+            for i in range(6)
+        ] + [
+            make_person(f"sco-{i}", f"Scorer {i}", "anotador", muni_id=f"muni-{i % 4:03d}")
+            for i in range(3)
+        ]
+        distances = [
+            make_distance(f"muni-{i:03d}", f"muni-{j:03d}", 10.0 * (i + j))
+            for i in range(4)
+            for j in range(i + 1, 4)
+        ]
+
+        weighted = solve(matches, persons, distances, default_params())
+        staged = solve(matches, persons, distances, default_params(objective_mode="lexicographic"))
+
+        assert [s.name for s in weighted.metrics.stages] == ["weighted"]
+        assert [s.name for s in staged.metrics.stages] == ["coverage", "cost", "balance"]
+        assert staged.status == "optimal"
+        assert all(s.proven_optimal for s in staged.metrics.stages)
+        coverage_stage = staged.metrics.stages[0]
+        assert coverage_stage.objective == staged.metrics.total_slots - staged.metrics.covered_slots
+        assert staged.metrics.covered_slots == weighted.metrics.covered_slots
+        # El coste es optimo dada la cobertura; el ponderado puede sacrificarlo por equilibrio
+        assert staged.metrics.total_cost <= weighted.metrics.total_cost
+
+    def test_zero_weight_stages_skipped(self):
+        matches = [make_match("m-1", referees_needed=1, scorers_needed=0)]
+        persons = [make_person("ref-1", "Ref 1", "arbitro")]
+
+        result = solve(
+            matches,
+            persons,
+            [],
+            default_params(objective_mode="lexicographic", balance_weight=0),
+        )
+
+        assert [s.name for s in result.metrics.stages] == ["coverage", "cost"]
+        assert result.metrics.coverage == 100.0
+
+
+class TestSymmetryBreaking:
+    """Ordenar cargas de personas intercambiables no cambia el optimo."""
+
+    def test_same_optimum_with_ordered_loads(self):
+        matches = [
+            make_match(f"m-{i}", time=f"{9 + (i % 6) * 2}:00", venue=make_venue(f"muni-{i % 2:03d}"))
+            for i in range(12)
+        ]
+        persons = [
+            make_person(f"ref-{i}", f"Ref {i}", "arbitro", muni_id=f"muni-{i % 2:03d}")
+            for i in range(10)
+        ] + [
+            make_person(f"sco-{i}", f"Scorer {i}", "anotador", muni_id=f"muni-{i % 2:03d}")
+            for i in range(6)
+        ]
+        distances = [make_distance("muni-000", "muni-001", 25.0)]
+        designated = make_match(
+            "m-designated",
+            time="20:00",
+            designations=[
+                Designation(
+                    id="d-1", match_id="m-designated", person_id="ref-0", role="arbitro", status="confirmed"
+                )
+            ],
+        )
+
+        result = solve(matches + [designated], persons, distances, default_params(force_existing=True))
+
+        # ref-0 queda fuera por su designacion: 4 + 5 arbitros y 3 + 3 anotadores
+        assert result.metrics.interchangeable_persons == 15
+        assert result.status == "optimal"
+        assert result.metrics.coverage == 100.0
+        loads = {}
+        for a in result.assignments:
+            loads[a.person_id] = loads.get(a.person_id, 0) + 1
+        assert max(loads.values()) - min(loads.values()) <= 1
+